@@ -0,0 +1,53 @@
+"""
+Helpers shared by the unit tests: the modules in src are imported as top level modules, like donation_analytics.py does.
+"""
+
+import os
+import subprocess
+import sys
+
+# Directory of the modules under test.
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src')
+
+# Directory of the end-to-end tests.
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+
+if SOURCE_DIR not in sys.path:
+    sys.path.insert(0, SOURCE_DIR)
+
+
+def record_line(cmte_id, name, zipcode, date, amount, other_id=''):
+    """ Return a line of input data in the format of the FEC individual contributions file. """
+    return u'%s|N|M2|P|201702039042410894|15|IND|%s|CITY|ST|%s|EMPLOYER|OCCUPATION|%s|%s|%s|PR2283873845050|1147350|||4020820171370029337\n' % (
+        cmte_id, name, zipcode, date, amount, other_id)
+
+
+def write_input(directory, lines, percentiles='30\n'):
+    """ Write itcont.txt and percentile.txt into a directory.
+    Returns:
+      (path of itcont.txt, path of percentile.txt)
+    """
+    data_path = os.path.join(directory, 'itcont.txt')
+    percentile_path = os.path.join(directory, 'percentile.txt')
+    with open(data_path, 'wb') as data_file:
+        data_file.write(u''.join(lines).encode('utf-8'))
+    with open(percentile_path, 'w') as percentile_file:
+        percentile_file.write(percentiles)
+    return data_path, percentile_path
+
+
+def run_program(arguments, stdin=None):
+    """ Run donation_analytics.py with arguments in a new process.
+    Returns:
+      (exit status, standard output as bytes)
+    """
+    process = subprocess.Popen([sys.executable, 'donation_analytics.py'] + arguments, cwd=SOURCE_DIR,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output, _ = process.communicate(stdin)
+    return process.returncode, output
+
+
+def read_output(path):
+    """ Return the content of an output file as text. """
+    with open(path, 'rb') as output_file:
+        return output_file.read().decode('utf-8')
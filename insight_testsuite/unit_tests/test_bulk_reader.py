@@ -0,0 +1,111 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401, puts src on sys.path
+import bulk_reader as BulkReader
+
+
+def collect(batches):
+    """ Return the lines of batches given by iter_line_batches(), checking that offsets follow each other. """
+    lines = []
+    expected_offset = None
+    for offset, batch_lines in batches:
+        if expected_offset is not None:
+            assert offset == expected_offset, (offset, expected_offset)
+        lines.extend((offset + sum(len(line) + 1 for line in batch_lines[:i]), line) for i, line in enumerate(batch_lines))
+        expected_offset = offset + sum(len(line) + 1 for line in batch_lines)
+    return lines
+
+
+class BulkReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mmap = mmap.mmap
+
+    def tearDown(self):
+        mmap.mmap = self.mmap
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        path = os.path.join(self.directory, 'itcont.txt')
+        with open(path, 'wb') as data_file:
+            data_file.write(data)
+        return path
+
+    def expected(self, data, start=0, end=None):
+        """ (offset, line) of the lines of data[start:end]. """
+        data = data[start:end]
+        if data.endswith(b'\n'):
+            data = data[:-1]
+        lines = []
+        offset = start
+        for line in data.split(b'\n') if data else []:
+            lines.append((offset, line))
+            offset += len(line) + 1
+        return lines
+
+    def check_both_readers(self, data, block_size, start=0, end=None):
+        path = self.write(data)
+        mapped = collect(BulkReader.iter_line_batches(path, start, end, block_size))
+        # Files which can not be mapped are read in blocks.
+        def unmappable(*args, **kwargs):
+            raise ValueError('can not map')
+        mmap.mmap = unmappable
+        try:
+            read = collect(BulkReader.iter_line_batches(path, start, end, block_size))
+        finally:
+            mmap.mmap = self.mmap
+        self.assertEqual(mapped, self.expected(data, start, end))
+        self.assertEqual(read, mapped)
+
+    def test_small_blocks(self):
+        data = b''.join(b'line %d|%s\n' % (i, b'x' * (i % 13)) for i in range(500))
+        for block_size in (1, 7, 64, 4096, 1 << 20):
+            self.check_both_readers(data, block_size)
+
+    def test_no_final_line_terminator(self):
+        data = b'a|b|c\nd|e|f\nlast|line'
+        for block_size in (3, 5, 1024):
+            self.check_both_readers(data, block_size)
+
+    def test_lines_longer_than_blocks(self):
+        data = b'short\n' + b'y' * 1000 + b'\nend\n'
+        self.check_both_readers(data, 16)
+
+    def test_empty_lines(self):
+        self.check_both_readers(b'\n\na\n\n', 2)
+
+    def test_empty_file(self):
+        path = self.write(b'')
+        self.assertEqual(list(BulkReader.iter_line_batches(path)), [])
+
+    def test_complete_size(self):
+        for data, size in ((b'a|b\nc|d\n', 8), (b'a|b\nc|d\ne|', 8), (b'a|b\n' + b'x' * 100, 4), (b'no terminator', 0), (b'', 0)):
+            path = self.write(data)
+            for block_size in (1, 3, 1024):
+                self.assertEqual(BulkReader.get_complete_size(path, block_size), size)
+
+    def test_chunks(self):
+        data = b''.join(b'record %d\n' % i for i in range(1000))
+        path = self.write(data)
+        for count in (1, 3, 8, 5000):
+            chunks = BulkReader.get_chunks(path, count)
+            self.assertLessEqual(len(chunks), max(count, 1))
+            self.assertEqual(chunks[0][0], 0)
+            self.assertEqual(chunks[-1][1], len(data))
+            lines = []
+            for (start, end), following in zip(chunks, chunks[1:] + [(len(data), None)]):
+                self.assertEqual(end, following[0])
+                # Chunks end at line boundaries.
+                self.assertEqual(data[end - 1:end], b'\n')
+                self.check_both_readers(data, 100, start, end)
+                lines.extend(collect(BulkReader.iter_line_batches(path, start, end, 100)))
+            self.assertEqual(lines, self.expected(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import record_line, run_program, read_output
+import checkpoint as Checkpoint
+from key_encoder import KeyEncoder, donor_key, contribution_key
+from percentile import percentiletracker
+import synthetic_data as SyntheticData
+
+
+class SaveLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build_state(self):
+        key_encoder = KeyEncoder()
+        donation_date = {}
+        contribution_info = {}
+        for index in range(300):
+            cmte_id = b'C%08d' % (index % 7)
+            zipcode = b'%05d' % (index % 11)
+            donation_date[donor_key(b'DONOR, %d' % index, zipcode)] = 2015 + index % 4
+            key = contribution_key(key_encoder.cmte_ids[cmte_id], key_encoder.zipcodes[zipcode], 2017 + index % 2)
+            if key not in contribution_info:
+                contribution_info[key] = {"total_amt": 0, "transactions": percentiletracker(30)}
+            contribution_info[key]["total_amt"] += index
+            contribution_info[key]["transactions"].append(index % 13)
+        return key_encoder, donation_date, contribution_info
+
+    def test_round_trip(self):
+        key_encoder, donation_date, contribution_info = self.build_state()
+        # Donor keys are signed 64-bit digests, both signs have to survive.
+        self.assertTrue(min(donation_date) < 0 < max(donation_date))
+        Checkpoint.save(self.path, 30, 12345, key_encoder, donation_date, contribution_info)
+        self.assertEqual(os.listdir(self.directory), ['state.ckpt'])
+
+        loaded_encoder = KeyEncoder()
+        offset, loaded_dates, loaded_info = Checkpoint.load(self.path, loaded_encoder, 30)
+        self.assertEqual(offset, 12345)
+        self.assertEqual(loaded_dates, donation_date)
+        # IDs are given back in the same order, so contribution keys stay valid.
+        self.assertEqual(dict(loaded_encoder.cmte_ids), dict(key_encoder.cmte_ids))
+        self.assertEqual(dict(loaded_encoder.zipcodes), dict(key_encoder.zipcodes))
+        self.assertEqual(sorted(loaded_info), sorted(contribution_info))
+        for key, contribution in contribution_info.items():
+            loaded = loaded_info[key]
+            self.assertEqual(loaded["total_amt"], contribution["total_amt"])
+            self.assertEqual(list(loaded["transactions"].transactions), list(contribution["transactions"].transactions))
+            self.assertEqual(loaded["transactions"].value, contribution["transactions"].value)
+            # Restored trackers keep following new amounts.
+            loaded["transactions"].append(1000)
+            contribution["transactions"].append(1000)
+            self.assertEqual(loaded["transactions"].value, contribution["transactions"].value)
+
+    def test_text_fields(self):
+        key_encoder, donation_date, contribution_info = self.build_state()
+        Checkpoint.save(self.path, 30, 0, key_encoder, donation_date, contribution_info)
+        loaded_encoder = KeyEncoder()
+        Checkpoint.load(self.path, loaded_encoder, 30, text_fields=True)
+        self.assertEqual(loaded_encoder.cmte_ids[u'C00000003'], key_encoder.cmte_ids[b'C00000003'])
+
+    def test_percentile_mismatch(self):
+        key_encoder, donation_date, contribution_info = self.build_state()
+        Checkpoint.save(self.path, 30, 0, key_encoder, donation_date, contribution_info)
+        self.assertRaises(ValueError, Checkpoint.load, self.path, KeyEncoder(), 50)
+
+    def test_not_a_checkpoint(self):
+        with open(self.path, 'wb') as checkpoint_file:
+            checkpoint_file.write(b'\0' * 64)
+        self.assertRaises(ValueError, Checkpoint.load, self.path, KeyEncoder(), 30)
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 6000, donors=800, committees=10, zipcodes=30)
+        with open(self.data_path, 'rb') as data_file:
+            self.lines = data_file.readlines()
+        self.percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(self.percentile_path, 'w') as percentile_file:
+            percentile_file.write('30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_on(self, data_path, output_path, arguments):
+        status, _ = run_program(['-d', data_path, '-p', self.percentile_path, '-o', output_path] + arguments)
+        self.assertEqual(status, 0)
+
+    def check_resume(self, arguments):
+        expected_path = os.path.join(self.directory, 'expected.txt')
+        self.run_on(self.data_path, expected_path, ['-m', 'single'] + arguments)
+        expected = read_output(expected_path)
+        self.assertTrue(expected)
+
+        # The input grows between runs, like the incremental updates of itcont.txt.
+        growing_path = os.path.join(self.directory, 'growing.txt')
+        output_path = os.path.join(self.directory, 'resumed.txt')
+        checkpoint_path = os.path.join(self.directory, 'state.ckpt')
+        for end in (len(self.lines) // 3, 2 * len(self.lines) // 3, len(self.lines)):
+            with open(growing_path, 'wb') as growing_file:
+                growing_file.writelines(self.lines[:end])
+            self.run_on(growing_path, output_path, ['-m', 'single', '-c', checkpoint_path] + arguments)
+        self.assertEqual(read_output(output_path), expected)
+
+    def test_resume_fast_parser(self):
+        self.check_resume([])
+
+    def test_resume_strict_parser(self):
+        self.check_resume(['-P', 'strict'])
+
+    def test_resume_donor_index(self):
+        self.check_resume(['-D'])
+
+    def test_resume_memory_budget(self):
+        self.check_resume(['-M', '1'])
+
+    def test_partial_last_line(self):
+        # The feed is appended to while it is read: the second line is cut in its amount.
+        first = record_line('C1', 'DONOR, A', '90210', '01012017', '50').encode('utf-8')
+        second = record_line('C1', 'DONOR, A', '90210', '01012018', '100').encode('utf-8')
+        cut = second.index(b'|01012018|1') + len(b'|01012018|1')
+        output_path = os.path.join(self.directory, 'resumed.txt')
+        checkpoint_path = os.path.join(self.directory, 'state.ckpt')
+        with open(self.data_path, 'wb') as data_file:
+            data_file.write(first + second[:cut])
+        self.run_on(self.data_path, output_path, ['-c', checkpoint_path])
+        self.assertEqual(read_output(output_path), '')
+        with open(self.data_path, 'ab') as data_file:
+            data_file.write(second[cut:])
+        self.run_on(self.data_path, output_path, ['-c', checkpoint_path])
+        self.assertEqual(read_output(output_path), 'C1|90210|2018|100|100|1\n')
+
+    def test_resume_within_lines(self):
+        expected_path = os.path.join(self.directory, 'expected.txt')
+        self.run_on(self.data_path, expected_path, [])
+        with open(self.data_path, 'rb') as data_file:
+            data = data_file.read()
+        growing_path = os.path.join(self.directory, 'growing.txt')
+        output_path = os.path.join(self.directory, 'resumed.txt')
+        checkpoint_path = os.path.join(self.directory, 'state.ckpt')
+        # Runs start while lines are half written.
+        for end in (len(data) // 3 + 17, len(data) // 2 + 5, len(data) - 3, len(data)):
+            with open(growing_path, 'wb') as growing_file:
+                growing_file.write(data[:end])
+            self.run_on(growing_path, output_path, ['-m', 'multi', '-c', checkpoint_path])
+        self.assertEqual(read_output(output_path), read_output(expected_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import record_line, write_input, run_program, read_output
+import bulk_reader as BulkReader
+import columnar_cache as ColumnarCache
+import donation_analytics as DonationAnalytics
+from distilled_data import DistilledBatch
+from key_encoder import KeyEncoder
+
+# 40 donors giving once a year.
+LINES = [record_line('C%08d' % (index % 5), 'DONOR, %d' % (index % 40), '%05d' % (index % 8), '0101%d' % (2015 + index // 40 % 4),
+                     str(10 + index % 90)) for index in range(500)]
+
+
+class ColumnarCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path, self.percentile_path = write_input(self.directory, LINES)
+        self.cache_path = ColumnarCache.get_cache_path(self.data_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, parser_name='fast'):
+        ColumnarCache.build(self.data_path, self.cache_path, DonationAnalytics.PARSERS[parser_name], parser_name)
+
+    def parsed_records(self):
+        key_encoder = KeyEncoder()
+        records = []
+        for offset, lines in BulkReader.iter_line_batches(self.data_path):
+            batch = DistilledBatch(key_encoder)
+            DonationAnalytics.parse_lines_fast(offset, lines, batch)
+            records.extend(zip(batch.offsets, batch.records()))
+        return key_encoder, records
+
+    def test_same_records_as_parser(self):
+        self.build()
+        # Temporary column files are removed.
+        self.assertEqual(sorted(os.listdir(self.directory)), ['itcont.txt', 'itcont.txt.dacache', 'percentile.txt'])
+        cache = ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast')
+        self.assertIsNotNone(cache)
+        try:
+            self.assertEqual((cache.lines, cache.records), (len(LINES), len(LINES)))
+            key_encoder = KeyEncoder()
+            cache.load_fields(key_encoder)
+            records = []
+            for batch in cache.iter_batches(key_encoder, 64):
+                self.assertTrue(len(batch) <= 64)
+                records.extend(zip(batch.offsets, batch.records()))
+        finally:
+            cache.close()
+        parsed_encoder, parsed = self.parsed_records()
+        self.assertEqual(records, parsed)
+        self.assertEqual(key_encoder.cmte_ids.fields, parsed_encoder.cmte_ids.fields)
+        self.assertEqual(key_encoder.zipcodes.fields, parsed_encoder.zipcodes.fields)
+
+    def test_missing_or_other_parser(self):
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+        self.build()
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'strict'))
+
+    def test_invalidated_by_appended_lines(self):
+        self.build()
+        with open(self.data_path, 'ab') as data_file:
+            data_file.write(LINES[0].encode('utf-8'))
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+
+    def test_invalidated_by_same_size_and_mtime(self):
+        # A whole number of seconds, which every platform sets exactly.
+        os.utime(self.data_path, (1500000000, 1500000000))
+        self.build()
+        stat = os.stat(self.data_path)
+        with open(self.data_path, 'r+b') as data_file:
+            data_file.write(b'C99999999')
+        # Size and mtime are the same, only the digest tells the content has changed.
+        os.utime(self.data_path, (1500000000, 1500000000))
+        self.assertEqual(ColumnarCache.input_key(self.data_path)[:2], (stat.st_size, stat.st_mtime))
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+
+    def test_invalidated_by_mtime(self):
+        self.build()
+        stat = os.stat(self.data_path)
+        os.utime(self.data_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+
+    def test_not_a_cache(self):
+        with open(self.cache_path, 'wb') as cache_file:
+            cache_file.write(b'\0' * (ColumnarCache.HEADER.size + 16))
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+        with open(self.cache_path, 'wb') as cache_file:
+            cache_file.write(b'DACC')
+        self.assertIsNone(ColumnarCache.ColumnarCache.open(self.data_path, self.cache_path, 'fast'))
+
+    def test_rerun_after_change(self):
+        def run(name, arguments):
+            output_path = os.path.join(self.directory, name)
+            status, _ = run_program(['-d', self.data_path, '-p', self.percentile_path, '-o', output_path] + arguments)
+            self.assertEqual(status, 0)
+            return read_output(output_path)
+
+        expected = run('parsed.txt', [])
+        self.assertTrue(expected)
+        self.assertEqual(run('built.txt', ['-k']), expected)
+        self.assertEqual(run('cached.txt', ['-k']), expected)
+        # The cache is rewritten once the input file has changed.
+        with open(self.data_path, 'ab') as data_file:
+            data_file.write(record_line('C00000000', 'DONOR, 0', '00000', '01012020', '1000').encode('utf-8'))
+        expected = run('parsed_2.txt', [])
+        self.assertEqual(run('rebuilt.txt', ['-k']), expected)
+        self.assertTrue(expected.endswith('C00000000|00000|2020|1000|1000|1\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import random
+import unittest
+
+import support  # noqa: F401, puts src on sys.path
+from countedlist import countedlist
+
+
+class CountedListTest(unittest.TestCase):
+
+    def check(self, counted, expected):
+        """ Compare a countedlist with the sorted list of its elements, by rank and by Fenwick index. """
+        expected = sorted(expected)
+        self.assertEqual(len(counted), len(expected))
+        self.assertEqual(list(counted), expected)
+        for rank, val in enumerate(expected):
+            self.assertEqual(counted[rank], val)
+        # Every node of the Fenwick tree holds the sum of the block sizes it covers.
+        sizes = [sum(counts) for counts in counted.counts]
+        for i in range(1, len(sizes) + 1):
+            self.assertEqual(counted.index[i - 1], sum(sizes[i - (i & -i):i]))
+
+    def test_empty(self):
+        counted = countedlist()
+        self.assertEqual(len(counted), 0)
+        self.assertRaises(IndexError, counted.__getitem__, 0)
+        self.assertIsNone(counted.min())
+        self.assertIsNone(counted.max())
+        self.assertIsNone(counted.lower(1))
+        self.assertIsNone(counted.higher(1))
+        self.assertEqual(counted.count(1), 0)
+
+    def test_repeated_values_are_counted(self):
+        counted = countedlist([100, 250, 100, 100, 5])
+        self.assertEqual(counted.distinct(), 3)
+        self.assertEqual(counted.count(100), 3)
+        self.assertEqual(list(counted.items()), [(5, 1), (100, 3), (250, 1)])
+        self.check(counted, [100, 250, 100, 100, 5])
+
+    def test_rank_and_select_across_blocks(self):
+        generator = random.Random(7)
+        values = [float(generator.randint(0, 2000)) for _ in range(5000)]
+        counted = countedlist()
+        for i, val in enumerate(values):
+            counted.append(val)
+            if i % 997 == 0:
+                self.check(counted, values[:i + 1])
+        self.assertGreater(len(counted.values), 1)
+        self.check(counted, values)
+        self.assertRaises(IndexError, counted.__getitem__, len(values))
+
+    def test_blocks_are_split(self):
+        counted = countedlist(range(10 * countedlist.BLOCK_LOAD))
+        self.assertTrue(all(len(values) <= 2 * countedlist.BLOCK_LOAD for values in counted.values))
+        self.assertEqual(list(counted.maxes), [values[-1] for values in counted.values])
+        self.check(counted, range(10 * countedlist.BLOCK_LOAD))
+
+    def test_neighbours(self):
+        counted = countedlist(float(val) for val in range(0, 1000, 10))
+        self.assertEqual(counted.lower(500), (490, 1))
+        self.assertEqual(counted.lower(505), (500, 1))
+        self.assertEqual(counted.higher(500), (510, 1))
+        self.assertIsNone(counted.lower(0))
+        self.assertIsNone(counted.higher(990))
+        self.assertEqual((counted.min(), counted.max()), (0, 990))
+
+    def test_fromitems(self):
+        values = [float(val) for val in range(300)]
+        counts = [val % 3 + 1 for val in range(300)]
+        counted = countedlist.fromitems(values, counts)
+        self.assertEqual(list(counted.items()), list(zip(values, counts)))
+        self.check(counted, [val for val, count in zip(values, counts) for _ in range(count)])
+        counted.append(150.5)
+        self.assertEqual(counted.count(150.5), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
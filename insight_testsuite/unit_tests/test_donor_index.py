@@ -0,0 +1,60 @@
+from array import array
+import random
+import unittest
+
+import support  # noqa: F401, puts src on sys.path
+from donor_index import DonorIndex
+from key_encoder import donor_key, INT64
+
+
+def repeat_flags(donation_date, donors, years):
+    """ The repeat donor rule applied with a dictionary, like Engine does without an index. """
+    flags = bytearray(len(years))
+    for index, (key, year) in enumerate(zip(donors, years)):
+        if key not in donation_date or donation_date[key] >= year:
+            donation_date[key] = year
+        else:
+            flags[index] = 1
+    return flags
+
+
+class DonorIndexTest(unittest.TestCase):
+
+    def test_same_as_dictionary(self):
+        generator = random.Random(1)
+        keys = [donor_key(b'DONOR, %d' % number, b'%05d' % (number % 100)) for number in range(20000)]
+        index = DonorIndex(partitions=16)
+        donation_date = {}
+        for _ in range(20):
+            donors = array(INT64, [generator.choice(keys) for _ in range(3000)])
+            years = array('l', [generator.randint(2010, 2018) for _ in range(3000)])
+            self.assertEqual(index.check_batch(donors, years), repeat_flags(donation_date, donors, years))
+        # Partitions have been merged into their sorted layers many times.
+        self.assertTrue(all(len(keys) for keys in index.keys))
+        self.assertEqual(len(index), len(donation_date))
+        self.assertEqual(dict(index.items()), donation_date)
+        for key in keys[:1000]:
+            self.assertEqual(index.get(key), donation_date.get(key))
+            self.assertEqual(key in index, key in donation_date)
+
+    def test_extreme_keys(self):
+        index = DonorIndex(partitions=4)
+        donors = array(INT64, [-2 ** 63, 2 ** 63 - 1, 0, -1] * 2)
+        years = array('l', [2017] * 4 + [2018] * 4)
+        self.assertEqual(list(index.check_batch(donors, years)), [0] * 4 + [1] * 4)
+        self.assertEqual(index[-2 ** 63], 2017)
+        self.assertRaises(KeyError, index.__getitem__, 1)
+
+    def test_update(self):
+        donation_date = dict((donor_key(b'DONOR, %d' % number, b'02895'), 2010 + number % 9) for number in range(5000))
+        index = DonorIndex(partitions=8)
+        index.update(donation_date)
+        # Restored donors are all merged into the sorted layers.
+        self.assertFalse(any(index.recent))
+        self.assertEqual(dict(index.items()), donation_date)
+        index[next(iter(donation_date))] = 2000
+        self.assertEqual(len(index), len(donation_date))
+
+
+if __name__ == '__main__':
+    unittest.main()
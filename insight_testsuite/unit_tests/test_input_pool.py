@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import run_program, read_output
+import bulk_reader as BulkReader
+import donation_analytics as DonationAnalytics
+import input_pool as InputPool
+from distilled_data import DistilledBatch
+from key_encoder import KeyEncoder
+import synthetic_data as SyntheticData
+
+
+class InputPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 20000, donors=3000, committees=20, zipcodes=50)
+        with open(self.data_path, 'rb') as data_file:
+            self.lines = data_file.readlines()
+        self.percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(self.percentile_path, 'w') as percentile_file:
+            percentile_file.write('30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def split(self, ends, names=('part_1.txt', 'part_2.txt', 'part_3.txt')):
+        """ Split the input file into files holding lines up to each end, and return their paths. """
+        paths = []
+        start = 0
+        for name, end in zip(names, ends + [len(self.lines)]):
+            path = os.path.join(self.directory, name)
+            with open(path, 'wb') as part_file:
+                part_file.writelines(self.lines[start:end])
+            paths.append(path)
+            start = end
+        return paths
+
+    def run_on(self, name, inputs, arguments):
+        output_path = os.path.join(self.directory, name)
+        status, _ = run_program(['-d'] + inputs + ['-p', self.percentile_path, '-o', output_path] + arguments)
+        self.assertEqual(status, 0)
+        return read_output(output_path)
+
+    def test_expand_inputs(self):
+        paths = self.split([3, 7], names=('b_2.txt', 'b_10.txt', 'a.txt'))
+        pattern = os.path.join(self.directory, 'b_*.txt')
+        # Matches of a pattern are sorted, other paths keep their order.
+        self.assertEqual(InputPool.expand_inputs([paths[2], pattern]), [paths[2], paths[1], paths[0]])
+        self.assertEqual(InputPool.expand_inputs([paths[1], paths[2], paths[0]]), [paths[1], paths[2], paths[0]])
+        self.assertEqual(InputPool.expand_inputs([os.path.join(self.directory, 'c_*.txt')]), [])
+
+    def test_same_records_as_one_file(self):
+        paths = self.split([5000, 12001])
+        key_encoder = KeyEncoder()
+        expected = DistilledBatch(key_encoder)
+        for offset, lines in BulkReader.iter_line_batches(self.data_path):
+            DonationAnalytics.parse_lines_fast(offset, lines, expected)
+        for jobs in (1, 3):
+            key_encoder = KeyEncoder()
+            records = []
+            positions = []
+            for lines, position, batches in InputPool.iter_chunks(paths, DonationAnalytics.parse_lines_fast, key_encoder, jobs, 1000):
+                positions.append(position)
+                for batch in batches:
+                    self.assertTrue(len(batch) <= 1000)
+                    records.extend(zip(batch.offsets, batch.records()))
+            # Offsets and positions are the ones of the concatenated file.
+            self.assertEqual(records, list(zip(expected.offsets, expected.records())), jobs)
+            self.assertEqual(positions[-1], os.path.getsize(self.data_path))
+            self.assertEqual(positions, sorted(positions))
+
+    def test_same_output_as_one_file(self):
+        expected = self.run_on('expected.txt', [self.data_path], ['-m', 'single'])
+        self.assertTrue(expected)
+        paths = self.split([5000, 12001])
+        pattern = os.path.join(self.directory, 'part_*.txt')
+        for mode in ('single', 'multi', 'parallel'):
+            for jobs in ('1', '3'):
+                self.assertEqual(self.run_on('%s_%s.txt' % (mode, jobs), paths, ['-m', mode, '-j', jobs]), expected, (mode, jobs))
+            self.assertEqual(self.run_on('%s_glob.txt' % mode, [pattern], ['-m', mode]), expected, mode)
+
+    def test_file_without_line_terminator(self):
+        paths = self.split([5000, 12001])
+        with open(paths[0], 'rb+') as part_file:
+            part_file.truncate(os.path.getsize(paths[0]) - 1)
+        # The last line of a file is not joined with the first line of the next file.
+        expected = self.run_on('expected.txt', [self.data_path], ['-m', 'single'])
+        for mode in ('single', 'parallel'):
+            self.assertEqual(self.run_on('%s.txt' % mode, paths, ['-m', mode, '-j', '3']), expected, mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from support import write_input, run_program
+import bulk_reader as BulkReader
+import donation_analytics as DonationAnalytics
+from distilled_data import DistilledBatch
+from instrumentation import RunStats
+from run_context import RunContext
+from test_parsers import LINES
+
+
+class Arguments(object):
+    """ The arguments of a run which RunStats reads. """
+    def __init__(self, data_path, output_path):
+        self.data_input_path = data_path
+        self.output_path = output_path
+
+
+class RejectsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path, self.percentile_path = write_input(self.directory, LINES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @unittest.skipIf(sys.version_info < (3,), 'Python 2 parsers work on bytes, so multibyte fields are not cut or read as text.')
+    def test_stats_of_both_parsers(self):
+        for parser in ('fast', 'strict'):
+            status, output = run_program(['-d', self.data_path, '-p', self.percentile_path, '-P', parser, '--stats', '-',
+                                          '-o', os.path.join(self.directory, 'repeat_donors_%s.txt' % parser)])
+            self.assertEqual(status, 0, parser)
+            run = json.loads(output.decode('utf-8'))["runs"][0]
+            self.assertEqual(run["lines"], len(LINES))
+            self.assertEqual(run["rejects"], {"zipcode": 3, "transaction_amt": 1, "transaction_dt": 1, "other_id": 1})
+
+    def test_unclassified_reject(self):
+        stats = RunStats(Arguments(self.data_path, os.path.join(self.directory, 'repeat_donors.txt')), lambda line: None, RunContext())
+        for offset, lines in BulkReader.iter_line_batches(self.data_path):
+            batch = DistilledBatch()
+            DonationAnalytics.parse_lines_strict(offset, lines, batch)
+            stats.count_lines(offset, lines, batch, 0.0)
+        self.assertEqual(stats.rejects, {"other": 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
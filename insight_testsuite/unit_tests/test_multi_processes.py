@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import run_program, read_output
+import handler_multi_processes as HandlerMultiProcesses
+import synthetic_data as SyntheticData
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spool_round_trip(self):
+        path = os.path.join(self.directory, 'spool')
+        records = [(offset, 'C%08d|02895|2018' % offset, offset * 0.5) for offset in range(3 * HandlerMultiProcesses.SPOOL_BLOCK + 7)]
+        writer = HandlerMultiProcesses.SpoolWriter(path)
+        for record in records:
+            writer.append(record)
+        writer.close()
+        self.assertEqual(list(HandlerMultiProcesses.iter_spool(path)), records)
+        # Spool files are removed once they are read.
+        self.assertFalse(os.path.exists(path))
+
+
+class ParallelModeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill_dir = os.path.join(self.directory, 'spool')
+        os.mkdir(self.spill_dir)
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 20000, donors=3000, committees=20, zipcodes=50)
+        self.percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(self.percentile_path, 'w') as percentile_file:
+            percentile_file.write('30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_mode(self, name, arguments):
+        output_path = os.path.join(self.directory, name)
+        status, _ = run_program(['-d', self.data_path, '-p', self.percentile_path, '-o', output_path] + arguments)
+        self.assertEqual(status, 0)
+        return read_output(output_path)
+
+    def test_same_output_as_single_mode(self):
+        expected = self.run_mode('single.txt', ['-m', 'single', '-s', 'mean,donors'])
+        self.assertTrue(expected)
+        for jobs in ('1', '3'):
+            self.assertEqual(self.run_mode('parallel_%s.txt' % jobs, ['-m', 'parallel', '-j', jobs, '-s', 'mean,donors',
+                                                                      '--spill-dir', self.spill_dir]), expected)
+        # Spool files are removed at the end.
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
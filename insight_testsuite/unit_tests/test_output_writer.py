@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from support import run_program, read_output
+import output_writer as OutputWriter
+import synthetic_data as SyntheticData
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+OPENERS = {'none': open, 'gzip': gzip.open, 'bz2': bz2.BZ2File}
+if lzma is not None:
+    OPENERS['lzma'] = lzma.open
+
+
+def read_file(path, compression):
+    """ Return the content of a file written with a compression, as text. """
+    with OPENERS[compression](path, 'rb') as output_file:
+        return output_file.read().decode('utf-8')
+
+
+def wait_until(condition, timeout=5.0):
+    """ Poll a condition until it holds or timeout seconds have passed, and return it. """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FailingFile(object):
+    """ An output file whose writes fail, e.g. on a full disk. """
+    def __init__(self):
+        self.closed = False
+
+    def write(self, data):
+        raise IOError('No space left on device')
+
+    def close(self):
+        self.closed = True
+
+
+class OutputWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_compression(self):
+        self.assertEqual(OutputWriter.get_compression('out.txt'), 'none')
+        self.assertEqual(OutputWriter.get_compression('out.txt.gz'), 'gzip')
+        self.assertEqual(OutputWriter.get_compression('out.txt.bz2'), 'bz2')
+        self.assertEqual(OutputWriter.get_compression('out.txt.xz'), 'lzma')
+        # A given compression wins over the extension.
+        self.assertEqual(OutputWriter.get_compression('out.txt.gz', 'bz2'), 'bz2')
+        self.assertEqual(OutputWriter.get_compression('out.txt.gz', 'none'), 'none')
+        self.assertRaises(ValueError, OutputWriter.open_output, os.path.join(self.directory, 'out.zip'), False, 'zip')
+
+    def test_flush_size(self):
+        path = os.path.join(self.directory, 'out.txt')
+        counters = []
+        writer = OutputWriter.OutputWriter(path, flush_size=10, counters=counters)
+        writer.write('a|1\n')
+        writer.write('b|2\n')
+        self.assertEqual((writer.buffer, writer.buffered), (['a|1\n', 'b|2\n'], 8))
+        writer.write('c|3\n')
+        # The buffer is handed to the writer thread once it holds flush_size characters.
+        self.assertEqual((writer.buffer, writer.buffered), ([], 0))
+        writer.write('d|4\n')
+        writer.close()
+        self.assertEqual(read_file(path, 'none'), 'a|1\nb|2\nc|3\nd|4\n')
+        self.assertEqual((counters[0].batches, counters[0].records), (2, 4))
+
+    def test_round_trip(self):
+        text = u''.join(u'C%08d|ＡＢ１２３|2018|%d|%d|1\n' % (index, index, index) for index in range(2000))
+        for compression in sorted(OPENERS):
+            for threaded in (True, False):
+                # Compressions are given by the extension or explicitly.
+                for name, given in (('out_%s' % compression, compression), ('out.txt%s' % self.extension(compression), None)):
+                    path = os.path.join(self.directory, name)
+                    writer = OutputWriter.OutputWriter(path, flush_size=1000, compression=given, threaded=threaded)
+                    for start in range(0, len(text), 700):
+                        writer.write(text[start:start + 700])
+                    writer.close()
+                    self.assertEqual(read_file(path, compression), text, (compression, threaded, name))
+
+    def extension(self, compression):
+        for extension, name in OutputWriter.COMPRESSIONS.items():
+            if name == compression:
+                return extension
+        return ''
+
+    def test_append(self):
+        for compression in sorted(OPENERS):
+            path = os.path.join(self.directory, 'out.txt' + self.extension(compression))
+            if compression == 'bz2' and sys.version_info < (3,):
+                self.assertRaises(ValueError, OutputWriter.open_output, path, True, compression)
+                continue
+            for append, text in ((False, u'first|1\n'), (True, u'second|2\n'), (True, u'third|3\n')):
+                writer = OutputWriter.OutputWriter(path, append)
+                writer.write(text)
+                writer.close()
+            # Compressed files get one stream per run, which are read as one.
+            self.assertEqual(read_file(path, compression), u'first|1\nsecond|2\nthird|3\n', compression)
+            writer = OutputWriter.OutputWriter(path)
+            writer.write(u'new|4\n')
+            writer.close()
+            self.assertEqual(read_file(path, compression), u'new|4\n', compression)
+
+    def test_error_raised_by_write(self):
+        writer = OutputWriter.OutputWriter(os.path.join(self.directory, 'out.txt'), flush_size=1)
+        writer.output_file.close()
+        writer.output_file = FailingFile()
+        writer.write('a|1\n')
+        thread = writer.thread
+        self.assertTrue(wait_until(lambda: thread.error is not None))
+        # The error of the writer thread comes back from the next write(), and again from close().
+        self.assertRaises(IOError, writer.write, 'b|2\n')
+        self.assertRaises(IOError, writer.close)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(writer.output_file.closed)
+
+    def test_error_raised_by_close(self):
+        writer = OutputWriter.OutputWriter(os.path.join(self.directory, 'out.txt'))
+        writer.output_file.close()
+        writer.output_file = FailingFile()
+        writer.write('a|1\n')
+        self.assertRaises(IOError, writer.close)
+        self.assertTrue(writer.output_file.closed)
+
+
+class CompressedOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 6000, donors=800, committees=10, zipcodes=30)
+        self.percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(self.percentile_path, 'w') as percentile_file:
+            percentile_file.write('30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_on(self, data_path, output_path, arguments):
+        status, _ = run_program(['-d', data_path, '-p', self.percentile_path, '-o', output_path] + arguments)
+        self.assertEqual(status, 0)
+
+    def test_same_output_compressed(self):
+        expected_path = os.path.join(self.directory, 'expected.txt')
+        self.run_on(self.data_path, expected_path, [])
+        expected = read_output(expected_path)
+        self.assertTrue(expected)
+        gzip_path = os.path.join(self.directory, 'repeat_donors.txt.gz')
+        self.run_on(self.data_path, gzip_path, ['-m', 'multi', '-F', '100'])
+        self.assertEqual(read_file(gzip_path, 'gzip'), expected)
+        bz2_path = os.path.join(self.directory, 'repeat_donors.out')
+        self.run_on(self.data_path, bz2_path, ['-z', 'bz2'])
+        self.assertEqual(read_file(bz2_path, 'bz2'), expected)
+
+    def test_checkpoint_appends_gzip_stream(self):
+        expected_path = os.path.join(self.directory, 'expected.txt')
+        self.run_on(self.data_path, expected_path, [])
+        with open(self.data_path, 'rb') as data_file:
+            lines = data_file.readlines()
+        growing_path = os.path.join(self.directory, 'growing.txt')
+        output_path = os.path.join(self.directory, 'repeat_donors.txt.gz')
+        checkpoint_path = os.path.join(self.directory, 'state.ckpt')
+        for end in (len(lines) // 2, len(lines)):
+            with open(growing_path, 'wb') as growing_file:
+                growing_file.writelines(lines[:end])
+            self.run_on(growing_path, output_path, ['-c', checkpoint_path])
+        self.assertEqual(read_file(output_path, 'gzip'), read_output(expected_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from support import record_line, write_input, run_program, read_output
+import bulk_reader as BulkReader
+import donation_analytics as DonationAnalytics
+from distilled_data import DistilledBatch
+
+# Lines both parsers have to agree on, including multibyte zipcodes and amounts written with non-ASCII digits.
+LINES = [
+    record_line('C00384516', u'ABBOTT, JOSEPH', u'028956146', '01122017', '250'),
+    record_line('C00384516', u'ABBOTT, JOSEPH', u'028956146', '01122018', '333'),
+    # 5 characters but more than 5 bytes: cut as text.
+    record_line('C00384516', u'ÉTIENNE, ANNE', u'ＡＢ１２３４５', '01122017', '100'),
+    record_line('C00384516', u'ÉTIENNE, ANNE', u'ＡＢ１２３４５', '01122018', '200'),
+    # 3 characters but 6 bytes: rejected.
+    record_line('C00384516', u'ZOLA, EMILE', u'ÉÉÉ', '01122017', '100'),
+    record_line('C00384516', u'ZOLA, EMILE', u'ÉÉÉ', '01122018', '100'),
+    # Fullwidth digits are a number for float() of text only, but not a date for strptime().
+    record_line('C00384516', u'ABBOTT, JOSEPH', u'028956146', '03122018', u'１００'),
+    record_line('C00384516', u'ABBOTT, JOSEPH', u'028956146', '03122018', u'N/A'),
+    record_line('C00384516', u'ÉTIENNE, ANNE', u'ＡＢ１２３４５６７', '02122018', u'７５'),
+    record_line('C00384516', u'ÉTIENNE, ANNE', u'ＡＢ１２３４５', u'０２１２２０１８', '50'),
+    record_line('C00384516', u'SABOURIN, JAMES', u'0289', '01312018', '384'),
+    record_line('C00384516', u'SABOURIN, JAMES', u'02895', '01312018', '384', 'H6CA34245'),
+]
+
+
+@unittest.skipIf(sys.version_info < (3,), 'Python 2 parsers work on bytes, so multibyte fields are not cut or read as text.')
+class ParsersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path, self.percentile_path = write_input(self.directory, LINES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, parse_lines):
+        batch = DistilledBatch()
+        for offset, lines in BulkReader.iter_line_batches(self.data_path):
+            parse_lines(offset, lines, batch)
+        return [(offset,) + record for offset, record in zip(batch.offsets, batch.records())]
+
+    def test_same_records(self):
+        fast = self.parse(DonationAnalytics.parse_lines_fast)
+        self.assertEqual(fast, self.parse(DonationAnalytics.parse_lines_strict))
+        zipcodes = [record[2] for record in fast]
+        self.assertIn(u'ＡＢ１２３', zipcodes)
+        self.assertNotIn(u'ÉÉÉ', zipcodes)
+        self.assertIn(100.0, [record[5] for record in fast])
+
+    def test_same_output(self):
+        outputs = []
+        for parser in ('fast', 'strict'):
+            output_path = os.path.join(self.directory, 'repeat_donors_%s.txt' % parser)
+            status, _ = run_program(['-d', self.data_path, '-p', self.percentile_path, '-o', output_path, '-P', parser])
+            self.assertEqual(status, 0)
+            outputs.append(read_output(output_path))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], u'C00384516|02895|2018|333|333|1\n'
+                                     u'C00384516|ＡＢ１２３|2018|200|200|1\n'
+                                     u'C00384516|02895|2018|100|433|2\n'
+                                     u'C00384516|ＡＢ１２３|2018|75|275|2\n')
+
+    def test_reject_reason(self):
+        reasons = [DonationAnalytics.reject_reason(line.encode('utf-8')) for line in LINES[4:6] + LINES[7:8] + LINES[10:]]
+        self.assertEqual(reasons, ['zipcode', 'zipcode', 'transaction_amt', 'zipcode', 'other_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
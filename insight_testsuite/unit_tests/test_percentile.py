@@ -0,0 +1,78 @@
+from math import ceil
+import random
+import unittest
+
+import support  # noqa: F401, puts src on sys.path
+from countedlist import countedlist
+from percentile import nearest_rank, percentiletracker
+
+
+def expected_percentile(percentile, values):
+    """ Nearest-rank percentile computed from scratch. """
+    ordered = sorted(values)
+    rank = max(int(ceil(percentile / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+class NearestRankTest(unittest.TestCase):
+
+    def test_bounds(self):
+        self.assertEqual(nearest_rank(30, 1), 0)
+        self.assertEqual(nearest_rank(0, 10), 0)
+        self.assertEqual(nearest_rank(100, 10), 9)
+        self.assertEqual(nearest_rank(30, 10), 2)
+        self.assertEqual(nearest_rank(31, 10), 3)
+
+
+class PercentileTrackerTest(unittest.TestCase):
+
+    def check_sequence(self, percentile, values):
+        tracker = percentiletracker(percentile)
+        for i, val in enumerate(values):
+            tracker.append(val)
+            self.assertEqual(tracker.value, expected_percentile(percentile, values[:i + 1]))
+            # The cursor sits among the copies of value, which follow the elements below it.
+            self.assertEqual(tracker.below, sum(1 for other in values[:i + 1] if other < tracker.value))
+            self.assertEqual(tracker.value_count, values[:i + 1].count(tracker.value))
+            self.assertEqual(len(tracker), i + 1)
+
+    def test_cursor_moves_down(self):
+        # Every insertion lands below the cursor.
+        self.check_sequence(50, [float(val) for val in range(100, 0, -1)])
+
+    def test_cursor_moves_up(self):
+        # Every insertion lands above the cursor.
+        self.check_sequence(50, [float(val) for val in range(100)])
+
+    def test_repeated_amounts(self):
+        self.check_sequence(30, [100.0, 100.0, 50.0, 100.0, 250.0, 50.0, 50.0, 100.0, 5.0, 2700.0])
+
+    def test_random_percentiles(self):
+        generator = random.Random(3)
+        for percentile in (1, 30, 50, 99.5, 100):
+            values = [float(generator.choice((5, 10, 25, 100, 250, 1000))) if generator.random() < 0.7 else generator.random() * 1000
+                      for _ in range(400)]
+            self.check_sequence(percentile, values)
+
+    def test_starts_on_existing_transactions(self):
+        values = [float(val % 17) for val in range(200)]
+        tracker = percentiletracker(30, countedlist(values))
+        self.assertEqual(tracker.value, expected_percentile(30, values))
+        tracker.append(3.5)
+        self.assertEqual(tracker.value, expected_percentile(30, values + [3.5]))
+
+    def test_shared_transactions(self):
+        # Trackers of several percentiles share one countedlist: one appends, the others are notified.
+        transactions = countedlist()
+        trackers = [percentiletracker(percentile, transactions) for percentile in (10, 50, 90)]
+        values = [float(val * 7 % 23) for val in range(100)]
+        for i, val in enumerate(values):
+            trackers[0].append(val)
+            for tracker in trackers[1:]:
+                tracker.update(val)
+            for tracker in trackers:
+                self.assertEqual(tracker.value, expected_percentile(tracker.percentile, values[:i + 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from support import run_program, read_output
+import pipeline as Pipeline
+import synthetic_data as SyntheticData
+
+
+def wait_until(condition, timeout=5.0):
+    """ Poll a condition until it holds or timeout seconds have passed, and return it. """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class StageTest(unittest.TestCase):
+
+    def test_batches_in_order(self):
+        counters = []
+        handled = []
+        stage = Pipeline.Stage('test', handled.append, queue_size=2, counters=counters)
+        for batch in ([1, 2], [3], [4, 5, 6]):
+            stage.put(batch)
+        stage.close()
+        self.assertFalse(stage.is_alive())
+        self.assertEqual(handled, [[1, 2], [3], [4, 5, 6]])
+        self.assertEqual(counters, [stage.counter])
+        self.assertEqual((stage.counter.batches, stage.counter.records), (3, 6))
+        self.assertIsNotNone(stage.counter.stopped)
+
+    def test_backpressure(self):
+        release = threading.Event()
+        stage = Pipeline.Stage('test', lambda batch: release.wait(), queue_size=2)
+        # The stage holds the first batch, its queue the next two, so the fourth put() blocks.
+        feeder = threading.Thread(target=lambda: [stage.put([index]) for index in range(4)])
+        feeder.daemon = True
+        feeder.start()
+        self.assertTrue(wait_until(stage.queue.full))
+        feeder.join(0.2)
+        self.assertTrue(feeder.is_alive())
+        release.set()
+        feeder.join(5)
+        self.assertFalse(feeder.is_alive())
+        stage.close()
+        self.assertEqual(stage.counter.batches, 4)
+
+    def test_error_raised_by_put(self):
+        def fail(batch):
+            raise ValueError('bad batch %s' % batch)
+        stage = Pipeline.Stage('test', fail)
+        stage.put([1])
+        self.assertTrue(wait_until(lambda: stage.error is not None))
+        self.assertRaises(ValueError, stage.put, [2])
+        self.assertRaises(ValueError, stage.close)
+        self.assertFalse(stage.is_alive())
+
+    def test_error_raised_by_close(self):
+        handled = []
+        def handle(batch):
+            if batch == [2]:
+                raise ValueError('bad batch')
+            handled.append(batch)
+        stage = Pipeline.Stage('test', handle, queue_size=4)
+        for index in range(4):
+            stage.put([index])
+        self.assertRaises(ValueError, stage.close)
+        # Batches after the error are skipped.
+        self.assertEqual(handled, [[0], [1]])
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def producers(self, name):
+        return [thread for thread in threading.enumerate() if thread.name == name]
+
+    def test_same_items(self):
+        counters = []
+        items = [[index] * (index % 3) for index in range(50)]
+        self.assertEqual(list(Pipeline.prefetch(iter(items), 'prefetch-items', queue_size=3, counters=counters)), items)
+        self.assertEqual((counters[0].batches, counters[0].records), (50, sum(len(item) for item in items)))
+        self.assertIsNotNone(counters[0].stopped)
+
+    def test_error_raised_by_caller(self):
+        def produce():
+            yield [1]
+            raise ValueError('bad block')
+        items = Pipeline.prefetch(produce(), 'prefetch-error')
+        self.assertEqual(next(items), [1])
+        self.assertRaises(ValueError, next, items)
+        self.assertEqual(self.producers('prefetch-error'), [])
+
+    def test_abandoned(self):
+        produced = []
+        def produce():
+            while True:
+                produced.append(len(produced))
+                yield [len(produced)]
+        items = Pipeline.prefetch(produce(), 'prefetch-abandoned', queue_size=2)
+        self.assertEqual([next(items) for _ in range(3)], [[1], [2], [3]])
+        # The producer runs ahead of the caller until the queue is full, then it blocks.
+        self.assertTrue(wait_until(lambda: len(produced) >= 5))
+        items.close()
+        # The queue is drained, so the producer ends instead of staying blocked.
+        self.assertEqual(self.producers('prefetch-abandoned'), [])
+        count = len(produced)
+        time.sleep(0.05)
+        self.assertEqual(len(produced), count)
+
+
+class MultiModeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 20000, donors=3000, committees=20, zipcodes=50)
+        self.percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(self.percentile_path, 'w') as percentile_file:
+            percentile_file.write('30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_mode(self, name, arguments):
+        output_path = os.path.join(self.directory, name)
+        status, _ = run_program(['-d', self.data_path, '-p', self.percentile_path, '-o', output_path] + arguments)
+        self.assertEqual(status, 0)
+        return read_output(output_path)
+
+    def test_same_output_as_single_mode(self):
+        expected = self.run_mode('single.txt', ['-m', 'single'])
+        self.assertTrue(expected)
+        self.assertEqual(self.run_mode('multi.txt', ['-m', 'multi']), expected)
+        # Small batches and flushes keep every stage busy with many batches.
+        self.assertEqual(self.run_mode('multi_small.txt', ['-m', 'multi', '-b', '64', '-F', '512']), expected)
+        self.assertEqual(self.run_mode('multi_query.txt', ['-m', 'multi', '-s', 'mean,donors']),
+                         self.run_mode('single_query.txt', ['-m', 'single', '-s', 'mean,donors']))
+
+    def test_error_ends_run(self):
+        # The output file is opened by the aggregate stage, whose error has to end the run instead of blocking it.
+        output_path = os.path.join(self.directory, 'missing', 'repeat_donors.txt')
+        status, _ = run_program(['-d', self.data_path, '-p', self.percentile_path, '-o', output_path, '-m', 'multi', '-b', '64'])
+        self.assertNotEqual(status, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from bisect import insort
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from support import run_program, read_output
+from percentile import nearest_rank
+from quantile_sketch import LogQuantizer, approximatetracker
+import synthetic_data as SyntheticData
+
+
+def within_bound(exact, approximate, relative_error):
+    """ Whether an approximate output percentile is within relative_error of the exact one.
+    Both are rounded to whole dollars in output lines, which moves each of them by at most 0.5: the unrounded exact
+    percentile is at most exact + 0.5, and the two roundings add up to 1.
+    """
+    return abs(approximate - exact) <= relative_error * (abs(exact) + 0.5) + 1
+
+
+class LogQuantizerTest(unittest.TestCase):
+
+    def test_representatives_within_relative_error(self):
+        generator = random.Random(1)
+        for relative_error in (0.001, 0.01, 0.05):
+            quantizer = LogQuantizer(relative_error)
+            for _ in range(5000):
+                amount = round(10 ** generator.uniform(-2, 8), 2) * generator.choice((1, -1))
+                self.assertTrue(abs(quantizer(amount) - amount) <= relative_error * abs(amount) * (1 + 1e-9),
+                                (relative_error, amount, quantizer(amount)))
+            self.assertEqual(quantizer(0), 0)
+
+    def test_tracker_within_relative_error(self):
+        generator = random.Random(2)
+        quantizer = LogQuantizer(0.01)
+        for percentile in (1, 30, 50, 99, 100):
+            tracker = approximatetracker(percentile, quantizer)
+            amounts = []
+            for _ in range(2000):
+                amount = float(generator.randint(1, 100000))
+                insort(amounts, amount)
+                tracker.append(amount)
+                exact = amounts[nearest_rank(percentile, len(amounts))]
+                self.assertTrue(abs(tracker.value - exact) <= 0.01 * exact * (1 + 1e-9), (percentile, tracker.value, exact))
+        # The tracker keeps one entry per bucket, not per amount.
+        self.assertTrue(tracker.transactions.distinct() < 600)
+
+
+class ApproximateModeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'itcont.txt')
+        with open(self.data_path, 'w') as data_file:
+            SyntheticData.generate(data_file, 30000, donors=2000, repeat_ratio=0.8, committees=10, zipcodes=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_mode(self, name, percentile, arguments):
+        percentile_path = os.path.join(self.directory, 'percentile.txt')
+        with open(percentile_path, 'w') as percentile_file:
+            percentile_file.write('%s\n' % percentile)
+        output_path = os.path.join(self.directory, name)
+        status, _ = run_program(['-d', self.data_path, '-p', percentile_path, '-o', output_path, '-m', 'single'] + arguments)
+        self.assertEqual(status, 0)
+        return [line.split('|') for line in read_output(output_path).splitlines()]
+
+    def test_output_within_relative_error(self):
+        for percentile in (30, 90):
+            exact = self.run_mode('exact.txt', percentile, [])
+            self.assertTrue(exact)
+            for relative_error in (0.01, 0.1):
+                approximate = self.run_mode('approximate.txt', percentile, ['-a', str(relative_error)])
+                self.assertEqual(len(approximate), len(exact))
+                for exact_line, approximate_line in zip(exact, approximate):
+                    # Recipients, totals and numbers of transactions stay exact.
+                    self.assertEqual(exact_line[:3], approximate_line[:3])
+                    self.assertEqual(exact_line[4:], approximate_line[4:])
+                    self.assertTrue(within_bound(int(exact_line[3]), int(approximate_line[3]), relative_error),
+                                    (relative_error, exact_line, approximate_line))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401, puts src on sys.path
+from key_encoder import donor_key
+from spill_store import SpilledDict
+
+
+class CountingConnection(object):
+    """ Wraps an sqlite3 connection and counts the SELECT statements run through it. """
+    def __init__(self, connection):
+        self.connection = connection
+        self.selects = 0
+
+    def execute(self, statement, *args):
+        if statement.startswith('SELECT'):
+            self.selects += 1
+        return self.connection.execute(statement, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class SpilledDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spilled = SpilledDict(100, os.path.join(self.directory, 'donors.db'))
+        self.spilled.connection = CountingConnection(self.spilled.connection)
+
+    def tearDown(self):
+        self.spilled.close()
+        shutil.rmtree(self.directory)
+
+    def test_evicted_entries_are_loaded_back(self):
+        keys = [donor_key(b'DONOR, %d' % index, b'02895') for index in range(1000)]
+        for index, key in enumerate(keys):
+            self.spilled[key] = 2000 + index % 17
+        self.assertTrue(len(self.spilled.cache) <= 100)
+        for index, key in enumerate(keys):
+            self.assertEqual(self.spilled[key], 2000 + index % 17)
+        self.assertEqual(sorted(self.spilled.items()), sorted((key, 2000 + index % 17) for index, key in enumerate(keys)))
+
+    def test_new_keys_skip_the_database(self):
+        for index in range(1000):
+            self.spilled[donor_key(b'DONOR, %d' % index, b'02895')] = 2017
+        # Keys which were never evicted are screened by the Bloom filter, apart from a few false positives.
+        self.spilled.connection.selects = 0
+        for index in range(1000):
+            self.assertNotIn(donor_key(b'OTHER DONOR, %d' % index, b'02895'), self.spilled)
+        self.assertTrue(self.spilled.connection.selects < 50, self.spilled.connection.selects)
+
+    def test_nothing_evicted(self):
+        self.spilled[1] = 2017
+        self.assertIsNone(self.spilled.get(2))
+        self.assertEqual(self.spilled.connection.selects, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from support import SOURCE_DIR, TESTS_DIR, run_program, read_output
+import synthetic_data as SyntheticData
+
+
+def read_test(name):
+    """ Return (input data, path of percentile.txt, expected output) of an end-to-end test. """
+    test_dir = os.path.join(TESTS_DIR, name)
+    with open(os.path.join(test_dir, 'input', 'itcont.txt'), 'rb') as data_file:
+        data = data_file.read()
+    with open(os.path.join(test_dir, 'output', 'repeat_donors.txt'), 'rb') as output_file:
+        expected = output_file.read()
+    return data, os.path.join(test_dir, 'input', 'percentile.txt'), expected
+
+
+def free_port():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'Stream mode needs Python 3.')
+class StreamServiceTest(unittest.TestCase):
+
+    def test_stdin_same_as_file_mode(self):
+        for name in sorted(os.listdir(TESTS_DIR)):
+            data, percentile_path, expected = read_test(name)
+            status, output = run_program(['-m', 'stream', '-p', percentile_path], stdin=data)
+            self.assertEqual(status, 0, name)
+            self.assertEqual(output, expected, name)
+
+    def serve_over_tcp(self, data, percentile_path):
+        """ Send data to a new service listening on a local TCP port and return what it sends back. """
+        port = free_port()
+        service = subprocess.Popen([sys.executable, 'donation_analytics.py', '-m', 'stream', '-l', 'tcp:127.0.0.1:%d' % port,
+                                    '-p', percentile_path], cwd=SOURCE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            self.assertIn(b'Listening', service.stderr.readline())
+            client = socket.create_connection(('127.0.0.1', port))
+            try:
+                # Lines are cut across writes, as they may be by the network.
+                for start in range(0, len(data), 1000):
+                    client.sendall(data[start:start + 1000])
+                client.shutdown(socket.SHUT_WR)
+                output = b''
+                while True:
+                    received = client.recv(65536)
+                    if not received:
+                        break
+                    output += received
+            finally:
+                client.close()
+        finally:
+            service.send_signal(signal.SIGTERM)
+            service.communicate()
+        self.assertEqual(service.returncode, 0)
+        return output
+
+    def test_tcp_same_as_file_mode(self):
+        for name in sorted(os.listdir(TESTS_DIR)):
+            data, percentile_path, expected = read_test(name)
+            self.assertEqual(self.serve_over_tcp(data, percentile_path), expected, name)
+
+    def test_stdin_many_batches(self):
+        directory = tempfile.mkdtemp()
+        try:
+            data_path = os.path.join(directory, 'itcont.txt')
+            with open(data_path, 'w') as data_file:
+                SyntheticData.generate(data_file, 20000, donors=2000, committees=10, zipcodes=20)
+            percentile_path = read_test('test_1')[1]
+            output_path = os.path.join(directory, 'repeat_donors.txt')
+            status, _ = run_program(['-d', data_path, '-p', percentile_path, '-o', output_path])
+            self.assertEqual(status, 0)
+            with open(data_path, 'rb') as data_file:
+                status, output = run_program(['-m', 'stream', '-p', percentile_path, '-b', '500'], stdin=data_file.read())
+            self.assertEqual(status, 0)
+            self.assertEqual(output.decode('utf-8'), read_output(output_path))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
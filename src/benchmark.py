@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+
+"""This is the benchmark module.
+It generates a synthetic input file with synthetic_data.py (or uses a given one), runs donation_analytics.py on it in
+every handler mode, and writes the results as JSON, so that they can be compared between releases.
+
+For each mode, the program is run in its own process, which gives:
+1) seconds: wall-clock running time, the best of the repeated runs.
+2) records_per_second: number of input lines divided by seconds.
+3) peak_rss_mb: peak resident memory of the process, or of its largest worker process in parallel mode.
+4) output_bytes: size of the output file.
+
+The time spent in each stage is measured by one more run of single mode under cProfile:
+1) parse: reading and santinizing lines (the parser of read_file()).
+2) state_update: updating donation_date and contribution_info, i.e. the time spent in the handler itself and in the
+   built-in functions it calls, such as dictionary lookups.
+3) percentile: inserting amounts and moving the cursor of percentiletrackers.
+4) write: formatting contribution IDs and writing output lines.
+Stages are only broken down for single mode, since cProfile does not see into handler threads and worker processes.
+Profiling slows everything down, so stages are given as shares of the profiled time and scaled to the unprofiled one.
+The breakdown is approximate: cProfile slows down function calls more than inline code, and time spent outside the
+listed functions (e.g. the main loop) belongs to no stage.
+
+With a relative error, single mode is also run in approximate mode (-a) and compared with the exact run: peak memory of
+both runs, and relative errors of the approximate percentiles, given as their mean and maximum. Totals and numbers of
+transactions have to be the same.
+"""
+
+import argparse
+import json
+import os
+import platform
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_data as SyntheticData
+
+# Directory of donation_analytics.py.
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = ('single', 'multi', 'parallel')
+
+# Functions timed by each stage, as (file name, function name, cumulative, caller). Built-in functions have file name
+# '~' and are matched by the beginning of their name. Cumulative time includes callees, otherwise only the time spent in
+# the function itself is counted. With a caller (file name, function name), only the calls made by the caller are
+# counted, e.g. the dictionary lookups of the handler and not the ones of the parser.
+STAGE_FUNCTIONS = {
+    "parse": [('bulk_reader.py', 'iter_line_batches', True, None),
+              ('donation_analytics.py', 'parse_lines_fast', True, None),
+              ('donation_analytics.py', 'parse_lines_strict', True, None)],
+    "state_update": [('engine.py', 'process', False, None), ('~', '', True, ('engine.py', 'process'))],
+    "percentile": [('percentile.py', 'append', True, None), ('percentile.py', '__init__', True, None)],
+    "write": [('key_encoder.py', 'contribution_id', True, None), ('~', "<method 'write' of", True, ('output_writer.py', '_write'))],
+}
+
+def get_args():
+    """ Parse user auguments from command line. """
+
+    usage_desc = """ Used for benchmarking handler modes on a synthetic input file. """
+    parser = argparse.ArgumentParser(description=usage_desc)
+
+    parser.add_argument('-d', '--datainput', type = str, action = 'store', dest = 'data_input_path', default = None, help = "Path to an input file to use instead of a synthetic one.")
+    parser.add_argument('-n', '--rows', type = int, action = 'store', dest = 'rows', default = 100000, help = "Number of lines of the synthetic input file.")
+    parser.add_argument('--donors', type = int, action = 'store', dest = 'donors', default = None, help = "Number of distinct donors. Default: a tenth of the lines.")
+    parser.add_argument('--repeat-ratio', type = float, action = 'store', dest = 'repeat_ratio', default = 0.5, help = "Probability that a record is given by a donor who has already given.")
+    parser.add_argument('--committees', type = int, action = 'store', dest = 'committees', default = 100, help = "Number of recipients.")
+    parser.add_argument('--committee-skew', type = float, action = 'store', dest = 'committee_skew', default = 2.0, help = "Skew of recipients. 1 draws them uniformly, larger values favor the first ones.")
+    parser.add_argument('--invalid-rate', type = float, action = 'store', dest = 'invalid_rate', default = 0.05, help = "Probability that a record has an invalid field.")
+    parser.add_argument('--zipcodes', type = int, action = 'store', dest = 'zipcodes', default = None, help = "Number of distinct zipcodes. Default: donors are spread over all of them.")
+    parser.add_argument('--seed', type = int, action = 'store', dest = 'seed', default = 1, help = "Seed of the synthetic input file.")
+    parser.add_argument('--percentile', type = float, action = 'store', dest = 'percentile', default = 30, help = "Percentile to calculate.")
+    parser.add_argument('-m', '--modes', type = str, action = 'store', dest = 'modes', default = ','.join(MODES), help = "Comma-separated handler modes to run.")
+    parser.add_argument('-r', '--repeat', type = int, action = 'store', dest = 'repeat', default = 1, help = "Number of runs of each mode. The best one is reported.")
+    parser.add_argument('-w', '--workdir', type = str, action = 'store', dest = 'workdir', default = None, help = "Directory of generated files, which are kept. Default: a temporary directory, which is removed.")
+    parser.add_argument('-o', '--output', type = str, action = 'store', dest = 'output_path', default = None, help = "Path of the JSON report. Default: standard output.")
+    parser.add_argument('-a', '--approximate', type = float, action = 'store', dest = 'relative_error', default = None, help = "Compare approximate mode with this relative error against exact single mode.")
+    parser.add_argument('--no-stages', action = 'store_false', dest = 'stages', default = True, help = "Skip the profiled run giving the time of each stage.")
+    parser.add_argument('extra', nargs = '*', help = "Extra arguments given to donation_analytics.py, after --.")
+
+    return parser.parse_args()
+
+def run_program(arguments):
+    """ Run a Python program in a new process.
+    Returns:
+      (seconds, peak RSS in MB) of the process, including its children.
+    """
+    start_time = time.time()
+    process = subprocess.Popen([sys.executable] + arguments, cwd=SOURCE_DIR)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - start_time
+    # The process has been waited for by os.wait4(), which gives its resource usage, so Popen must not wait for it again.
+    process.returncode = status
+    if status != 0:
+        raise RuntimeError('%s failed with status %d.' % (' '.join(arguments), status))
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    peak_rss = usage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+    return seconds, peak_rss
+
+def run_mode(mode, input_path, percentile_path, output_path, repeat, extra):
+    """ Run donation_analytics.py in a mode repeat times and return the result of the fastest run. """
+    arguments = ['donation_analytics.py', '-d', input_path, '-p', percentile_path, '-o', output_path, '-m', mode] + extra
+    seconds, peak_rss = min(run_program(arguments) for _ in range(max(repeat, 1)))
+    return {"mode": mode, "seconds": seconds, "peak_rss_mb": peak_rss}
+
+def run_stages(input_path, percentile_path, output_path, profile_path, extra):
+    """ Run single mode under cProfile.
+    Returns:
+      (dictionary of { stage : profiled seconds }, total profiled seconds)
+    """
+    arguments = ['-m', 'cProfile', '-o', profile_path, 'donation_analytics.py',
+                 '-d', input_path, '-p', percentile_path, '-o', output_path, '-m', 'single'] + extra
+    run_program(arguments)
+    stats = pstats.Stats(profile_path).stats
+    stages = dict((stage, 0.0) for stage in STAGE_FUNCTIONS)
+    for (path, _, function), (_, _, own_time, total_time, callers) in stats.items():
+        for stage, functions in STAGE_FUNCTIONS.items():
+            for file_name, function_name, cumulative, caller in functions:
+                if file_name == '~':
+                    matched = path == '~' and function.startswith(function_name)
+                else:
+                    matched = os.path.basename(path) == file_name and function == function_name
+                if not matched:
+                    continue
+                if caller is None:
+                    stages[stage] += total_time if cumulative else own_time
+                    continue
+                # Each caller gives (primitive calls, calls, own time, total time) of its calls.
+                for (caller_path, _, caller_function), timing in callers.items():
+                    if os.path.basename(caller_path) == caller[0] and caller_function == caller[1]:
+                        stages[stage] += timing[3] if cumulative else timing[2]
+    # The time spent in each function itself adds up to the total time.
+    return stages, sum(own_time for _, _, own_time, _, _ in stats.values())
+
+def compare_outputs(exact_path, approximate_path):
+    """ Compare the output of approximate mode with the exact one.
+    Returns:
+      Dictionary of the mean and maximum relative error of the percentile column and of the share of exact percentiles.
+    """
+    errors = []
+    with open(exact_path) as exact_file:
+        with open(approximate_path) as approximate_file:
+            for exact_line, approximate_line in zip(exact_file, approximate_file):
+                exact = exact_line.rstrip('\n').split('|')
+                approximate = approximate_line.rstrip('\n').split('|')
+                if exact[:3] != approximate[:3] or exact[-2:] != approximate[-2:]:
+                    raise RuntimeError('Totals or numbers of transactions differ: %s, %s' % (exact_line, approximate_line))
+                exact_value, approximate_value = float(exact[3]), float(approximate[3])
+                errors.append(abs(approximate_value - exact_value) / abs(exact_value) if exact_value else abs(approximate_value))
+    return {"lines": len(errors),
+            "mean_relative_error": sum(errors) / len(errors) if errors else 0.0,
+            "max_relative_error": max(errors) if errors else 0.0,
+            "exact_share": sum(1 for error in errors if error == 0) / float(len(errors)) if errors else 1.0}
+
+def benchmark(usrargs):
+    """ Run the benchmark and return its report as a dictionary. """
+    workdir = usrargs.workdir or tempfile.mkdtemp(prefix='donation_analytics_benchmark_')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        report = {"python": platform.python_version(), "platform": platform.platform(), "time": time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+        input_path = usrargs.data_input_path
+        if input_path is None:
+            input_path = os.path.join(workdir, 'itcont.txt')
+            start_time = time.time()
+            with open(input_path, 'w') as synthetic_file:
+                invalid = SyntheticData.generate(synthetic_file, usrargs.rows, usrargs.donors, usrargs.repeat_ratio,
+                                                 usrargs.committees, usrargs.committee_skew, usrargs.invalid_rate, usrargs.seed,
+                                                 usrargs.zipcodes)
+            report["dataset"] = {"rows": usrargs.rows, "donors": usrargs.donors, "repeat_ratio": usrargs.repeat_ratio,
+                                 "committees": usrargs.committees, "committee_skew": usrargs.committee_skew,
+                                 "invalid_rate": usrargs.invalid_rate, "zipcodes": usrargs.zipcodes, "seed": usrargs.seed, "invalid_rows": invalid,
+                                 "generation_seconds": time.time() - start_time}
+        else:
+            with open(input_path, 'rb') as input_file:
+                rows = sum(block.count(b'\n') for block in iter(lambda: input_file.read(1 << 20), b''))
+            report["dataset"] = {"path": os.path.abspath(input_path), "rows": rows}
+        input_path = os.path.abspath(input_path)
+        rows = report["dataset"]["rows"]
+        report["dataset"]["bytes"] = os.path.getsize(input_path)
+
+        percentile_path = os.path.join(workdir, 'percentile.txt')
+        with open(percentile_path, 'w') as percentile_file:
+            percentile_file.write('%s\n' % usrargs.percentile)
+        output_path = os.path.join(workdir, 'repeat_donors.txt')
+
+        report["runs"] = []
+        for mode in usrargs.modes.split(','):
+            result = run_mode(mode, input_path, percentile_path, output_path, usrargs.repeat, usrargs.extra)
+            result["records_per_second"] = rows / result["seconds"] if result["seconds"] else None
+            result["output_bytes"] = os.path.getsize(output_path)
+            report["runs"].append(result)
+
+        if usrargs.relative_error:
+            exact_path = os.path.join(workdir, 'repeat_donors_exact.txt')
+            approximate_path = os.path.join(workdir, 'repeat_donors_approximate.txt')
+            exact = run_mode('single', input_path, percentile_path, exact_path, usrargs.repeat, usrargs.extra)
+            approximate = run_mode('single', input_path, percentile_path, approximate_path, usrargs.repeat,
+                                   usrargs.extra + ['-a', str(usrargs.relative_error)])
+            report["approximate"] = {"relative_error": usrargs.relative_error, "exact": exact, "approximate": approximate,
+                                     "accuracy": compare_outputs(exact_path, approximate_path)}
+
+        if usrargs.stages:
+            stages, profiled_total = run_stages(input_path, percentile_path, output_path, os.path.join(workdir, 'single.prof'), usrargs.extra)
+            single = [result["seconds"] for result in report["runs"] if result["mode"] == 'single']
+            # Stages are scaled to the time of the unprofiled run of single mode, if any.
+            scale = single[0] / profiled_total if single and profiled_total else 1.0
+            report["stages"] = dict((stage, {"seconds": seconds * scale, "share": seconds / profiled_total if profiled_total else None})
+                                    for stage, seconds in stages.items())
+        return report
+    finally:
+        if usrargs.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    usr_args = get_args()
+    report = benchmark(usr_args)
+    if usr_args.output_path:
+        with open(usr_args.output_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
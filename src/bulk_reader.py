@@ -0,0 +1,119 @@
+"""
+This module is the bulk reader module, which is the I/O layer of Input Module.
+Instead of iterating a text file line by line, the input file is memory-mapped (or read in large binary blocks when
+it can not be mapped) and line boundaries are found one block at a time. Lines are given as batches of bytes, so that
+parsers only decode the few fields they use.
+"""
+
+import mmap
+import os
+
+# Size of blocks in which line boundaries are searched.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def get_chunks(path, count):
+    """ Cut a file into at most count byte ranges [start, end), which all end at a line boundary.
+    Each range can be given to iter_line_batches() by a different worker.
+    """
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, 'rb') as input_file:
+        start = 0
+        while start < size:
+            end = start + max(size // count, 1)
+            if end < size:
+                input_file.seek(end)
+                input_file.readline()
+                end = input_file.tell()
+            else:
+                end = size
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def iter_line_batches(path, start=0, end=None, block_size=BLOCK_SIZE):
+    """ Iterate the lines of the byte range [start, end) of a file, one block at a time.
+    Args:
+      path: Path of input file.
+      start: Offset of the first line. It should be a line boundary, e.g. given by get_chunks().
+      end: Offset after the last line. Default: end of file.
+      block_size: Size of blocks in which line boundaries are searched.
+    Yields:
+      (offset, lines): lines is a list of lines without their line terminators, offset is the offset of the first one.
+                       Offset of each next line is offset + len(line) + 1.
+    """
+    with open(path, 'rb') as input_file:
+        size = os.fstat(input_file.fileno()).st_size
+        if end is None or end > size:
+            end = size
+        if start >= end:
+            return
+        try:
+            data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            data = None
+
+        if data is not None:
+            try:
+                for batch in _iter_mapped_batches(data, start, end, block_size):
+                    yield batch
+            finally:
+                data.close()
+        else:
+            input_file.seek(start)
+            for batch in _iter_read_batches(input_file, start, end, block_size):
+                yield batch
+
+
+def get_complete_size(path, block_size=BLOCK_SIZE):
+    """ Return the offset after the last line terminator of a file, i.e. its size without a partial last line.
+    A file which is still being appended to may end with a line which is not completely written yet.
+    """
+    with open(path, 'rb') as input_file:
+        end = os.fstat(input_file.fileno()).st_size
+        while end > 0:
+            start = max(end - block_size, 0)
+            input_file.seek(start)
+            cut = input_file.read(end - start).rfind(b'\n')
+            if cut >= 0:
+                return start + cut + 1
+            end = start
+    return 0
+
+
+def _iter_mapped_batches(data, start, end, block_size):
+    """ Find line boundaries of a memory-mapped file. """
+    position = start
+    while position < end:
+        block_end = min(position + block_size, end)
+        cut = data.rfind(b'\n', position, block_end)
+        while cut < 0 and block_end < end:
+            # No line boundary in the block: the line is longer than a block, search a larger one.
+            block_end = min(block_end + block_size, end)
+            cut = data.rfind(b'\n', position, block_end)
+        if cut < 0 or block_end == end:
+            cut = end if data[end - 1:end] != b'\n' else end - 1
+        yield position, data[position:cut].split(b'\n')
+        position = cut + 1
+
+
+def _iter_read_batches(input_file, start, end, block_size):
+    """ Find line boundaries of a file read in binary blocks. The partial last line of a block is carried over. """
+    position = start
+    pending = b''
+    while position < end:
+        block = input_file.read(min(block_size, end - position))
+        if not block:
+            break
+        position += len(block)
+        block = pending + block
+        cut = block.rfind(b'\n')
+        if cut < 0:
+            pending = block
+            continue
+        pending = block[cut + 1:]
+        yield position - len(pending) - cut - 1, block[:cut].split(b'\n')
+    if pending:
+        yield position - len(pending), [pending]
@@ -0,0 +1,154 @@
+"""
+This module is the checkpoint module.
+The FEC publishes incremental updates of itcont.txt, so the whole state of a handler can be saved after a run and loaded
+back before the next one, which then only has to process the new tail of the input file.
+
+A checkpoint is a binary file made of a header followed by arrays, each one written as
+   typecode (1 byte) | number of items (8 bytes) | items written by array.tofile()
+so it is loaded with array.fromfile() instead of being parsed. Arrays are stored in the native byte order, so a
+checkpoint is meant to be loaded on the same kind of machine it was saved on.
+   header:        magic | version | percentile | offset of the first unprocessed byte of the input file
+   key encoder:   committee IDs and zipcodes, in order of their IDs. Each table is made of an array of field lengths and
+                  an array of the concatenated fields.
+   donors:        arrays of donor keys and years of the first donation (donation_date).
+   contributions: arrays of committee IDs, zipcode IDs, years, total amounts and numbers of distinct amounts of each
+                  contribution, followed by the arrays of their distinct amounts and numbers of occurrences.
+"""
+
+from array import array
+import os
+import struct
+
+from countedlist import countedlist
+from key_encoder import ZIPCODE_BITS, YEAR_BITS, ZIPCODE_MASK, YEAR_MASK, INT64
+from percentile import percentiletracker
+
+MAGIC = b'DACK'
+VERSION = 2
+HEADER = struct.Struct('<4sHdq')
+ARRAY_LENGTH = struct.Struct('<q')
+
+
+def save(path, percentile, offset, key_encoder, donation_date, contribution_info):
+    """ Save the state of a handler into a checkpoint file.
+    The file is written next to its final path first and then renamed, so a crash never leaves a truncated checkpoint.
+    Args:
+      path: The path of checkpoint file.
+      percentile: (Float) Given percentile, which the trackers of contributions are built for.
+      offset: Offset of the first byte of the input file which has not been processed.
+      key_encoder: KeyEncoder which gave the IDs used in keys.
+      donation_date: Dictionary of { donor key : year } of the handler.
+      contribution_info: Dictionary of { contribution key : { "total_amt" : float, "transactions" : percentiletracker } } of the handler.
+    """
+    temp_path = path + '.tmp'
+    checkpoint_file = open(temp_path, 'wb')
+    try:
+        checkpoint_file.write(HEADER.pack(MAGIC, VERSION, percentile, offset))
+
+        for table in (key_encoder.cmte_ids, key_encoder.zipcodes):
+            _write_fields(checkpoint_file, table)
+
+        # donation_date can be a DonorIndex or a SpilledDict, which are only iterated by items().
+        donors = (array(INT64), array('i'))
+        for key, year in donation_date.items():
+            donors[0].append(key)
+            donors[1].append(year)
+        for column in donors:
+            _write_array(checkpoint_file, column)
+
+        contributions = (array('i'), array('i'), array('i'), array('d'), array('i'))
+        amounts = (array('d'), array('l'))
+        for key, contribution in contribution_info.items():
+            transactions = contribution["transactions"].transactions
+            contributions[0].append(key >> (YEAR_BITS + ZIPCODE_BITS))
+            contributions[1].append((key >> YEAR_BITS) & ZIPCODE_MASK)
+            contributions[2].append(key & YEAR_MASK)
+            contributions[3].append(contribution["total_amt"])
+            contributions[4].append(transactions.distinct())
+            for values, counts in zip(transactions.values, transactions.counts):
+                amounts[0].extend(values)
+                amounts[1].extend(counts)
+        for column in contributions + amounts:
+            _write_array(checkpoint_file, column)
+    finally:
+        checkpoint_file.close()
+    os.rename(temp_path, path)
+
+
+def load(path, key_encoder, percentile, text_fields=False):
+    """ Load the state of a handler from a checkpoint file.
+    Args:
+      path: The path of checkpoint file.
+      key_encoder: Empty KeyEncoder, which is filled with the IDs used in keys.
+      percentile: (Float) Given percentile. It has to be the one the checkpoint was saved with.
+      text_fields: True if the fields are interned as strings by the parser (strict parser), False if as bytes.
+    Returns:
+      (offset, donation_date, contribution_info). Offset is the one of the first byte of the input file which has not been processed.
+    """
+    checkpoint_file = open(path, 'rb')
+    try:
+        magic, version, saved_percentile, offset = HEADER.unpack(checkpoint_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a checkpoint file.' % path)
+        if saved_percentile != percentile:
+            raise ValueError('The checkpoint was saved with percentile %s, not %s.' % (saved_percentile, percentile))
+
+        for table in (key_encoder.cmte_ids, key_encoder.zipcodes):
+            for field in _read_fields(checkpoint_file, text_fields):
+                # Looking up a new field gives it the next ID, which is the one it was saved with.
+                table[field]
+
+        donors, years = [_read_array(checkpoint_file) for _ in range(2)]
+        donation_date = dict(zip(donors, years))
+
+        cmte_id_ids, zipcode_ids, years, total_amts, distincts = [_read_array(checkpoint_file) for _ in range(5)]
+        values, counts = [_read_array(checkpoint_file) for _ in range(2)]
+        contribution_info = {}
+        start = 0
+        for cmte_id_id, zipcode_id, year, total_amt, distinct in zip(cmte_id_ids, zipcode_ids, years, total_amts, distincts):
+            transactions = countedlist.fromitems(values[start:start + distinct], counts[start:start + distinct])
+            start += distinct
+            key = (((cmte_id_id << ZIPCODE_BITS) | zipcode_id) << YEAR_BITS) | year
+            contribution_info[key] = {"total_amt": total_amt, "transactions": percentiletracker(percentile, transactions)}
+    finally:
+        checkpoint_file.close()
+    return offset, donation_date, contribution_info
+
+
+def _write_array(checkpoint_file, items):
+    checkpoint_file.write(items.typecode.encode('ascii'))
+    checkpoint_file.write(ARRAY_LENGTH.pack(len(items)))
+    items.tofile(checkpoint_file)
+
+
+def _read_array(checkpoint_file):
+    items = array(str(checkpoint_file.read(1).decode('ascii')))
+    length, = ARRAY_LENGTH.unpack(checkpoint_file.read(ARRAY_LENGTH.size))
+    items.fromfile(checkpoint_file, length)
+    return items
+
+
+def _write_fields(checkpoint_file, table):
+    """ Write the fields of an InternTable in order of their IDs. """
+    fields = [None] * len(table)
+    for field, field_id in table.items():
+        if not isinstance(field, bytes):
+            field = field.encode('utf-8')
+        fields[field_id] = field
+    _write_array(checkpoint_file, array('i', [len(field) for field in fields]))
+    _write_array(checkpoint_file, array('B', b''.join(fields)))
+
+
+def _read_fields(checkpoint_file, text_fields):
+    lengths = _read_array(checkpoint_file)
+    data = _read_array(checkpoint_file)
+    data = data.tostring() if bytes is str else data.tobytes()
+    fields = []
+    start = 0
+    for length in lengths:
+        field = data[start:start + length]
+        if text_fields and bytes is not str:
+            field = field.decode('utf-8')
+        fields.append(field)
+        start += length
+    return fields
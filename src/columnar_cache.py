@@ -0,0 +1,230 @@
+"""
+This module is the columnar cache module, which lets re-runs over the same input file skip parsing it.
+The first run with a cache parses the input file once and writes its valid records into a cache file next to it, by
+columns. Later runs check that the input file has not changed and read the columns from the cache, which is
+memory-mapped, so only the pages of the columns are read and no line is split, decoded or validated again.
+
+A cache is a binary file made of a header followed by arrays, each one written as
+   typecode (1 byte) | number of items (8 bytes) | items written by array.tofile()
+like a checkpoint. Arrays are stored in the native byte order, so a cache is meant to be read on the machine it was
+written on.
+   header:  magic | version | size, mtime and digest of the input file | parser | number of lines | number of records
+   fields:  committee IDs and zipcodes, in order of their IDs. Each table is made of an array of field lengths and an
+            array of the concatenated fields. Donors are only compared, so only their keys are kept.
+   columns: offsets of the lines of records, committee IDs, zipcode IDs, donor keys, years and amounts of records.
+The digest is a SHA-1 of the first and last DIGEST_SIZE bytes of the input file, so that checking a cache does not
+cost a read of the whole input file. Together with its size and mtime, it tells whether the input file has changed.
+"""
+
+from array import array
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+
+import bulk_reader as BulkReader
+from distilled_data import DistilledBatch
+from key_encoder import KeyEncoder, INT64
+
+MAGIC = b'DACC'
+VERSION = 2
+HEADER = struct.Struct('<4sHqd20s8sqq')
+ARRAY_HEADER = struct.Struct('<cq')
+
+# Number of bytes hashed at each end of the input file.
+DIGEST_SIZE = 64 * 1024
+
+# Extension of cache files written next to their input file.
+EXTENSION = '.dacache'
+
+# Typecodes of columns, in the order they are written.
+COLUMNS = (('offsets', INT64), ('cmte_ids', 'i'), ('zipcodes', 'i'), ('names', INT64), ('transaction_years', 'h'), ('transaction_amts', 'd'))
+
+
+def get_cache_path(input_path, cache_path=None):
+    """ Return the path of the cache of an input file: the given one, or the input path followed by EXTENSION. """
+    return cache_path or input_path + EXTENSION
+
+
+def input_key(input_path):
+    """ Return (size, mtime, digest) of an input file, which identify its content. """
+    size = os.path.getsize(input_path)
+    digest = hashlib.sha1()
+    with open(input_path, 'rb') as input_file:
+        digest.update(input_file.read(DIGEST_SIZE))
+        if size > DIGEST_SIZE:
+            input_file.seek(max(size - DIGEST_SIZE, DIGEST_SIZE))
+            digest.update(input_file.read(DIGEST_SIZE))
+    return size, os.path.getmtime(input_path), digest.digest()
+
+
+def build(input_path, cache_path, parse_lines, parser_name):
+    """ Parse an input file and write its valid records into a cache file.
+    Columns are written into temporary files one batch at a time, and then copied after the header and the fields, so
+    only the interned fields are kept in memory. The cache is renamed into place at the end, so a crash never leaves a
+    truncated cache.
+    Args:
+      input_path: The path of input file.
+      cache_path: The path of cache file.
+      parse_lines: Parser of lines given by BulkReader, e.g. donation_analytics.parse_lines_fast().
+      parser_name: Name of the parser, recorded in the header.
+    """
+    size, mtime, digest = input_key(input_path)
+    # Fields are interned as the parser gives them, and encoded when they are written.
+    key_encoder = KeyEncoder()
+    temp_path = cache_path + '.tmp'
+    column_paths = ['%s.%d' % (temp_path, index) for index in range(len(COLUMNS))]
+    column_files = [open(column_path, 'wb') for column_path in column_paths]
+    lines = 0
+    records = 0
+    try:
+        for offset, batch_lines in BulkReader.iter_line_batches(input_path):
+            batch = DistilledBatch(key_encoder)
+            parse_lines(offset, batch_lines, batch)
+            lines += len(batch_lines)
+            records += len(batch)
+            for column_file, (name, typecode) in zip(column_files, COLUMNS):
+                array(typecode, getattr(batch, name)).tofile(column_file)
+        for column_file in column_files:
+            column_file.close()
+
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(HEADER.pack(MAGIC, VERSION, size, mtime, digest, parser_name.encode('ascii'), lines, records))
+            for table in (key_encoder.cmte_ids, key_encoder.zipcodes):
+                _write_fields(cache_file, table)
+            for column_path, (_, typecode) in zip(column_paths, COLUMNS):
+                cache_file.write(ARRAY_HEADER.pack(typecode.encode('ascii'), records))
+                with open(column_path, 'rb') as column_file:
+                    shutil.copyfileobj(column_file, cache_file)
+        os.rename(temp_path, cache_path)
+    finally:
+        for column_file, column_path in zip(column_files, column_paths):
+            column_file.close()
+            if os.path.isfile(column_path):
+                os.remove(column_path)
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+
+def _write_fields(cache_file, table):
+    """ Write the fields of an InternTable in order of their IDs. """
+    fields = [None] * len(table)
+    for field, field_id in table.items():
+        if not isinstance(field, bytes):
+            field = field.encode('utf-8')
+        fields[field_id] = field
+    lengths = array('i', [len(field) for field in fields])
+    cache_file.write(ARRAY_HEADER.pack(b'i', len(lengths)))
+    lengths.tofile(cache_file)
+    data = b''.join(fields)
+    cache_file.write(ARRAY_HEADER.pack(b'B', len(data)))
+    cache_file.write(data)
+
+
+class ColumnarCache(object):
+    """ Cache file of the valid records of an input file, memory-mapped.
+
+    Attributes:
+      path: The path of cache file.
+      key: (size, mtime, digest) of the input file it was written from, see input_key().
+      parser_name: Name of the parser it was written with.
+      lines: Number of lines of the input file.
+      records: Number of valid records.
+      data: mmap of the cache file.
+      fields: Tuple of the lists of committee IDs and zipcodes, as bytes, in order of their IDs.
+      columns: Dictionary of { column name : (typecode, offset of its first item in the cache file) }.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as cache_file:
+            self.data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack(self.data[:HEADER.size])
+        self.key = header[2:5]
+        self.parser_name = header[5].rstrip(b'\0').decode('ascii')
+        self.lines, self.records = header[6:8]
+        self.columns = {}
+        if header[0] != MAGIC or header[1] != VERSION:
+            self.close()
+            raise ValueError('%s is not a cache file.' % path)
+
+        position = HEADER.size
+        fields = []
+        for _ in range(2):
+            position, lengths = self._read_array(position)
+            position, data = self._read_array(position)
+            table = []
+            start = 0
+            for length in lengths:
+                table.append(data[start:start + length])
+                start += length
+            fields.append(table)
+        self.fields = tuple(fields)
+        for name, typecode in COLUMNS:
+            self.columns[name] = (typecode, position + ARRAY_HEADER.size)
+            position = self._skip_array(position)
+
+    @classmethod
+    def open(cls, input_path, cache_path, parser_name):
+        """ Return the ColumnarCache of an input file, or None if there is none or if it is stale. """
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            cache = cls(cache_path)
+        except (ValueError, struct.error):
+            return None
+        if cache.key != input_key(input_path) or cache.parser_name != parser_name:
+            cache.close()
+            return None
+        return cache
+
+    def load_fields(self, key_encoder, text_fields=False):
+        """ Intern the committee IDs and zipcodes into an empty KeyEncoder, so that they are given their IDs in the cache.
+        text_fields: True if the fields are interned as strings by the parser (strict parser), False if as bytes.
+        """
+        for table, fields in zip((key_encoder.cmte_ids, key_encoder.zipcodes), self.fields):
+            for field in fields:
+                if text_fields and bytes is not str:
+                    field = field.decode('utf-8')
+                # Looking up a new field gives it the next ID, which is the one it was cached with.
+                table[field]
+
+    def iter_batches(self, key_encoder, batch_size):
+        """ Iterate the records as DistilledBatches of batch_size records.
+        Each column of a batch is copied out of the mapped file at once, into an array of the typecode of the column.
+        """
+        for start in range(0, self.records, batch_size):
+            end = min(start + batch_size, self.records)
+            batch = DistilledBatch(key_encoder)
+            for name, (typecode, position) in self.columns.items():
+                column = array(typecode)
+                itemsize = column.itemsize
+                chunk = self.data[position + start * itemsize:position + end * itemsize]
+                if bytes is str:
+                    column.fromstring(chunk)
+                else:
+                    column.frombytes(chunk)
+                setattr(batch, name, column)
+            yield batch
+
+    def close(self):
+        self.data.close()
+
+    def _read_array(self, position):
+        """ Return (position after it, array or bytes) of the array at position. """
+        typecode, length = ARRAY_HEADER.unpack(self.data[position:position + ARRAY_HEADER.size])
+        position += ARRAY_HEADER.size
+        if typecode == b'B':
+            return position + length, self.data[position:position + length]
+        items = array(str(typecode.decode('ascii')))
+        end = position + length * items.itemsize
+        if bytes is str:
+            items.fromstring(self.data[position:end])
+        else:
+            items.frombytes(self.data[position:end])
+        return end, items
+
+    def _skip_array(self, position):
+        """ Return the position after the array at position. """
+        typecode, length = ARRAY_HEADER.unpack(self.data[position:position + ARRAY_HEADER.size])
+        return position + ARRAY_HEADER.size + length * array(str(typecode.decode('ascii'))).itemsize
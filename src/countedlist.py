@@ -0,0 +1,209 @@
+# Sorted multiset with random access, stored as counted blocks.
+#
+# This is the compact replacement of the AVL tree for transaction amounts. Instead of one
+# Python object per donation, distinct amounts are kept in sorted 'array' blocks along
+# with the number of times each amount occurred, so repeated amounts (which are very
+# common in FEC data, e.g. 100, 250, 1000) cost nothing more than an increment.
+# The number of elements stored in every block is indexed by a Fenwick tree, so the
+# element of a given rank is found with an O(log n) loop, no recursion involved.
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class countedlist(object):
+
+    # Blocks are split in two when they hold more than twice this number of distinct values.
+    BLOCK_LOAD = 64
+
+    def __init__(self, lst=None):
+        self.clear()
+        if lst is not None:
+            self.extend(lst)
+
+
+    @classmethod
+    def fromitems(cls, values, counts):
+        """ Build a countedlist from sorted distinct values and their numbers of occurrences, in O(n). """
+        result = cls()
+        load = cls.BLOCK_LOAD
+        for start in range(0, len(values), load):
+            result.values.append(array('d', values[start:start + load]))
+            result.counts.append(array('l', counts[start:start + load]))
+            result.maxes.append(result.values[-1][-1])
+        result.size = sum(counts)
+        result._rebuild_index()
+        return result
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __getitem__(self, index):
+        if index < 0 or index >= self.size:
+            raise IndexError()
+        block_index, index = self._locate(index)
+        counts = self.counts[block_index]
+        i = 0
+        while index >= counts[i]:
+            index -= counts[i]
+            i += 1
+        return self.values[block_index][i]
+
+
+    def append(self, val):
+        self.size += 1
+        if not self.values:
+            self.values.append(array('d', [val]))
+            self.counts.append(array('l', [1]))
+            self.maxes.append(val)
+            self._rebuild_index()
+            return
+
+        # Find the block which should contain the value. Values greater than every stored
+        # value go to the last block.
+        block_index = bisect_left(self.maxes, val)
+        if block_index == len(self.maxes):
+            block_index -= 1
+            self.maxes[block_index] = val
+        values = self.values[block_index]
+        counts = self.counts[block_index]
+
+        i = bisect_left(values, val)
+        if i < len(values) and values[i] == val:
+            counts[i] += 1
+        else:
+            values.insert(i, val)
+            counts.insert(i, 1)
+
+        if len(values) > 2 * countedlist.BLOCK_LOAD:
+            self._split(block_index)
+        else:
+            self._index_add(block_index, 1)
+
+
+    def extend(self, lst):
+        for val in lst:
+            self.append(val)
+
+
+    def clear(self):
+        self.values = []  # Sorted distinct values, one 'array' per block.
+        self.counts = []  # Occurrences of each value in self.values, one 'array' per block.
+        self.maxes  = []  # The greatest value of each block, used to find the block of a value.
+        self.index  = []  # Fenwick tree over the number of elements stored in each block.
+        self.size   = 0
+
+
+    def count(self, val):
+        """ Return the number of occurrences of a value. """
+        block_index = bisect_left(self.maxes, val)
+        if block_index == len(self.maxes):
+            return 0
+        values = self.values[block_index]
+        i = bisect_left(values, val)
+        if i < len(values) and values[i] == val:
+            return self.counts[block_index][i]
+        return 0
+
+
+    def lower(self, val):
+        """ Return (value, count) of the greatest value less than the given one, or None. """
+        if not self.values:
+            return None
+        block_index = bisect_left(self.maxes, val)
+        if block_index == len(self.maxes):
+            block_index -= 1
+        i = bisect_left(self.values[block_index], val)
+        if i == 0:
+            if block_index == 0:
+                return None
+            block_index -= 1
+            i = len(self.values[block_index])
+        return self.values[block_index][i - 1], self.counts[block_index][i - 1]
+
+
+    def higher(self, val):
+        """ Return (value, count) of the least value greater than the given one, or None. """
+        block_index = bisect_right(self.maxes, val)
+        if block_index == len(self.maxes):
+            return None
+        i = bisect_right(self.values[block_index], val)
+        return self.values[block_index][i], self.counts[block_index][i]
+
+
+    def min(self):
+        """ Return the least value, or None. """
+        return self.values[0][0] if self.values else None
+
+
+    def max(self):
+        """ Return the greatest value, or None. """
+        return self.maxes[-1] if self.maxes else None
+
+
+    def distinct(self):
+        """ Return the number of distinct values. """
+        return sum(len(values) for values in self.values)
+
+
+    def items(self):
+        """ Iterate (value, count) pairs in ascending order of value. """
+        for values, counts in zip(self.values, self.counts):
+            for i in range(len(values)):
+                yield values[i], counts[i]
+
+
+    def __iter__(self):
+        for val, count in self.items():
+            for _ in range(count):
+                yield val
+
+
+    def __str__(self):
+        return "[" + ", ".join(str(x) for x in self) + "]"
+
+
+    # Returns (block index, rank of the element inside that block) of the element at the given rank.
+    def _locate(self, index):
+        tree = self.index
+        pos = 0
+        step = 1
+        while step * 2 <= len(tree):
+            step *= 2
+        while step:
+            nxt = pos + step
+            if nxt <= len(tree) and tree[nxt - 1] <= index:
+                pos = nxt
+                index -= tree[nxt - 1]
+            step //= 2
+        return pos, index
+
+
+    def _index_add(self, block_index, delta):
+        tree = self.index
+        i = block_index + 1
+        while i <= len(tree):
+            tree[i - 1] += delta
+            i += i & -i
+
+
+    def _split(self, block_index):
+        values = self.values[block_index]
+        counts = self.counts[block_index]
+        half = len(values) // 2
+        self.values[block_index:block_index + 1] = [values[:half], values[half:]]
+        self.counts[block_index:block_index + 1] = [counts[:half], counts[half:]]
+        self.maxes[block_index:block_index + 1] = [values[half - 1], values[-1]]
+        self._rebuild_index()
+
+
+    # Builds the Fenwick tree of block sizes in O(number of blocks).
+    def _rebuild_index(self):
+        tree = [sum(counts) for counts in self.counts]
+        for i in range(1, len(tree) + 1):
+            parent = i + (i & -i)
+            if parent <= len(tree):
+                tree[parent - 1] += tree[i - 1]
+        self.index = tree
@@ -0,0 +1,61 @@
+"""
+This module defines the internal data format, which is shared by Input Module and Handler Module.
+"""
+
+from array import array
+from collections import namedtuple
+
+from key_encoder import donor_key, INT64
+
+# A distilled record.
+DistilledData = namedtuple('DistilledData', ['cmte_id', 'zipcode', 'name', 'transaction_year', 'transaction_amt'])
+
+
+class DistilledBatch(object):
+    """ A batch of distilled records, handed to handlers at once. Records are stored by columns.
+
+    Attributes:
+      key_encoder: KeyEncoder interning recipients and zipcodes, or None to keep them as strings.
+      offsets: List of byte offsets of the line of each record in the input file.
+      cmte_ids: List of recipients, or array of their IDs given by key_encoder.
+      zipcodes: List of 5-digit zipcodes, or array of their IDs given by key_encoder.
+      names: List of donor names, or array of donor keys (see key_encoder.donor_key()) when there is a key_encoder.
+      transaction_years: array of transaction years.
+      transaction_amts: array of transaction amounts.
+    """
+    __slots__ = ('key_encoder', 'offsets', 'cmte_ids', 'zipcodes', 'names', 'transaction_years', 'transaction_amts')
+
+    def __init__(self, key_encoder=None):
+        self.key_encoder = key_encoder
+        self.offsets = []
+        if key_encoder is None:
+            self.cmte_ids = []
+            self.zipcodes = []
+            self.names = []
+        else:
+            self.cmte_ids = array(INT64)
+            self.zipcodes = array(INT64)
+            self.names = array(INT64)
+        self.transaction_years = array('l')
+        self.transaction_amts = array('d')
+
+    def __len__(self):
+        return len(self.cmte_ids)
+
+    def append(self, offset, data):
+        """ Append a DistilledData. """
+        self.offsets.append(offset)
+        if self.key_encoder is None:
+            self.cmte_ids.append(data.cmte_id)
+            self.zipcodes.append(data.zipcode)
+            self.names.append(data.name)
+        else:
+            self.cmte_ids.append(self.key_encoder.cmte_ids[data.cmte_id])
+            self.zipcodes.append(self.key_encoder.zipcodes[data.zipcode])
+            self.names.append(donor_key(data.name, data.zipcode))
+        self.transaction_years.append(data.transaction_year)
+        self.transaction_amts.append(data.transaction_amt)
+
+    def records(self):
+        """ Iterate records as (cmte_id, zipcode, name, transaction_year, transaction_amt). """
+        return zip(self.cmte_ids, self.zipcodes, self.names, self.transaction_years, self.transaction_amts)
@@ -5,24 +5,56 @@ Briefly explain my program:
 In logic, I devided the entire program into 3 parts:
 1) Frame part: here just the main function, which invokes other handlers, including read_file();
 2) Input Module: here just the read_file() function, which deals with the input data and transform the input data into internal data structure.
-   In this module, I use callback functions to invoke handlers. In this way, I can get the loose connection between Input Module and Handler Module.
+   In this module, I use callback functions to invoke handlers, with a batch of records at a time (see distilled_data.DistilledBatch). In this way, I can get the loose connection between Input Module and Handler Module.
 3) Hander Module which performs main functionality of this program.
    In this module, I implemented two kinds of methods: the first one(handler_single_thread) uses single thread while the second one(handler_multi_threads) uses multiple threads to let different threads be responsible for IO intensive and CPU intensive tasks.
 
 [PS]
 When calculating given percentile, it is neccesary to get the sorted data structure of transaction amount. So, why not use self-sorted data structure to store those transaction amount identified by 'CMTE_ID|ZIPCODE|YEAR'. Thus, I use AVL Tree as data struction of transaction amount.
+Since most donations share a handful of amounts, the AVL Tree has been replaced by countedlist, which keeps each distinct amount once along with its number of occurrences in sorted array blocks.
+Checkpoints are restored by building countedlists at once from sorted (amount, count) columns (see countedlist.fromitems()), so nothing uses the AVL Tree anymore, and it has been removed.
 """
 
 import argparse
 from datetime import datetime
+from multiprocessing import cpu_count
 import os
 import sys
 import time
 
+# I/O layer of Input Module
+import bulk_reader as BulkReader
+# Several input files parsed by worker processes
+import input_pool as InputPool
+# Internal data format
+from distilled_data import DistilledData, DistilledBatch
+from key_encoder import KeyEncoder, donor_key
+# Checkpoint of handler state
+import checkpoint as Checkpoint
+# Cache of parsed input
+import columnar_cache as ColumnarCache
+# Percentiles and statistics of contributions
+from group_statistics import GroupQuery, STATISTICS
+from quantile_sketch import LogQuantizer
+# Output stage of Handler Module
+from output_writer import FLUSH_SIZE, get_compression
+# Stages and counters of the multiple threads pipeline
+import pipeline as Pipeline
+# Counters, progress lines and profiling of runs
+from instrumentation import RunStats, write_reports
+from run_context import RunContext
+# Out-of-core handler state
+from spill_store import SpillStore
+# Compact index of donors
+from donor_index import DonorIndex
+# State and repeat donor logic of handlers
+from engine import Engine
 # Handler Module, Single Thread
-import handler_single_thread as HandlerSingleThread
+from handler_single_thread import SingleThreadHandler
 # Handler Module, Multiple Threads
-import handler_multi_threads as HandlerMultiThreads
+from handler_multi_threads import MultiThreadsHandler
+# Handler Module, Multiple Processes
+import handler_multi_processes as HandlerMultiProcesses
 
 # The position of specified columns in the input file.
 CMTE_ID_POSITION = 0
@@ -32,19 +64,88 @@ TRANSACTION_DT_POSITION = 13
 TRANSACTION_AMT_POSITION = 14
 OTHER_ID_POSITION = 15
 
+# Default number of records handed to handlers at once.
+BATCH_SIZE = 4096
+
+# Encoding of input data. Only the fields which are used are decoded.
+INPUT_ENCODING = 'utf-8'
+
+# Maximum day of each month, indexed by month number. February is checked for leap years separately.
+DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
 def get_args():
     """ Parse user auguments from command line. """
 
     usage_desc = """ Used for outputing information of political contributions and donors.  """
     parser = argparse.ArgumentParser(description=usage_desc)
 
-    parser.add_argument('-d', '--datainput', type = str, action = 'store', dest = 'data_input_path', default = '../input/itcont.txt', help = "Path to data input files.")
+    parser.add_argument('-d', '--datainput', type = str, nargs = '+', action = 'store', dest = 'data_input_paths', default = ['../input/itcont.txt'], help = "Paths or glob patterns of data input files, e.g. split files of a cycle. They are read one after the other in this order, and several ones are parsed by worker processes.")
     parser.add_argument('-p', '--percentileinput', type = str, action = 'store', dest = 'percentile_input_path', default = '../input/percentile.txt', help = "Path to percentile input files.")
     parser.add_argument('-o', '--output', type = str, action = 'store', dest = 'output_path', default = '../output/repeat_donors.txt', help = "Path to put output files.")
-    parser.add_argument('-m', '--mode', type = str, action = 'store', dest = 'mode', default = 'single', help = "Mode: multi | single | both")
+    parser.add_argument('-m', '--mode', type = str, action = 'store', dest = 'mode', default = 'single', choices = ['single', 'multi', 'both', 'parallel', 'stream'], help = "Mode: multi | single | both | parallel | stream")
+    parser.add_argument('-P', '--parser', type = str, action = 'store', dest = 'parser', default = 'fast', choices = ['fast', 'strict'], help = "Parser: fast | strict")
+    parser.add_argument('-j', '--jobs', type = int, action = 'store', dest = 'jobs', default = 0, help = "Number of worker processes in parallel mode, or parsing several input files. Default: number of CPUs.")
+    parser.add_argument('-b', '--batchsize', type = int, action = 'store', dest = 'batch_size', default = BATCH_SIZE, help = "Number of records handed to handlers at once.")
+    parser.add_argument('-l', '--listen', type = str, action = 'store', dest = 'listen_address', default = '-', help = "Feed of stream mode: - (standard input, output lines go to standard output), tcp:HOST:PORT or unix:PATH (output lines go back to each client).")
+    parser.add_argument('--linger', type = float, action = 'store', dest = 'linger', default = 10, help = "In stream mode, maximum number of milliseconds a batch waits for more lines before it is handled.")
+    parser.add_argument('-c', '--checkpoint', type = str, action = 'store', dest = 'checkpoint_path', default = None, help = "Path to checkpoint file. If it exists, the state is restored from it and only new input is processed, appending to the output file. The state is saved to it at the end.")
+    parser.add_argument('-k', '--cache', action = 'store_true', dest = 'use_cache', default = False, help = "Read the valid records of the input file from a columnar cache, which is written by the first run and rewritten whenever the input file changes.")
+    parser.add_argument('--cache-path', type = str, action = 'store', dest = 'cache_path', default = None, help = "Path of the cache file of --cache. Default: next to the input file, with a %s extension." % ColumnarCache.EXTENSION)
+    parser.add_argument('-s', '--statistics', type = str, action = 'store', dest = 'statistics', default = '', help = "Comma-separated statistics appended to output lines: %s." % ' | '.join(STATISTICS))
+    parser.add_argument('-a', '--approximate', type = float, action = 'store', dest = 'relative_error', default = None, help = "Approximate percentiles within this relative error (e.g. 0.01), keeping a bounded number of amounts per recipient. Totals and counts stay exact.")
+    parser.add_argument('-F', '--flush-size', type = int, action = 'store', dest = 'flush_size', default = FLUSH_SIZE, help = "Number of bytes of output lines collected before a write.")
+    parser.add_argument('-z', '--compress', type = str, action = 'store', dest = 'compression', default = None, choices = ['none', 'gzip', 'bz2', 'lzma'], help = "Compression of output file. Default: given by its extension (.gz, .bz2, .xz), otherwise none.")
+    parser.add_argument('-M', '--memory-budget', type = float, action = 'store', dest = 'memory_budget', default = None, help = "Memory budget of donors and contributions, in MB. Least recently used ones are spilled to disk beyond it. Default: no limit.")
+    parser.add_argument('-D', '--donor-index', action = 'store_true', dest = 'donor_index', default = False, help = "Keep the earliest year of donors in a compact index partitioned by zipcode, instead of a dictionary.")
+    parser.add_argument('--spill-dir', type = str, action = 'store', dest = 'spill_dir', default = None, help = "Directory of the spill files of --memory-budget, or of the spool files of parallel mode. Default: the system temporary directory.")
+    parser.add_argument('--stats', type = str, action = 'store', dest = 'stats_path', default = None, help = "Path of a JSON report of counters of the run: rejected lines by reason, first-time and repeat donations, contributions, sizes of amounts, bytes written and time of each stage. '-' prints it.")
+    parser.add_argument('--progress', type = float, action = 'store', dest = 'progress_interval', default = None, help = "Print a progress line on stderr every this number of seconds.")
+    parser.add_argument('--profile', type = str, action = 'store', dest = 'profile_path', default = None, help = "Run cProfile and dump its statistics into this file, for pstats.")
+    parser.add_argument('--tracemalloc', type = int, action = 'store', dest = 'tracemalloc_top', default = None, help = "Trace memory allocations and add the peak and this number of largest allocation sites to the report (Python 3).")
     parser.add_argument('-V', action = 'store_true', dest = 'verbose', default = False, help = "Enable the display of running time.")
 
     args = parser.parse_args()
+    patterns = args.data_input_paths
+    args.data_input_paths = InputPool.expand_inputs(patterns)
+    if not args.data_input_paths:
+        parser.error('No data input file matches %s.' % ' '.join(patterns))
+    args.data_input_path = args.data_input_paths[0]
+    if len(args.data_input_paths) > 1 and (args.checkpoint_path or args.use_cache):
+        parser.error('Checkpoints and the cache only support one data input file.')
+    args.statistics = [statistic for statistic in args.statistics.split(',') if statistic]
+    for statistic in args.statistics:
+        if statistic not in STATISTICS:
+            parser.error('Unknown statistic %s. Statistics are: %s.' % (statistic, ', '.join(STATISTICS)))
+    if args.checkpoint_path and args.mode not in ('single', 'multi'):
+        parser.error('Checkpoints are only supported in single and multi modes.')
+    if args.donor_index and (args.mode == 'parallel' or args.memory_budget is not None):
+        parser.error('The donor index is not supported in parallel mode, nor with a memory budget.')
+    if args.use_cache and (args.mode == 'parallel' or args.checkpoint_path):
+        parser.error('The cache is only supported in single, multi and both modes, without checkpoint.')
+    if args.memory_budget is not None and args.mode not in ('single', 'multi'):
+        parser.error('Memory budget is only supported in single and multi modes.')
+    if args.relative_error is not None and not 0 < args.relative_error < 1:
+        parser.error('The relative error of approximate percentiles should be between 0 and 1.')
+    if (args.stats_path or args.progress_interval or args.profile_path or args.tracemalloc_top) and args.mode == 'parallel':
+        parser.error('Statistics, progress and profiling are only supported in single, multi and both modes.')
+    if args.tracemalloc_top and sys.version_info[0] == 2:
+        parser.error('tracemalloc needs Python 3.')
+    compression = get_compression(args.output_path, args.compression)
+    if compression == 'lzma' and sys.version_info[0] == 2:
+        parser.error('lzma compression needs Python 3.')
+    if compression == 'bz2' and args.checkpoint_path and sys.version_info[0] == 2:
+        parser.error('Checkpoints with bz2 compression need Python 3, which appends to bz2 files.')
+    if args.memory_budget is not None and args.memory_budget <= 0:
+        parser.error('Memory budget should be positive.')
+    if args.mode == 'stream':
+        if sys.version_info[0] == 2:
+            parser.error('Stream mode needs Python 3.')
+        if args.checkpoint_path or args.memory_budget is not None or args.use_cache or args.stats_path or args.profile_path or args.tracemalloc_top:
+            parser.error('Checkpoints, memory budget, cache, statistics and profiling are not supported in stream mode.')
+        if args.listen_address != '-' and not args.listen_address.startswith(('tcp:', 'unix:')):
+            parser.error('Unknown address %s. Addresses are: -, tcp:HOST:PORT or unix:PATH.' % args.listen_address)
+        # Linger is given in milliseconds.
+        args.linger /= 1000.0
     return args
 
 def is_valid_date(date_str):
@@ -63,78 +164,513 @@ def is_number(s):
         return False
     return True
 
-def read_file(usrargs, handler):
-    """ Input Module.
-    This module is responsible for dealing with dirty input data, including santinizing input data and transform these data into internal data format.
+def parse_date_year(date_str):
+    """ Return the year of a date string in MMDDYYYY format, or None if it is not a valid date.
+    Well formed dates (8 digits) are checked with integer arithmetic. Anything else falls back to datetime.strptime(),
+    so exactly the same dates as is_valid_date() are accepted.
     """
-    input_data_file = open(usrargs.data_input_path, 'r')
-    input_percentile_file = open(usrargs.percentile_input_path, 'r')
+    if len(date_str) == 8:
+        try:
+            month = int(date_str[0:2])
+            day = int(date_str[2:4])
+            year = int(date_str[4:8])
+        except ValueError:
+            month = None
+        if month is not None and date_str.isdigit():
+            if month < 1 or month > 12 or day < 1 or day > DAYS_IN_MONTH[month] or year < 1:
+                return None
+            if month == 2 and day == 29 and (year % 4 != 0 or (year % 100 == 0 and year % 400 != 0)):
+                return None
+            return year
+    try:
+        return datetime.strptime(decode_field(date_str), '%m%d%Y').year
+    except ValueError:
+        return None
 
-    # Read the given percentile to be calculated
-    line = input_percentile_file.readline()
-    input_percentile_file.close()
-    if not is_number(line):
-        raise ValueError('Please give a number to indicate percentile.')
-    percentage = float(line)
+if bytes is str:
+    def decode_field(field):
+        """ Python 2 reads str, which needs no decoding. """
+        return field
 
-    # For each line of input data, santinize and transform it into internal format.
-    for line in input_data_file:
-        line_items = line.split('|')
+    def is_ascii(field):
+        """ Python 2 parsers both work on bytes, so fields never need to be cut as text. """
+        return True
+else:
+    def decode_field(field):
+        """ Decode a field of a line given by BulkReader. """
+        if isinstance(field, bytes):
+            return field.decode(INPUT_ENCODING, 'replace')
+        return field
+
+    if hasattr(bytes, 'isascii'):
+        is_ascii = bytes.isascii
+    else:
+        def is_ascii(field):
+            """ Return True if a field given by BulkReader only holds ASCII bytes, i.e. as many characters as bytes. """
+            return not field or max(bytearray(field)) < 0x80
+
+def parse_line_strict(line):
+    """ Santinize one line of input data and transform it into internal format. Return None if the record should be ignored. """
+    line_items = line.split('|')
+
+    # If the OTHER_ID column is NOT empty, ignore entire record.
+    if line_items[OTHER_ID_POSITION]:
+        return None
+    # If there is empty fields, ignore entire record.
+    if not line_items[CMTE_ID_POSITION] or not line_items[NAME_POSITION]:
+        return None
+    # If TRANSACTION_AMT column is invalid, ignore entire record.
+    if not line_items[TRANSACTION_AMT_POSITION] or not is_number(line_items[TRANSACTION_AMT_POSITION]):
+        return None
+    # If TRANSACTION_DT column is invalid, ignore entire record.
+    if not line_items[TRANSACTION_DT_POSITION] or not is_valid_date(line_items[TRANSACTION_DT_POSITION]):
+        return None
+    # If ZIPCODE column is invalid, ignore entire record.
+    if not line_items[ZIPCODE_POSITION] or len(line_items[ZIPCODE_POSITION]) < 5:
+        return None
+
+    return DistilledData(line_items[CMTE_ID_POSITION],
+                         line_items[ZIPCODE_POSITION][0:5],
+                         line_items[NAME_POSITION],
+                         datetime.strptime(line_items[TRANSACTION_DT_POSITION], '%m%d%Y').year,
+                         float(line_items[TRANSACTION_AMT_POSITION]))
 
-        # If the OTHER_ID column is NOT empty, ignore entire record.
+def parse_lines_strict(offset, lines, batch):
+    """ Santinize lines given by BulkReader with parse_line_strict() and append valid records to a DistilledBatch.
+    Args:
+      offset: Byte offset of the first line.
+      lines: List of lines, i.e. bytes without line terminator.
+      batch: DistilledBatch to append records to.
+    Returns:
+      Byte offset after the last line.
+    """
+    for line in lines:
+        distilled_data = parse_line_strict(decode_field(line) + '\n')
+        if distilled_data is not None:
+            batch.append(offset, distilled_data)
+        offset += len(line) + 1
+    return offset
+
+def parse_text_amount(amount):
+    """ Return the amount given by BulkReader parsed as text, or None if it is not a number. """
+    try:
+        return float(decode_field(amount))
+    except ValueError:
+        return None
+
+def cut_zipcode(zipcode):
+    """ Return the first 5 characters of a zipcode given by BulkReader, as bytes, or None if it has fewer.
+    Zipcodes holding multibyte characters are counted and cut as text, like parse_line_strict() does, so that a character is never cut in half.
+    """
+    if len(zipcode) < 5:
+        return None
+    if is_ascii(zipcode):
+        return zipcode[0:5]
+    zipcode = decode_field(zipcode)
+    if len(zipcode) < 5:
+        return None
+    return zipcode[0:5].encode(INPUT_ENCODING)
+
+def parse_lines_fast(offset, lines, batch):
+    """ Same as parse_lines_strict(), but cheaper.
+    Only the columns up to OTHER_ID are split and decoded, the date is checked by parse_date_year() and the amount is parsed once.
+    Valid records are appended to the columns of the batch directly, and interned by its KeyEncoder if any, in which case names are replaced by donor keys.
+    """
+    append_offset = batch.offsets.append
+    append_cmte_id = batch.cmte_ids.append
+    append_zipcode = batch.zipcodes.append
+    append_name = batch.names.append
+    append_year = batch.transaction_years.append
+    append_amount = batch.transaction_amts.append
+    key_encoder = batch.key_encoder
+    if key_encoder is not None:
+        cmte_ids = key_encoder.cmte_ids
+        zipcodes = key_encoder.zipcodes
+
+    for line in lines:
+        line_offset = offset
+        offset += len(line) + 1
+
+        line_items = line.split(b'|', OTHER_ID_POSITION + 1)
+        # The line terminator is not there, so a record ending at OTHER_ID is treated as if OTHER_ID held it, like parse_line_strict() does.
+        if len(line_items) <= OTHER_ID_POSITION + 1:
+            continue
+
+        # Same filters as parse_line_strict(), in the same order.
         if line_items[OTHER_ID_POSITION]:
             continue
-        # If there is empty fields, ignore entire record.
-        if not line_items[CMTE_ID_POSITION] or not line_items[NAME_POSITION]:
+        cmte_id = line_items[CMTE_ID_POSITION]
+        name = line_items[NAME_POSITION]
+        if not cmte_id or not name:
+            continue
+        amount = line_items[TRANSACTION_AMT_POSITION]
+        if not amount:
             continue
-        # If TRANSACTION_AMT column is invalid, ignore entire record.
-        if not line_items[TRANSACTION_AMT_POSITION] or not is_number(line_items[TRANSACTION_AMT_POSITION]):
+        try:
+            amount = float(amount)
+        except ValueError:
+            # float() only reads ASCII digits from bytes, while the strict parser also reads other Unicode digits.
+            amount = parse_text_amount(amount)
+            if amount is None:
+                continue
+        date = line_items[TRANSACTION_DT_POSITION]
+        if not date:
             continue
-        # If TRANSACTION_DT column is invalid, ignore entire record.
-        if not line_items[TRANSACTION_DT_POSITION] or not is_valid_date(line_items[TRANSACTION_DT_POSITION]):
+        year = parse_date_year(date)
+        if year is None:
             continue
-        # If ZIPCODE column is invalid, ignore entire record.
-        if not line_items[ZIPCODE_POSITION] or len(line_items[ZIPCODE_POSITION]) < 5:
-            continue;
+        zipcode = line_items[ZIPCODE_POSITION]
+        if len(zipcode) < 5:
+            continue
+        if is_ascii(zipcode):
+            zipcode = zipcode[0:5]
+        else:
+            zipcode = cut_zipcode(zipcode)
+            if zipcode is None:
+                continue
 
+        append_offset(line_offset)
+        if key_encoder is None:
+            append_cmte_id(decode_field(cmte_id))
+            append_zipcode(decode_field(zipcode))
+            append_name(decode_field(name))
+        else:
+            # Fields are interned as they are, so only new ones are decoded.
+            append_cmte_id(cmte_ids[cmte_id])
+            append_zipcode(zipcodes[zipcode])
+            append_name(donor_key(name, zipcode))
+        append_year(year)
+        append_amount(amount)
+    return offset
 
-        # I use dictionary as internal data format. For scalability, it can be modified to JSON format.
-        distilled_data = {"cmte_id" : line_items[CMTE_ID_POSITION],
-                          "zipcode" : line_items[ZIPCODE_POSITION][0:5],
-                          "name" : line_items[NAME_POSITION],
-                          "transaction_year" : datetime.strptime(line_items[TRANSACTION_DT_POSITION], '%m%d%Y').year,
-                          "transaction_amt" : float(line_items[TRANSACTION_AMT_POSITION])}
+def reject_reason(line):
+    """ Return the name of the filter of parse_lines_fast() which rejects a line given by BulkReader, or None if it is valid.
+    It is only called on rejected lines, to count them by reason.
+    """
+    line_items = line.split(b'|', OTHER_ID_POSITION + 1)
+    if len(line_items) <= OTHER_ID_POSITION + 1:
+        return 'columns'
+    if line_items[OTHER_ID_POSITION]:
+        return 'other_id'
+    if not line_items[CMTE_ID_POSITION]:
+        return 'cmte_id'
+    if not line_items[NAME_POSITION]:
+        return 'name'
+    if not line_items[TRANSACTION_AMT_POSITION] or parse_text_amount(line_items[TRANSACTION_AMT_POSITION]) is None:
+        return 'transaction_amt'
+    if not line_items[TRANSACTION_DT_POSITION] or parse_date_year(line_items[TRANSACTION_DT_POSITION]) is None:
+        return 'transaction_dt'
+    if cut_zipcode(line_items[ZIPCODE_POSITION]) is None:
+        return 'zipcode'
+    return None
 
-        # Invoke handlers to perform functionality on the data. This is a callback function.
-        handler(distilled_data, percentage, usrargs)
+# Parsers of lines given by BulkReader.
+PARSERS = {"fast": parse_lines_fast, "strict": parse_lines_strict}
+
+def read_percentiles(usrargs):
+    """ Read the given percentiles to be calculated. They are separated by commas, spaces or lines. """
+    input_percentile_file = open(usrargs.percentile_input_path, 'r')
+    items = input_percentile_file.read().replace(',', ' ').split()
+    input_percentile_file.close()
+    if not items or not all(is_number(item) for item in items):
+        raise ValueError('Please give numbers to indicate percentiles.')
+    return [float(item) for item in items]
+
+def read_percentile(usrargs):
+    """ Read the given percentile to be calculated, i.e. the first one. """
+    return read_percentiles(usrargs)[0]
+
+def read_query(usrargs):
+    """ Read the given percentiles and statistics to be calculated.
+    Returns:
+      GroupQuery, or None if output lines are the default ones (one exact percentile and no statistic).
+    """
+    relative_error = getattr(usrargs, 'relative_error', None)
+    query = GroupQuery(read_percentiles(usrargs), getattr(usrargs, 'statistics', []),
+                       LogQuantizer(relative_error) if relative_error else None)
+    return None if query.is_simple() else query
+
+def read_file(usrargs, handler, key_encoder=None, start=0, context=None, end=None):
+    """ Input Module.
+    This module is responsible for dealing with dirty input data, including santinizing input data and transform these data into internal data format.
+    Args:
+      usrargs: (Object) object of user defined arguments.
+      handler: Callback function of Handler Module.
+      key_encoder: KeyEncoder shared by all batches. Default: a new one.
+      start: Offset of the first line to read. Default: beginning of the input file.
+      context: RunContext of the run, telling whether blocks are read in a stage of their own and giving its RunStats.
+      end: Offset after the last line to read. Default: end of the input file.
+    Returns:
+      Offset after the last line which has been read.
+    """
+    batch_size = getattr(usrargs, 'batch_size', BATCH_SIZE)
+    parse_lines = PARSERS[getattr(usrargs, 'parser', 'fast')]
+    # Handlers identify donors and contributions by integer keys. The encoder is shared by all batches.
+    if key_encoder is None:
+        key_encoder = KeyEncoder(decode_field)
+    if context is None:
+        context = RunContext()
+
+    # The whole input can be read from its cache instead of being parsed.
+    if getattr(usrargs, 'use_cache', False) and start == 0:
+        return read_cache(usrargs, handler, key_encoder, batch_size, context.run_stats)
+    # Several input files are parsed by worker processes.
+    if len(getattr(usrargs, 'data_input_paths', [])) > 1:
+        return read_files(usrargs, handler, key_encoder, batch_size, context.run_stats)
+
+    # For each line of input data, santinize and transform it into internal format.
+    # Lines come in blocks of bytes from BulkReader, and records are handed to handlers in batches.
+    # In a pipeline, blocks are read ahead by a thread of their own, and the time spent parsing is counted.
+    # With a RunStats, lines, rejects and the time spent parsing and handling are counted.
+    blocks = BulkReader.iter_line_batches(usrargs.data_input_path, start, end)
+    run_stats = context.run_stats
+    parse_counter = None
+    if context.pipelined:
+        blocks = Pipeline.prefetch(blocks, 'read', count=lambda block: len(block[1]), counters=context.counters)
+        if run_stats is None:
+            parse_counter = Pipeline.StageCounter('parse', context.counters)
+    offset = start
+    for offset, lines in blocks:
+        for start in range(0, len(lines), batch_size):
+            batch = DistilledBatch(key_encoder)
+            if run_stats is not None:
+                start_time = time.time()
+                next_offset = parse_lines(offset, lines[start:start + batch_size], batch)
+                run_stats.count_lines(offset, lines[start:start + batch_size], batch, time.time() - start_time)
+                offset = next_offset
+            elif parse_counter is not None:
+                start_time = time.time()
+                offset = parse_lines(offset, lines[start:start + batch_size], batch)
+                parse_counter.add(min(batch_size, len(lines) - start), time.time() - start_time)
+            else:
+                offset = parse_lines(offset, lines[start:start + batch_size], batch)
+            if not len(batch):
+                continue
+
+            # Invoke handlers to perform functionality on the batch. This is a callback function.
+            if run_stats is not None:
+                start_time = time.time()
+                handler(batch)
+                run_stats.count_handled(len(batch), time.time() - start_time, offset)
+            else:
+                handler(batch)
+    if parse_counter is not None:
+        parse_counter.stop()
+    # The last line may have no line terminator.
+    return min(offset, end if end is not None else os.path.getsize(usrargs.data_input_path))
+
+def read_files(usrargs, handler, key_encoder, batch_size, run_stats=None):
+    """ Same as read_file(), but for several input files, which are parsed by worker processes (see input_pool).
+    Batches are handed to the handler in input order, i.e. in the order of files and of their lines.
+    Returns:
+      Total size of the input files.
+    """
+    parse_lines = PARSERS[getattr(usrargs, 'parser', 'fast')]
+    chunks = InputPool.iter_chunks(usrargs.data_input_paths, parse_lines, key_encoder, getattr(usrargs, 'jobs', 0), batch_size)
+    position = 0
+    while True:
+        # Time spent waiting for workers and interning fields is counted as parsing.
+        start_time = time.time()
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        lines, position, batches = chunk
+        if run_stats is not None:
+            run_stats.count_parsed(lines, sum(len(batch) for batch in batches), time.time() - start_time)
+        for batch in batches:
+            if run_stats is not None:
+                start_time = time.time()
+                handler(batch)
+                run_stats.count_handled(len(batch), time.time() - start_time, position)
+            else:
+                handler(batch)
+    return position
+
+def open_cache(usrargs):
+    """ Return the ColumnarCache of the input file. It is built first if there is none or if the input file has changed. """
+    parser_name = getattr(usrargs, 'parser', 'fast')
+    cache_path = ColumnarCache.get_cache_path(usrargs.data_input_path, getattr(usrargs, 'cache_path', None))
+    cache = ColumnarCache.ColumnarCache.open(usrargs.data_input_path, cache_path, parser_name)
+    if cache is None:
+        ColumnarCache.build(usrargs.data_input_path, cache_path, PARSERS[parser_name], parser_name)
+        cache = ColumnarCache.ColumnarCache.open(usrargs.data_input_path, cache_path, parser_name)
+        if cache is None:
+            raise ValueError('The input file has changed while its cache was written.')
+    return cache
+
+def read_cache(usrargs, handler, key_encoder, batch_size, run_stats=None):
+    """ Same as read_file(), but records are read from the ColumnarCache of the input file.
+    key_encoder has to be empty, so that committee IDs and zipcodes are given the IDs they were cached with.
+    Returns:
+      Size of the input file, i.e. the offset after its last line.
+    """
+    cache = open_cache(usrargs)
+    try:
+        cache.load_fields(key_encoder, getattr(usrargs, 'parser', 'fast') == 'strict')
+        batches = cache.iter_batches(key_encoder, batch_size)
+        while True:
+            start_time = time.time()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            if run_stats is not None:
+                run_stats.count_cached(len(batch), time.time() - start_time)
+                start_time = time.time()
+                handler(batch)
+                run_stats.count_handled(len(batch), time.time() - start_time, batch.offsets[-1])
+            else:
+                handler(batch)
+        if run_stats is not None:
+            run_stats.count_cache(cache)
+    finally:
+        cache.close()
+    return os.path.getsize(usrargs.data_input_path)
+
+def instrumented(usrargs):
+    """ Return True if runs are followed by a RunStats. """
+    return bool(getattr(usrargs, 'stats_path', None) or getattr(usrargs, 'progress_interval', None) or
+                getattr(usrargs, 'profile_path', None) or getattr(usrargs, 'tracemalloc_top', None))
+
+def new_donor_index(usrargs):
+    """ Return a new DonorIndex if it is asked for, otherwise None. """
+    if not getattr(usrargs, 'donor_index', False):
+        return None
+    return DonorIndex()
+
+def run_handler(usrargs, handler_class, query=None):
+    """ Run a handler module on the input file.
+    With a checkpoint file, the state of the handler is restored from it if it exists, only the input after the
+    checkpointed offset is read and output lines are appended to the output file. The state is saved back at the end.
+    A last line without line terminator may still be being written, so it is left for the next run.
+    With a memory budget, the state of the handler is kept in a SpillStore, which spills it to disk beyond the budget.
+    With a donor index, donors of the handler are kept in a DonorIndex instead of a dictionary.
+    With instrumentation, the run is followed by the RunStats of its context, whose report is built at the end.
+    Args:
+      usrargs: (Object) object of user defined arguments.
+      handler_class: Class of Handler Module, e.g. SingleThreadHandler, providing handler(), clean(), get_state() and set_state().
+      query: GroupQuery of extra percentiles and statistics given by read_query(), or None.
+    Returns:
+      RunContext of the run, holding its stage counters and RunStats.
+    """
+    key_encoder = KeyEncoder(decode_field)
+    context = RunContext(query)
+    handler = handler_class(usrargs, read_percentile(usrargs), context)
+    # Handlers running a pipeline want input blocks to be read in a stage of their own.
+    context.pipelined = getattr(handler, 'PIPELINED', False)
+    spill_store = None
+    if getattr(usrargs, 'memory_budget', None):
+        spill_store = SpillStore(usrargs.memory_budget, read_percentile(usrargs), usrargs.spill_dir)
+        handler.set_state(spill_store.donation_date, spill_store.contribution_info)
+    donor_index = new_donor_index(usrargs)
+    if donor_index is not None:
+        handler.set_state(donor_index, {})
+
+    try:
+        start = 0
+        end = BulkReader.get_complete_size(usrargs.data_input_path) if usrargs.checkpoint_path else None
+        if usrargs.checkpoint_path and os.path.isfile(usrargs.checkpoint_path):
+            start, donation_date, contribution_info = Checkpoint.load(usrargs.checkpoint_path, key_encoder, read_percentile(usrargs),
+                                                                     usrargs.parser == 'strict')
+            if start > os.path.getsize(usrargs.data_input_path):
+                raise ValueError('The input file is shorter than the checkpointed offset.')
+            if spill_store is not None:
+                spill_store.donation_date.update(donation_date)
+                spill_store.contribution_info.update(contribution_info)
+                del donation_date, contribution_info
+            elif donor_index is not None:
+                donor_index.update(donation_date)
+                handler.set_state(donor_index, contribution_info)
+                del donation_date
+            else:
+                handler.set_state(donation_date, contribution_info)
+            context.append_output = True
+
+        if instrumented(usrargs):
+            context.run_stats = RunStats(usrargs, reject_reason, context)
+        offset = read_file(usrargs, handler.handler, key_encoder, start, context, end)
+        handler.clean()
+        if context.run_stats is not None:
+            donation_date, contribution_info = handler.get_state()
+            context.run_stats.finish(type(handler).__module__, donation_date, contribution_info)
+
+        if usrargs.checkpoint_path:
+            donation_date, contribution_info = handler.get_state()
+            Checkpoint.save(usrargs.checkpoint_path, read_percentile(usrargs), offset, key_encoder, donation_date, contribution_info)
+    finally:
+        if spill_store is not None:
+            spill_store.close()
+    return context
 
 if __name__ == '__main__':
     try:
         usr_args = get_args()
-        # Make sure path of input files is valid.
-        if os.path.isfile(usr_args.data_input_path) and os.path.isfile(usr_args.percentile_input_path):
+        # Make sure path of input files is valid. Stream mode has no input file.
+        if (usr_args.mode == 'stream' or all(os.path.isfile(path) for path in usr_args.data_input_paths)) and os.path.isfile(usr_args.percentile_input_path):
+            # Handlers read the percentiles and statistics to calculate from it.
+            query = read_query(usr_args)
+            reports = []
+            if query is not None and (usr_args.checkpoint_path or usr_args.memory_budget):
+                print("Checkpoints and memory budget only support one exact percentile and no statistic.\n")
+                sys.exit(1)
 
             # Use single thread handler.
-            if usr_args.mode != 'multi':
+            if usr_args.mode in ('single', 'both'):
                 start_time = time.time() * 1000
 
-                read_file(usr_args, HandlerSingleThread.handler)
-                HandlerSingleThread.clean()
+                context = run_handler(usr_args, SingleThreadHandler, query)
+                if context.run_stats is not None:
+                    reports.append(context.run_stats.report)
 
                 running_time = time.time() * 1000 - start_time
                 if usr_args.verbose:
-                    print "For single thread handler, the running time is %f ms." %(running_time)
+                    print("For single thread handler, the running time is %f ms." %(running_time))
 
             # Use multiple threads handler.
-            if usr_args.mode != 'single':
+            if usr_args.mode in ('multi', 'both'):
+                start_time = time.time() * 1000
+
+                context = run_handler(usr_args, MultiThreadsHandler, query)
+                if context.run_stats is not None:
+                    reports.append(context.run_stats.report)
+
+                running_time = time.time() * 1000 - start_time
+                if usr_args.verbose:
+                    print("For multiple threads handler, the running time is %f ms." %(running_time))
+                    for counter in context.counters:
+                        print("  %s" % counter)
+
+            # Use multiple processes handler. Worker processes read the input file by themselves.
+            if usr_args.mode == 'parallel':
                 start_time = time.time() * 1000
 
-                read_file(usr_args, HandlerMultiThreads.handler)
-                HandlerMultiThreads.clean()
+                jobs = usr_args.jobs or cpu_count()
+                if jobs > 1:
+                    HandlerMultiProcesses.run(usr_args, read_percentile(usr_args), PARSERS[usr_args.parser], jobs, query)
+                else:
+                    # A single worker would run the stages one after the other, which only adds the cost of spooling records.
+                    context = run_handler(usr_args, SingleThreadHandler, query)
+                    if context.run_stats is not None:
+                        reports.append(context.run_stats.report)
 
                 running_time = time.time() * 1000 - start_time
                 if usr_args.verbose:
-                    print "For multiple threads handler, the running time is %f ms." %(running_time)
+                    print("For multiple processes handler, the running time is %f ms." %(running_time))
+
+            # Use the single thread handler as a service. Its module needs Python 3, so it is only imported here.
+            if usr_args.mode == 'stream':
+                import stream_service as StreamService
+                start_time = time.time() * 1000
+                donor_index = new_donor_index(usr_args)
+                engine = Engine(read_percentile(usr_args), query, (donor_index, {}) if donor_index is not None else None)
+
+                service = StreamService.run(usr_args, engine, PARSERS[usr_args.parser], KeyEncoder(decode_field))
+
+                running_time = time.time() * 1000 - start_time
+                if usr_args.verbose:
+                    sys.stderr.write("For stream service, %d records were handled in %f ms.\n" %(service.records, running_time))
+
+            if usr_args.stats_path:
+                write_reports(usr_args.stats_path, reports)
 
         else:
             print ("The input file or ouput directory does NOT exist.\n")
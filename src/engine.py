@@ -0,0 +1,112 @@
+"""
+This module is the engine module, which holds the state and the repeat donor logic shared by all handlers.
+An Engine keeps donation_date and contribution_info of a run as attributes instead of module globals, so that several
+engines (e.g. one per mode, or a service next to a batch run) can live in the same process. Handlers only decide in
+which thread batches are processed and where output lines go.
+"""
+
+from itertools import compress
+
+from key_encoder import ZIPCODE_BITS, YEAR_BITS
+from percentile import percentiletracker
+
+
+class Engine(object):
+    """ State of a run and repeat donor logic.
+
+    Attributes:
+
+      donation_date: Store transaction date of different donors.
+                     Dictionary of { identifier : date }, in which identifier := key_encoder.donor_key(NAME, ZIPCODE),
+                     or a donor_index.DonorIndex, or a spill_store.SpilledDict.
+
+      contribution_info: Store contribution information which is indentified by "CMTE_ID|ZIPCODE|YEAR"
+                         Dictionary of {
+                                            key_encoder.contribution_key(CMTE_ID_ID, ZIPCODE_ID, YEAR) :
+                                               {
+                                                "amount": TRANSACTION_AMT,
+                                                "transactions": percentiletracker over countedlist of Transactions
+                                               }
+                                        }
+
+      percentile: (Float) Given percentile to be calculated.
+      query: GroupQuery of extra percentiles and statistics, or None for the default output lines.
+      years: Dictionary of { year : year }, giving the int object of each year kept in donation_date.
+    """
+    def __init__(self, percentile, query=None, state=None):
+        """
+        Args:
+          percentile: (Float) Given percentile to be calculated.
+          query: GroupQuery of extra percentiles and statistics. Default: only the given percentile.
+          state: (donation_date, contribution_info) to start with. Default: empty ones.
+        """
+        self.donation_date, self.contribution_info = state if state else ({}, {})
+        self.percentile = percentile
+        self.query = query
+        self.years = {}
+
+    def get_state(self):
+        """ Return (donation_date, contribution_info), e.g. to save them into a checkpoint. """
+        return self.donation_date, self.contribution_info
+
+    def set_state(self, donation_date, contribution_info):
+        """ Replace donation_date and contribution_info, e.g. by the ones loaded from a checkpoint. """
+        self.donation_date = donation_date
+        self.contribution_info = contribution_info
+
+    def process(self, batch):
+        """ Update the state with a batch and return its output lines.
+        Args:
+          batch: input data. DistilledBatch, holding columns of (cmte_id : ID given by batch.key_encoder,
+                                                                 zipcode : ID given by batch.key_encoder,
+                                                                 name : donor key given by key_encoder.donor_key(),
+                                                                 transaction_year : int,
+                                                                 transaction_amt : float)
+        Returns:
+          List of output lines, in input order.
+        """
+        donation_date = self.donation_date
+        contribution_info = self.contribution_info
+        percentile = self.percentile
+        query = self.query
+        key_encoder = batch.key_encoder
+        years = self.years
+        output_lines = []
+        records = batch.records()
+        # A DonorIndex applies the repeat donor rule to the whole batch at once, and only repeat donations are left.
+        check_batch = getattr(donation_date, 'check_batch', None)
+        if check_batch is not None:
+            records = compress(records, check_batch(batch.names, batch.transaction_years))
+        for cmte_id, zipcode, donor_id, transaction_year, transaction_amt in records:
+            # If this is not repeat donor, just add/update its donation date.
+            # Donors are identified by combination of their names and zipcodes, which the parser digests into donor_id.
+            if check_batch is None and (donor_id not in donation_date or donation_date[donor_id] >= transaction_year):
+                # Years read from batches are new int objects, so one object per year is shared by all donors.
+                donation_date[donor_id] = years.setdefault(transaction_year, transaction_year)
+                continue
+
+            # If this is repeat donor. Update contribution information which is identified by this combination of receipient id, zipcode and year.
+            contribution_id = (((cmte_id << ZIPCODE_BITS) | zipcode) << YEAR_BITS) | transaction_year
+            contribution = contribution_info.get(contribution_id)
+            if contribution is None:
+                if query is None:
+                    contribution = contribution_info[contribution_id] = {"total_amt": 0, "transactions": percentiletracker(percentile)}
+                else:
+                    contribution = contribution_info[contribution_id] = query.new_contribution()
+
+            # Update total amount of donation.
+            contribution["total_amt"] += transaction_amt
+
+            # Note: Again, note that I use a counted sorted list to store amount of donations and make them self-sorted.
+            # The tracker appends the amount into it.
+            transactions = contribution["transactions"]
+            transactions.append(transaction_amt)
+
+            # Use Nearest-Rank Method to calculate given percentile.
+            # The tracker keeps a cursor on the element of nearest rank, which moves by at most one step per insertion.
+            if query is None:
+                output_lines.append('%s|%d|%d|%d\n' %(key_encoder.contribution_id(contribution_id), int(round(transactions.value)), contribution["total_amt"], len(transactions)))
+            else:
+                query.update(contribution, transaction_amt, donor_id)
+                output_lines.append(query.format(key_encoder.contribution_id(contribution_id), contribution))
+        return output_lines
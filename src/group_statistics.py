@@ -0,0 +1,96 @@
+"""
+This module is the group statistics module.
+By default, every output line holds the one percentile given in percentile.txt, the total amount and the number of
+transactions of a contribution. A GroupQuery computes several percentiles and extra statistics in the same pass:
+   CMTE_ID|ZIPCODE|YEAR|PERCENTILE_1|...|PERCENTILE_N|TOTAL_AMT|NUMBER|STATISTIC_1|...|STATISTIC_M
+All percentiles are tracked over the same countedlist of amounts. The first percentiletracker appends to it and the
+other ones are notified with update(), so every extra percentile only costs a cursor. Statistics are:
+   min, max: least and greatest amount, read from the countedlist.
+   mean:     total amount divided by the number of transactions.
+   donors:   number of distinct repeat donors, which needs a set of donor keys per contribution.
+Amounts are rounded to whole dollars, like the percentile.
+In approximate mode, trackers are approximatetrackers (see quantile_sketch), so percentiles, min and max are within the
+relative error of the LogQuantizer, while totals, numbers of transactions, means and donors stay exact.
+"""
+
+from percentile import percentiletracker
+from quantile_sketch import approximatetracker
+
+# Supported statistics, in the order they are documented.
+STATISTICS = ('min', 'max', 'mean', 'donors')
+
+
+class GroupQuery(object):
+    """ Percentiles and statistics computed for every contribution.
+    Contributions made by new_contribution() are dictionaries of {
+                                                                   "total_amt": float,
+                                                                   "transactions": percentiletracker of the first percentile,
+                                                                   "trackers": list of percentiletrackers of the other percentiles,
+                                                                   "donors": set of donor keys, only with the donors statistic
+                                                                 }
+
+    Attributes:
+      percentiles: List of (Float) percentiles, in output order.
+      percentile: The first percentile, which owns the countedlist of amounts.
+      statistics: List of statistics, in output order.
+      donors: Whether donors of every contribution have to be kept.
+      quantizer: LogQuantizer of approximate mode, or None for exact percentiles.
+    """
+    def __init__(self, percentiles, statistics=(), quantizer=None):
+        if not percentiles:
+            raise ValueError('At least one percentile is needed.')
+        for statistic in statistics:
+            if statistic not in STATISTICS:
+                raise ValueError('Unknown statistic %s.' % statistic)
+        self.percentiles = list(percentiles)
+        self.percentile = self.percentiles[0]
+        self.statistics = list(statistics)
+        self.donors = 'donors' in self.statistics
+        self.quantizer = quantizer
+
+    def is_simple(self):
+        """ Return True if output lines are the default ones, i.e. one exact percentile and no statistic. """
+        return len(self.percentiles) == 1 and not self.statistics and self.quantizer is None
+
+    def new_contribution(self):
+        """ Return the state of a new contribution. """
+        if self.quantizer is None:
+            transactions = percentiletracker(self.percentile)
+        else:
+            transactions = approximatetracker(self.percentile, self.quantizer)
+        contribution = {"total_amt": 0, "transactions": transactions,
+                        "trackers": [percentiletracker(percentile, transactions.transactions) for percentile in self.percentiles[1:]]}
+        if self.donors:
+            contribution["donors"] = set()
+        return contribution
+
+    def update(self, contribution, transaction_amt, donor_id):
+        """ Update the other percentiles and the donors of a contribution, after
+        contribution["transactions"].append(transaction_amt) and the update of its total amount.
+        """
+        if self.quantizer is not None:
+            # The countedlist holds the amount rounded by the first tracker.
+            transaction_amt = contribution["transactions"].last
+        for tracker in contribution["trackers"]:
+            tracker.update(transaction_amt)
+        if self.donors:
+            contribution["donors"].add(donor_id)
+
+    def format(self, contribution_id, contribution):
+        """ Return the output line of a contribution identified by the 'CMTE_ID|ZIPCODE|YEAR' string. """
+        transactions = contribution["transactions"]
+        columns = [contribution_id, '%d' % int(round(transactions.value))]
+        for tracker in contribution["trackers"]:
+            columns.append('%d' % int(round(tracker.value)))
+        columns.append('%d' % contribution["total_amt"])
+        columns.append('%d' % len(transactions))
+        for statistic in self.statistics:
+            if statistic == 'min':
+                columns.append('%d' % int(round(transactions.transactions.min())))
+            elif statistic == 'max':
+                columns.append('%d' % int(round(transactions.transactions.max())))
+            elif statistic == 'mean':
+                columns.append('%d' % int(round(contribution["total_amt"] / len(transactions))))
+            else:
+                columns.append('%d' % len(contribution["donors"]))
+        return '|'.join(columns) + '\n'
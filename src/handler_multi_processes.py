@@ -0,0 +1,216 @@
+"""
+This module is the multiple processes handler module.
+Why use multiple processes?
+Threads are capped to one core by the GIL, while processes are not. The work is split into stages, each of them
+running on a pool of worker processes:
+1) Parse: input files are cut into byte ranges at line boundaries by BulkReader and every worker parses one range.
+          Records are tagged with the position of their line among all input files, which gives the input order back later.
+2) Donor: records are sharded by donor key (see key_encoder.donor_key()), so every donor is seen by only one worker, in input order.
+          Each worker keeps its own donation_date and only passes repeat donations on.
+3) Contribution: repeat donations are sharded by hash of 'CMTE_ID|ZIPCODE|YEAR', so every group is seen by only one
+          worker, in input order. Each worker keeps its own contribution_info and formats output lines.
+4) Merge: output lines of all workers are merged by offset and written in input order, through an OutputWriter.
+Stages hand their results to each other through spool files in a temporary directory, instead of through the main
+process: a worker streams the spool files of its shard in and the ones of the next stage out, a block of records at a
+time, and the main process merges the sorted spool files of output lines lazily. So neither the main process nor the
+workers keep more than the state of their shards and a few blocks in memory, whatever the size of the input.
+"""
+
+import heapq
+import marshal
+from multiprocessing import Pool
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import bulk_reader as BulkReader
+from distilled_data import DistilledBatch
+from key_encoder import donor_key
+from output_writer import OutputWriter, FLUSH_SIZE
+from percentile import percentiletracker
+
+# Number of chunks to parse per worker, so that a slow chunk does not keep the other workers idle.
+CHUNKS_PER_WORKER = 4
+
+# Number of records written into a spool file at once.
+SPOOL_BLOCK = 4096
+
+# Length of a block of a spool file, written before it.
+BLOCK_LENGTH = struct.Struct('<I')
+
+
+def get_shard(key, shards):
+    """ Return the shard of a key. Unlike hash(), crc32 is the same in every process. """
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8', 'replace')
+    return (zlib.crc32(key) & 0xffffffff) % shards
+
+
+def spool_path(directory, stage, source, shard):
+    """ Return the path of the spool file written by task source of a stage for shard of the next stage. """
+    return os.path.join(directory, '%s-%d-%d' % (stage, source, shard))
+
+
+class SpoolWriter(object):
+    """ Writes records into a spool file, a block of SPOOL_BLOCK records at a time.
+    Records are tuples of strings and numbers, which marshal writes and reads back much faster than pickle. Spool
+    files are only read back by the same interpreter, so the version of the marshal format does not matter.
+    """
+    def __init__(self, path):
+        self.spool_file = open(path, 'wb')
+        self.block = []
+
+    def append(self, record):
+        self.block.append(record)
+        if len(self.block) >= SPOOL_BLOCK:
+            self.flush()
+
+    def flush(self):
+        if self.block:
+            # Blocks are read back with a single read(), since marshal.load() reads a file in small pieces.
+            data = marshal.dumps(self.block)
+            self.spool_file.write(BLOCK_LENGTH.pack(len(data)))
+            self.spool_file.write(data)
+            self.block = []
+
+    def close(self):
+        self.flush()
+        self.spool_file.close()
+
+
+def iter_spool(path):
+    """ Yield the records of a spool file, in the order they were written. The file is removed once it is read. """
+    with open(path, 'rb') as spool_file:
+        while True:
+            length = spool_file.read(BLOCK_LENGTH.size)
+            if not length:
+                break
+            for record in marshal.loads(spool_file.read(BLOCK_LENGTH.unpack(length)[0])):
+                yield record
+    os.remove(path)
+
+
+def parse_chunk(task):
+    """ Stage 1. Parse the lines of a byte range and shard the valid records by donor.
+    Args:
+      task: (path, start, end, base, parse_lines, shards, directory, chunk). base is the total size of the input files
+            before path, and chunk is the number of the range among all input files.
+    Writes:
+      One spool file per donor shard, of (position, cmte_id, zipcode, name, transaction_year, transaction_amt).
+    """
+    path, start, end, base, parse_lines, shards, directory, chunk = task
+    writers = [SpoolWriter(spool_path(directory, 'records', chunk, shard)) for shard in range(shards)]
+    # Blocks of lines are parsed and written one at a time.
+    for offset, lines in BulkReader.iter_line_batches(path, start, end):
+        batch = DistilledBatch()
+        parse_lines(offset, lines, batch)
+        positions = [base + offset for offset in batch.offsets] if base else batch.offsets
+        for record in zip(positions, batch.cmte_ids, batch.zipcodes, batch.names, batch.transaction_years, batch.transaction_amts):
+            writers[donor_key(record[3], record[2]) % shards].append(record)
+    for writer in writers:
+        writer.close()
+
+
+def find_repeat_donations(task):
+    """ Stage 2. Find the donations of repeat donors in one donor shard.
+    Args:
+      task: (shard, chunks, shards, with_donors, directory). The spool files of the shard are read in the order of chunks.
+    Writes:
+      One spool file per contribution shard, of (offset, contribution_id, transaction_amt), followed by the donor key
+      if with_donors is True.
+    """
+    shard, chunks, shards, with_donors, directory = task
+    donation_date = {}
+    writers = [SpoolWriter(spool_path(directory, 'donations', shard, contribution_shard)) for contribution_shard in range(shards)]
+    for chunk in range(chunks):
+        for offset, cmte_id, zipcode, name, transaction_year, transaction_amt in iter_spool(spool_path(directory, 'records', chunk, shard)):
+            # If this is not repeat donor, just add/update its donation date.
+            donor_id = donor_key(name, zipcode)
+            if donor_id not in donation_date or donation_date[donor_id] >= transaction_year:
+                donation_date[donor_id] = transaction_year
+                continue
+            # Contributions are sharded by their string, which is the same in every process, unlike interned keys.
+            contribution_id = '%s|%s|%s' % (cmte_id, zipcode, transaction_year)
+            if with_donors:
+                writers[get_shard(contribution_id, shards)].append((offset, contribution_id, transaction_amt, donor_id))
+            else:
+                writers[get_shard(contribution_id, shards)].append((offset, contribution_id, transaction_amt))
+    for writer in writers:
+        writer.close()
+
+
+def update_contributions(task):
+    """ Stage 3. Update contribution information of one contribution shard and format output lines.
+    Args:
+      task: (shard, shards, percentile, query, directory). The spool files of the shard, one per donor shard, are each
+            sorted by offset. query is the GroupQuery of extra percentiles and statistics, or None.
+    Writes:
+      A spool file of (offset, output line), sorted by offset.
+    """
+    shard, shards, percentile, query, directory = task
+    contribution_info = {}
+    writer = SpoolWriter(spool_path(directory, 'lines', shard, 0))
+    for donation in heapq.merge(*[iter_spool(spool_path(directory, 'donations', donor_shard, shard)) for donor_shard in range(shards)]):
+        offset, contribution_id, transaction_amt = donation[:3]
+        if contribution_id not in contribution_info:
+            if query is None:
+                contribution_info[contribution_id] = {"total_amt": 0, "transactions": percentiletracker(percentile)}
+            else:
+                contribution_info[contribution_id] = query.new_contribution()
+        contribution = contribution_info[contribution_id]
+        contribution["total_amt"] += transaction_amt
+        contribution["transactions"].append(transaction_amt)
+        if query is None:
+            writer.append((offset, '%s|%d|%d|%d\n' % (contribution_id, int(round(contribution["transactions"].value)),
+                                                      contribution["total_amt"], len(contribution["transactions"]))))
+        else:
+            query.update(contribution, transaction_amt, donation[3] if query.donors else None)
+            writer.append((offset, query.format(contribution_id, contribution)))
+    writer.close()
+
+
+def run(usrargs, percentage, parse_lines, jobs, query=None):
+    """
+    This function is called by outer interface instead of feeding records one by one, since workers read the input by themselves.
+    Args:
+      usrargs: (Object) object of user defined arguments.
+      percentage: (Float) given percentile to be calculated.
+      parse_lines: function appending the valid records of lines given by BulkReader to a DistilledBatch.
+      jobs: Number of worker processes, and of shards of each stage.
+      query: GroupQuery of extra percentiles and statistics, or None.
+    """
+    directory = tempfile.mkdtemp(prefix='donation_analytics_parallel_', dir=getattr(usrargs, 'spill_dir', None))
+    try:
+        pool = Pool(jobs)
+        try:
+            tasks = []
+            base = 0
+            for path in getattr(usrargs, 'data_input_paths', [usrargs.data_input_path]):
+                for start, end in BulkReader.get_chunks(path, jobs * CHUNKS_PER_WORKER):
+                    tasks.append((path, start, end, base, parse_lines, jobs, directory, len(tasks)))
+                base += os.path.getsize(path)
+            # Workers only give back None, every stage waits for the spool files of the previous one.
+            for _ in pool.imap_unordered(parse_chunk, tasks):
+                pass
+
+            # Shard i of the donor stage reads shard i of every chunk, in the order of chunks.
+            with_donors = query is not None and query.donors
+            for _ in pool.imap_unordered(find_repeat_donations, [(i, len(tasks), jobs, with_donors, directory) for i in range(jobs)]):
+                pass
+
+            for _ in pool.imap_unordered(update_contributions, [(i, jobs, percentage, query, directory) for i in range(jobs)]):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+
+        output_file = OutputWriter(usrargs.output_path, False, getattr(usrargs, 'flush_size', FLUSH_SIZE), getattr(usrargs, 'compression', None))
+        try:
+            for _, line in heapq.merge(*[iter_spool(spool_path(directory, 'lines', i, 0)) for i in range(jobs)]):
+                output_file.write(line)
+        finally:
+            output_file.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
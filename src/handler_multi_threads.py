@@ -2,135 +2,110 @@
 This module is the multiple threads handler module.
 Why use multithread?
 Just give more scalability for future.
+The handler thread is the aggregate stage of a pipeline (see pipeline): input blocks are read by a prefetching thread
+(read_file() does it when PIPELINED is set), parsed by the main thread, aggregated by the handler thread and written
+by the thread of its OutputWriter. Stages hand batches to each other through bounded queues.
 """
 
-import sys
-from threading import Thread
-if sys.version_info[0] == 2:
-    from Queue import Queue
-else:
-    from queue import Queue
-from avltree import avltree
-from math import ceil
+from engine import Engine
+from output_writer import OutputWriter, FLUSH_SIZE
+from pipeline import Stage, QUEUE_SIZE
+from run_context import RunContext
 
-# Here just use a global variable to implement a kind of Singleton Pattern.
-# Handler Thread is globally unique.
-handler_thread = None
 
+class MultiThreadsHandler(object):
+    """ Hands batches to a HandlerThread, which processes them with an Engine.
 
-def handler(data, percentage, usrargs):
-    """
-    This function is like the export function in C++, which is called by outer interface.
-    Args:
-      data: input data. Format: {"cmte_id" : string,
-                                 "zipcode" : string,
-                                 "name" : string,
-                                 "transaction_year" : int,
-                                 "transaction_amt" : float}
-
-      percentile: (Float) given percentile to be calculated.
+    Attributes:
       usrargs: (Object) object of user defined arguments.
+      context: RunContext of the run.
+      engine: Engine holding the state of the run. It is only used by the handler thread while it runs.
+      handler_thread: HandlerThread, started with the first batch.
     """
-    global handler_thread
-    if not handler_thread:
-        handler_thread = HandlerThread(usrargs.output_path, percentage)
-    # The only thing to do : Push the data into the queue of handler thread.
-    handler_thread.add_task(data)
+    # Tells read_file() to read input blocks in a stage of their own.
+    PIPELINED = True
 
-def clean():
-    """
-    This function should be called at the end to wait for completion of handler thread.
-    """
-    global handler_thread
-    if not handler_thread:
-        return
-    handler_thread.wait_complete()
-    handler_thread.clean()
+    def __init__(self, usrargs, percentile, context=None):
+        """
+        Args:
+          usrargs: (Object) object of user defined arguments.
+          percentile: (Float) given percentile to be calculated.
+          context: RunContext of the run. Default: a new one.
+        """
+        self.usrargs = usrargs
+        self.context = context if context is not None else RunContext()
+        self.engine = Engine(percentile, self.context.query)
+        self.handler_thread = None
+
+    def handler(self, batch):
+        """
+        This function is like the export function in C++, which is called by outer interface.
+        Args:
+          batch: input data. DistilledBatch, see engine.Engine.process().
+        """
+        if not self.handler_thread:
+            usrargs = self.usrargs
+            self.handler_thread = HandlerThread(self.engine, usrargs.output_path, self.context.append_output,
+                                                getattr(usrargs, 'flush_size', FLUSH_SIZE), getattr(usrargs, 'compression', None),
+                                                self.context.counters)
+        # The only thing to do : Push the batch into the queue of handler thread.
+        self.handler_thread.add_task(batch)
 
+    def clean(self):
+        """
+        This function should be called at the end to wait for completion of handler thread.
+        """
+        if not self.handler_thread:
+            return
+        try:
+            self.handler_thread.close()
+        finally:
+            self.handler_thread.clean()
 
-class HandlerThread(Thread):
-    """ This class derives from threading.Thread class and is responsible for dealing with input data.
+    def get_state(self):
+        """ Return (donation_date, contribution_info), e.g. to save them into a checkpoint. """
+        return self.engine.get_state()
 
-    The thread will store input data and calculate percentile for every input data.
+    def set_state(self, donation_date, contribution_info):
+        """ Give the state which handler thread starts with, e.g. the one loaded from a checkpoint. """
+        self.engine.set_state(donation_date, contribution_info)
 
-    Attributes:
-      task_queue: The queue of input data. Main thread feeds data into this queue and this thread consumes these data.
 
-      donation_date: Store transaction date of different donors.
-                     Dictionary of { identifier : date }, in which identifier := 'NAME|ZIPCODE'
+class HandlerThread(Stage):
+    """ This class derives from pipeline.Stage class and is responsible for dealing with input data.
 
-      contribution_info: Store contribution information which is indentified by "CMTE_ID|ZIPCODE|YEAR"
-                         Dictionary of {
-                                            "CMTE_ID|ZIPCODE|YEAR" :
-                                               {
-                                                "amount": TRANSACTION_AMT,
-                                                "transactions": AvlTree of Transactions
-                                               }
-                                        }
+    The thread will store input data and calculate percentile for every input data.
+    Main thread feeds batches into its bounded queue with add_task() and ends it with close().
 
-      percentile: (Float) Given percentile to be calculated.
+    Attributes:
+      engine: Engine holding the state of the run.
+      output_file: OutputWriter of output file.
     """
-    def __init__(self, output_file_path, percentile):
+    def __init__(self, engine, output_file_path, append_output=False, flush_size=FLUSH_SIZE, compression=None, counters=None):
         """ Constructor of transaction handler thread.
         Args:
+          engine: Engine holding the state of the run.
           output_file_path: The path of output file. According to Challenge Instructions, it should be 'project_path/output/repeat_donors.txt'.
-          percentile: (Float) Given percentile to be calculated.
+          append_output: Append to output file instead of truncating it.
+          flush_size: Number of bytes of output lines collected before a write.
+          compression: Compression of output file, see output_writer.OutputWriter.
+          counters: List of the counters of the run, which the counters of this stage and of the write stage are appended to.
         """
-        Thread.__init__(self)
-        self.task_queue = Queue()
-        self.donation_date = {}
-        self.contribution_info = {}
-        self.output_file = open(output_file_path, 'w')
-        self.percentile = percentile
-        self.daemon = True
-        self.start()
+        self.engine = engine
+        self.output_file = OutputWriter(output_file_path, append_output, flush_size, compression, counters=counters)
+        Stage.__init__(self, 'aggregate', self.handler, QUEUE_SIZE, counters=counters)
 
     def add_task(self, item):
-        """ Push data into task queue.  """
-        self.task_queue.put(item)
-
-    def wait_complete(self):
-        self.task_queue.join()
+        """ Push a batch into task queue. It blocks while the queue is full. """
+        self.put(item)
 
-    def handler(self, data):
+    def handler(self, batch):
         """ This is the single thread handler.
             Args:
-               data: input data. Format: {"cmte_id" : string,
-                                          "zipcode" : string,
-                                          "name" : string,
-                                          "transaction_year" : int,
-                                          "transaction_amt" : float}
+               batch: input data. DistilledBatch, see engine.Engine.process().
         """
-        # If this is not repeat donor, just add/update its donation date.
-        donor_id = '%s|%s' % (data["name"], data["zipcode"])
-        if donor_id not in self.donation_date or self.donation_date[donor_id] >= data["transaction_year"]:
-            self.donation_date[donor_id] = data["transaction_year"]
-            return
-
-        # If this is repeat donor. Update contribution information which is identified by this combination of receipient id, zipcode and year.
-        contribution_id = '%s|%s|%s' %(data["cmte_id"], data["zipcode"], data["transaction_year"])
-        if contribution_id not in self.contribution_info:
-            self.contribution_info[contribution_id] = {"total_amt": 0, "transactions": avltree()}
-
-        # Update total amount of donation.
-        self.contribution_info[contribution_id]["total_amt"] += data["transaction_amt"]
-
-        # Note: Again, note that I use AVL tree to store amount of donations and make them self-sorted.
-        self.contribution_info[contribution_id]["transactions"].append(data["transaction_amt"])
-
-        # Use Nearest-Rank Method to calculate given percentile.
-        # percentile_index = (percentage / 100.0) * total_number_of_sample - 1.
-        # percentile = AVL_tree_of_donations[percentile_index].
-        transaction_number = len(self.contribution_info[contribution_id]["transactions"])
-        percentile_index = int(ceil((self.percentile / 100.0) * transaction_number)) - 1
-        percentile = int(round(self.contribution_info[contribution_id]["transactions"][percentile_index]))
-        self.output_file.write('%s|%d|%d|%d\n' %(contribution_id, percentile, self.contribution_info[contribution_id]["total_amt"], transaction_number))
-
-    def run(self):
-        while(True):
-            data = self.task_queue.get()
-            self.handler(data)
-            self.task_queue.task_done()
+        # Output lines of the whole batch are handed to the writer at once.
+        self.output_file.write(''.join(self.engine.process(batch)))
 
     def clean(self):
         self.output_file.close()
@@ -0,0 +1,116 @@
+"""
+This module is the input pool module, which reads several input files, e.g. the split files of an FEC cycle, at once.
+Input files are given as a list of paths or glob patterns, and read one after the other in that order, without being
+copied into one file. Each file is cut into chunks at line boundaries, and chunks of all files are parsed concurrently
+by a pool of worker processes. Parsed chunks are handed back in input order, so the output is the same as the one of
+the concatenated file, whatever the number of workers. The last line of a file always ends with the file, even without
+a line terminator, rather than being joined with the first line of the next file as in the concatenated file.
+
+Interned IDs are only meaningful in the process which gave them, so workers give committee IDs and zipcodes as strings,
+and the main process interns them into its KeyEncoder. Donor keys are the same in every process, so workers compute them. Only a few chunks are parsed ahead of the main process, which bounds memory.
+"""
+
+from array import array
+import glob
+from multiprocessing import Pool, cpu_count
+import os
+
+import bulk_reader as BulkReader
+from distilled_data import DistilledBatch
+from key_encoder import donor_key, INT64
+
+# Size of the chunks parsed by workers, in bytes.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Number of chunks parsed ahead of the main process, per worker.
+CHUNKS_AHEAD = 2
+
+
+def expand_inputs(patterns):
+    """ Return the paths of input files given by paths or glob patterns, in order. Matches of a pattern are sorted. """
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def get_tasks(paths, parse_lines, chunk_size=CHUNK_SIZE):
+    """ Cut input files into chunks.
+    Returns:
+      List of (path, start, end, base, parse_lines), in input order. base is the total size of the files before path, so
+      that base + offset gives the position of a line among all input files.
+    """
+    tasks = []
+    base = 0
+    for path in paths:
+        size = os.path.getsize(path)
+        for start, end in BulkReader.get_chunks(path, max(size // chunk_size, 1)):
+            tasks.append((path, start, end, base, parse_lines))
+        base += size
+    return tasks
+
+
+def parse_chunk(task):
+    """ Parse the lines of a chunk in a worker process.
+    Args:
+      task: (path, start, end, base, parse_lines)
+    Returns:
+      (number of lines, end position, offsets, cmte_ids, zipcodes, donor keys, transaction_years, transaction_amts)
+      Offsets and the end position are positions among all input files. Committee IDs and zipcodes are strings.
+    """
+    path, start, end, base, parse_lines = task
+    batch = DistilledBatch()
+    lines = 0
+    for offset, batch_lines in BulkReader.iter_line_batches(path, start, end):
+        parse_lines(offset, batch_lines, batch)
+        lines += len(batch_lines)
+    donors = array(INT64, [donor_key(name, zipcode) for name, zipcode in zip(batch.names, batch.zipcodes)])
+    return (lines, base + end, [base + offset for offset in batch.offsets], batch.cmte_ids, batch.zipcodes, donors,
+            batch.transaction_years, batch.transaction_amts)
+
+
+def iter_chunks(paths, parse_lines, key_encoder, jobs=0, batch_size=4096):
+    """ Parse input files in a pool of worker processes.
+    Args:
+      paths: Paths of input files, in order.
+      parse_lines: Parser of lines given by BulkReader, e.g. donation_analytics.parse_lines_fast().
+      key_encoder: KeyEncoder interning the fields of all batches.
+      jobs: Number of worker processes. Default: number of CPUs.
+      batch_size: Number of records of the batches.
+    Yields:
+      (number of lines, end position, list of DistilledBatches) of every chunk, in input order.
+    """
+    jobs = jobs or cpu_count()
+    tasks = get_tasks(paths, parse_lines)
+    pool = Pool(jobs)
+    try:
+        pending = []
+        next_task = 0
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < jobs * CHUNKS_AHEAD:
+                pending.append(pool.apply_async(parse_chunk, (tasks[next_task],)))
+                next_task += 1
+            lines, position, offsets, cmte_ids, zipcodes, donors, years, amounts = pending.pop(0).get()
+            yield lines, position, list(_intern_batches(key_encoder, batch_size, offsets, cmte_ids, zipcodes, donors, years, amounts))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _intern_batches(key_encoder, batch_size, offsets, cmte_ids, zipcodes, donors, years, amounts):
+    """ Yield the records of a parsed chunk as DistilledBatches of batch_size records, interned by key_encoder. """
+    cmte_id_table = key_encoder.cmte_ids
+    zipcode_table = key_encoder.zipcodes
+    for start in range(0, len(offsets), batch_size):
+        end = start + batch_size
+        batch = DistilledBatch(key_encoder)
+        batch.offsets = offsets[start:end]
+        batch.cmte_ids = array(INT64, [cmte_id_table[field] for field in cmte_ids[start:end]])
+        batch.zipcodes = array(INT64, [zipcode_table[field] for field in zipcodes[start:end]])
+        batch.names = donors[start:end]
+        batch.transaction_years = years[start:end]
+        batch.transaction_amts = amounts[start:end]
+        yield batch
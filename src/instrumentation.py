@@ -0,0 +1,212 @@
+"""
+This module is the instrumentation module.
+A RunStats follows a run of a handler, if any of --stats, --progress, --profile or --tracemalloc is given. Nothing is
+counted otherwise, so the hot loops of parsers and handlers are never slowed down:
+1) Lines: every batch of lines is counted once it is parsed. Rejected lines are the ones whose offset is not in the
+   batch, and only they are parsed again by reject_reason() to find which filter dropped them. A line which
+   reject_reason() finds valid, although the parser rejected it, is counted as 'other'.
+2) Stages: time spent parsing and handling batches, and by the stages of the pipeline in multi mode (see pipeline).
+3) Donations: every output line is a donation of a repeat donor, so repeat donations are the lines written, and the
+   other records are first-time donations.
+4) State: numbers of donors and contributions, and sizes of the countedlists of amounts, read from the state of the
+   handler at the end.
+5) Output: bytes added to the output file.
+A progress line is printed on stderr every --progress seconds, and the whole report is written as JSON into --stats.
+--profile runs cProfile over the run and dumps its statistics for pstats, --tracemalloc N adds the peak of traced memory
+and the N largest allocation sites to the report (Python 3 only).
+"""
+
+import json
+import os
+import sys
+import time
+
+import pipeline as Pipeline
+
+
+class RunStats(object):
+    """ Counters of a run of a handler.
+
+    Attributes:
+      usrargs: (Object) object of user defined arguments.
+      reject_reason: Function returning the reason why a line is rejected, e.g. donation_analytics.reject_reason().
+      context: RunContext of the run, whose stage counters are reported.
+      lines: Number of lines read.
+      records: Number of valid records handed to the handler.
+      rejects: Dictionary of { reason : number of rejected lines }.
+      input_size: Size of the input file, in bytes.
+      output_size: Size of the output file before the run, in bytes.
+      parse_counter, handle_counter: StageCounters of parsing and handling batches.
+      started: Time the run started at.
+      next_progress: Time of the next progress line, or None.
+      profiler: cProfile.Profile, or None.
+      tracemalloc: tracemalloc module if it traces allocations, or None.
+      report: Dictionary given by finish().
+    """
+    def __init__(self, usrargs, reject_reason, context):
+        self.usrargs = usrargs
+        self.reject_reason = reject_reason
+        self.context = context
+        self.lines = 0
+        self.records = 0
+        self.rejects = {}
+        self.input_size = sum(os.path.getsize(path) for path in getattr(usrargs, 'data_input_paths', [usrargs.data_input_path]))
+        output_path = usrargs.output_path
+        self.output_size = os.path.getsize(output_path) if context.append_output and os.path.isfile(output_path) else 0
+        self.parse_counter = Pipeline.StageCounter('parse', context.counters)
+        self.handle_counter = Pipeline.StageCounter('handle', context.counters)
+        self.started = time.time()
+        interval = getattr(usrargs, 'progress_interval', None)
+        self.next_progress = self.started + interval if interval else None
+        self.report = None
+
+        self.profiler = None
+        if getattr(usrargs, 'profile_path', None):
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.tracemalloc = None
+        if getattr(usrargs, 'tracemalloc_top', None):
+            import tracemalloc
+            tracemalloc.start()
+            self.tracemalloc = tracemalloc
+
+    def count_lines(self, offset, lines, batch, seconds):
+        """ Count a batch of lines parsed in seconds, and the reasons of the rejected ones.
+        Args:
+          offset: Byte offset of the first line.
+          lines: List of lines given by BulkReader.
+          batch: DistilledBatch of the valid records of lines.
+          seconds: Time spent parsing lines.
+        """
+        self.lines += len(lines)
+        self.records += len(batch)
+        self.parse_counter.add(len(lines), seconds)
+        if len(batch) == len(lines):
+            return
+        accepted = set(batch.offsets)
+        for line in lines:
+            if offset not in accepted:
+                # Reasons are keys of the JSON report, so they can not be None.
+                reason = self.reject_reason(line) or 'other'
+                self.rejects[reason] = self.rejects.get(reason, 0) + 1
+            offset += len(line) + 1
+
+    def count_cached(self, records, seconds):
+        """ Count a batch of records read from a ColumnarCache in seconds. Lines are not read, see count_cache(). """
+        self.records += records
+        self.parse_counter.add(records, seconds)
+
+    def count_parsed(self, lines, records, seconds):
+        """ Count a chunk of lines parsed by a worker process (see input_pool), of which records are valid.
+        Reasons of rejects are not given by workers, so they are all counted as 'unclassified'.
+        """
+        self.lines += lines
+        self.records += records
+        self.parse_counter.add(lines, seconds)
+        if lines > records:
+            self.rejects['unclassified'] = self.rejects.get('unclassified', 0) + lines - records
+
+    def count_cache(self, cache):
+        """ Count the lines of a cached input. Reasons of rejects are not cached, so they are all counted as 'cached'. """
+        self.lines = cache.lines
+        if cache.lines > cache.records:
+            self.rejects['cached'] = cache.lines - cache.records
+
+    def count_handled(self, records, seconds, offset):
+        """ Count a batch of records handed to the handler in seconds. Offset is the one after its last line. """
+        self.handle_counter.add(records, seconds)
+        if self.next_progress is not None and time.time() >= self.next_progress:
+            self.next_progress = time.time() + self.usrargs.progress_interval
+            sys.stderr.write(self.progress_line(offset) + '\n')
+
+    def progress_line(self, offset):
+        """ Return a line telling how far the run is. """
+        seconds = time.time() - self.started
+        rejected = sum(self.rejects.values())
+        return 'progress: %.1f%% of input, %d lines, %d records, %d rejected, %d output lines, %.0f lines/s' % (
+            100.0 * offset / self.input_size if self.input_size else 100.0, self.lines, self.records, rejected,
+            self.written_lines(), self.lines / seconds if seconds else 0.0)
+
+    def written_lines(self):
+        """ Return the number of output lines handed to the write stage so far. """
+        return sum(counter.records for counter in self.context.counters if counter.name == 'write')
+
+    def finish(self, mode, donation_date, contribution_info):
+        """ Stop counting and build the report of the run.
+        Args:
+          mode: Name of the handler mode.
+          donation_date, contribution_info: The state of the handler at the end of the run.
+        Returns:
+          The report, as a dictionary.
+        """
+        seconds = time.time() - self.started
+        self.parse_counter.stop()
+        self.handle_counter.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.usrargs.profile_path)
+
+        repeat = self.written_lines()
+        report = {
+            "mode": mode,
+            "seconds": seconds,
+            "input_bytes": self.input_size,
+            "lines": self.lines,
+            "lines_per_second": self.lines / seconds if seconds else None,
+            "records": self.records,
+            "rejects": dict(self.rejects),
+            "first_time_donations": self.records - repeat,
+            "repeat_donations": repeat,
+            "output_bytes": (os.path.getsize(self.usrargs.output_path) if os.path.isfile(self.usrargs.output_path) else 0) - self.output_size,
+            "stages": [{"name": counter.name, "batches": counter.batches, "records": counter.records, "busy_seconds": counter.busy}
+                       for counter in self.context.counters],
+        }
+        report.update(state_stats(donation_date, contribution_info))
+
+        if self.tracemalloc is not None:
+            snapshot = self.tracemalloc.take_snapshot()
+            report["tracemalloc"] = {"peak_bytes": self.tracemalloc.get_traced_memory()[1],
+                                     "top": [{"location": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                                             for stat in snapshot.statistics('lineno')[:self.usrargs.tracemalloc_top]]}
+            self.tracemalloc.stop()
+        self.report = report
+        return report
+
+
+def state_stats(donation_date, contribution_info):
+    """ Return the numbers of donors and contributions, and the sizes of the countedlists of amounts.
+    The index of a countedlist is a Fenwick tree over its blocks, so its depth is the bit length of the number of blocks.
+    """
+    # Spilled dictionaries (see spill_store) have no length, their entries are counted.
+    donors = len(donation_date) if hasattr(donation_date, '__len__') else sum(1 for _ in donation_date.items())
+    contributions = 0
+    amounts = 0
+    max_amounts = 0
+    max_distinct = 0
+    max_blocks = 0
+    for _, contribution in contribution_info.items():
+        transactions = contribution["transactions"].transactions
+        contributions += 1
+        amounts += len(transactions)
+        max_amounts = max(max_amounts, len(transactions))
+        max_distinct = max(max_distinct, transactions.distinct())
+        max_blocks = max(max_blocks, len(transactions.values))
+    return {"donors": donors,
+            "contributions": contributions,
+            "amounts": {"total": amounts,
+                        "mean": float(amounts) / contributions if contributions else 0.0,
+                        "max": max_amounts,
+                        "max_distinct": max_distinct,
+                        "max_blocks": max_blocks,
+                        "max_index_depth": max_blocks.bit_length()}}
+
+
+def write_reports(path, reports):
+    """ Write the reports of the runs of a command line as JSON. '-' writes them on standard output. """
+    text = json.dumps({"runs": reports}, indent=2, sort_keys=True)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as report_file:
+            report_file.write(text + '\n')
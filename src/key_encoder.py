@@ -0,0 +1,99 @@
+"""
+This module is the key encoding module.
+Handlers used to identify donors by 'NAME|ZIPCODE' strings and contributions by 'CMTE_ID|ZIPCODE|YEAR' strings, which
+means new strings for every record and millions of mostly duplicated strings kept as dictionary keys.
+Instead, donors and contributions are identified by integer keys:
+   donor key        := 64-bit digest of 'NAME|ZIPCODE'
+   contribution key := (CMTE_ID_ID << 32 | ZIPCODE_ID) << 16 | YEAR
+Committee IDs and zipcodes are few, so they are interned into small integer IDs, which are packed into contribution
+keys, and the 'CMTE_ID|ZIPCODE|YEAR' string is only formatted when an output line is written.
+Names are as many as donors, and they are never written out, so they are not interned: a donor key replaces the
+'NAME|ZIPCODE' string instead of being kept next to it, which costs about 90 bytes per donor in donation_date instead
+of 140 for the string. Digests are the same in every process and every run, so donor keys can be saved into
+checkpoints and caches and computed by worker processes. Two donors whose digests collide would be taken for one: with
+10^8 donors, the chance that any two of them collide is about 3 * 10^-4.
+"""
+
+from array import array
+import hashlib
+import struct
+
+# Width of packed fields. Zipcodes have 5 characters, so there are far less than 2 ** 32 of them, and years have 4 digits.
+ZIPCODE_BITS = 32
+YEAR_BITS = 16
+ZIPCODE_MASK = (1 << ZIPCODE_BITS) - 1
+YEAR_MASK = (1 << YEAR_BITS) - 1
+
+# Donor keys are signed, so that they fit into 64-bit arrays and SQLite integers.
+DONOR_KEY = struct.Struct('<q')
+
+# Typecode of arrays of 64-bit integers, e.g. donor keys. Python 2 has no 'q', but its 'l' has 64 bits on 64-bit Unix.
+INT64 = 'l' if array('l').itemsize == 8 else 'q'
+
+# Encoding of names and zipcodes given as strings, e.g. by the strict parser.
+FIELD_ENCODING = 'utf-8'
+
+if hasattr(hashlib, 'blake2b'):
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=DONOR_KEY.size).digest()
+else:
+    # Python 2 and Python 3 before 3.6 have no blake2b.
+    def _digest(data):
+        return hashlib.md5(data).digest()[:DONOR_KEY.size]
+
+
+def donor_key(name, zipcode):
+    """ Return the key of donor identified by 'NAME|ZIPCODE'.
+    Args:
+      name, zipcode: Name and 5-character zipcode, as bytes given by BulkReader or as strings.
+    """
+    if not isinstance(name, bytes):
+        name = name.encode(FIELD_ENCODING)
+    if not isinstance(zipcode, bytes):
+        zipcode = zipcode.encode(FIELD_ENCODING)
+    return DONOR_KEY.unpack(_digest(name + b'|' + zipcode))[0]
+
+
+def contribution_key(cmte_id_id, zipcode_id, transaction_year):
+    """ Return the key of contribution identified by 'CMTE_ID|ZIPCODE|YEAR'. Handlers inline it in their loops. """
+    return (((cmte_id_id << ZIPCODE_BITS) | zipcode_id) << YEAR_BITS) | transaction_year
+
+
+class InternTable(dict):
+    """ Dictionary of { field : ID }, in which IDs are given in order of appearance when a field is looked up.
+
+    Attributes:
+      fields: List of decoded fields indexed by ID.
+      decode: Function decoding a field into string.
+    """
+    def __init__(self, decode=None):
+        dict.__init__(self)
+        self.fields = []
+        self.decode = decode
+
+    def __missing__(self, field):
+        field_id = self[field] = len(self)
+        self.fields.append(self.decode(field) if self.decode is not None else field)
+        return field_id
+
+
+class KeyEncoder(object):
+    """ Interns fields into integer IDs.
+    Fields can be given as they are read (e.g. bytes given by BulkReader), and are only decoded when they are seen for
+    the first time. Looking up a field which has already been seen is a plain dictionary lookup, e.g. cmte_ids[cmte_id].
+    Names are not interned, donors are given by donor_key() instead.
+
+    Attributes:
+      cmte_ids: InternTable of committee IDs.
+      zipcodes: InternTable of zipcodes.
+    """
+    def __init__(self, decode=None):
+        self.cmte_ids = InternTable(decode)
+        self.zipcodes = InternTable(decode)
+
+    def contribution_id(self, key):
+        """ Return the 'CMTE_ID|ZIPCODE|YEAR' string of a contribution key. """
+        zipcode_key = key >> YEAR_BITS
+        return '%s|%s|%d' % (self.cmte_ids.fields[zipcode_key >> ZIPCODE_BITS],
+                             self.zipcodes.fields[zipcode_key & ZIPCODE_MASK],
+                             key & YEAR_MASK)
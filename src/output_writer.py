@@ -0,0 +1,119 @@
+"""
+This module is the output writer module, which is the output stage of Handler Module.
+Handlers hand their output lines to an OutputWriter, one batch at a time, instead of writing them into the output file.
+The writer collects them into a buffer of flush_size bytes, and hands every full buffer to a writer thread (the write
+stage of pipeline), which encodes, optionally compresses and writes it. Handlers only wait for the writer thread when it is a few buffers behind.
+Compressors (zlib, bz2, lzma) release the GIL while they work, so compression mostly runs alongside the handlers.
+"""
+
+import sys
+
+from pipeline import Stage
+
+# Default number of bytes collected before a write.
+FLUSH_SIZE = 1024 * 1024
+
+# Number of full buffers which can wait for the writer thread.
+QUEUE_SIZE = 4
+
+# Supported compressions, by file extension.
+COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}
+
+# Encoding of output lines.
+OUTPUT_ENCODING = 'utf-8'
+
+
+def get_compression(path, compression=None):
+    """ Return the compression of an output file: the given one, or the one of its extension. 'none' means no compression. """
+    if compression is None:
+        for extension, name in COMPRESSIONS.items():
+            if path.endswith(extension):
+                return name
+        return 'none'
+    return compression
+
+def open_output(path, append=False, compression='none'):
+    """ Open an output file in binary mode, through the stdlib module of its compression.
+    Compressed files are appended to as new compressed streams, which their readers read as a single one.
+    """
+    mode = 'ab' if append else 'wb'
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, mode)
+    if compression == 'bz2':
+        if append and sys.version_info[0] == 2:
+            # BZ2File of Python 2 has no append mode.
+            raise ValueError('Appending to bz2 files needs Python 3.')
+        import bz2
+        return bz2.BZ2File(path, mode)
+    if compression == 'lzma':
+        # lzma is only in the standard library of Python 3.
+        import lzma
+        return lzma.open(path, mode)
+    if compression != 'none':
+        raise ValueError('Unknown compression %s.' % compression)
+    return open(path, mode)
+
+
+class OutputWriter(object):
+    """ Buffered output file, written by a dedicated thread.
+
+    Attributes:
+      output_file: The file object, only used by the writer thread.
+      flush_size: Number of bytes collected before they are handed to the writer thread.
+      buffer: List of strings collected since the last flush.
+      buffered: Number of characters in buffer.
+      thread: Writer thread, i.e. a pipeline.Stage, or None if strings are written by the caller. An error raised by
+              the writer thread is raised again by the next write() or by close().
+    """
+    def __init__(self, path, append=False, flush_size=FLUSH_SIZE, compression=None, threaded=True, counters=None):
+        """
+        Args:
+          path: The path of output file.
+          append: Append to output file instead of truncating it.
+          flush_size: Number of bytes collected before a write.
+          compression: 'none', 'gzip', 'bz2' or 'lzma'. Default: given by the extension of path (.gz, .bz2, .xz).
+          threaded: Write in a dedicated thread. Otherwise full buffers are written by the caller.
+          counters: List of the counters of the run, which the counter of the writer thread is appended to.
+        """
+        self.output_file = open_output(path, append, get_compression(path, compression))
+        self.flush_size = max(flush_size, 1)
+        self.buffer = []
+        self.buffered = 0
+        self.thread = None
+        if threaded:
+            # The write stage counts output lines.
+            self.thread = Stage('write', self._write, QUEUE_SIZE, lambda text: text.count('\n'), counters)
+
+    def write(self, text):
+        """ Write a string, e.g. all output lines of a batch. """
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """ Hand the collected strings to the writer thread. """
+        if not self.buffer:
+            return
+        text = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        if self.thread is not None:
+            self.thread.put(text)
+        else:
+            self._write(text)
+
+    def close(self):
+        """ Write the collected strings, wait for the writer thread and close the output file. """
+        try:
+            self.flush()
+            if self.thread is not None:
+                thread = self.thread
+                self.thread = None
+                thread.close()
+        finally:
+            self.output_file.close()
+
+    def _write(self, text):
+        self.output_file.write(text if isinstance(text, bytes) else text.encode(OUTPUT_ENCODING))
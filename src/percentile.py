@@ -0,0 +1,89 @@
+"""
+This module is the streaming percentile module.
+
+The percentile given in percentile.txt is fixed for the whole run, so there is no need to search the
+nearest-rank element from scratch after every insertion. The tracker keeps a cursor on the element of the
+nearest rank, which splits the sorted transactions into a lower partition (elements up to the cursor) and an
+upper partition (elements after it). Because an insertion moves the nearest rank by at most one, the cursor
+moves by at most one distinct value per insertion, and the current percentile is read in O(1).
+"""
+
+from math import ceil
+from countedlist import countedlist
+
+
+def nearest_rank(percentile, number):
+    """ Return the index of the given percentile among number sorted samples, using Nearest-Rank Method.
+    percentile_index = ceil((percentage / 100.0) * total_number_of_sample) - 1, clamped into [0, number - 1].
+    """
+    index = int(ceil((percentile / 100.0) * number)) - 1
+    if index < 0:
+        return 0
+    if index >= number:
+        return number - 1
+    return index
+
+
+class percentiletracker(object):
+    """ Keeps the nearest-rank percentile of a growing countedlist.
+
+    Attributes:
+      percentile: (Float) Given percentile to be tracked.
+      transactions: countedlist of transactions. It can be shared with other trackers, in which case only
+                    one of them should append to it and the others should be notified with update().
+      value: The current percentile, i.e. the element at the nearest rank. None while there is no element.
+      below: Number of elements strictly less than value. The lower partition holds the elements in
+             [0, below + value_count) and the cursor sits somewhere among the copies of value.
+      value_count: Number of occurrences of value.
+    """
+    def __init__(self, percentile, transactions=None):
+        self.percentile = percentile
+        self.transactions = transactions if transactions is not None else countedlist()
+        self.value = None
+        self.below = 0
+        self.value_count = 0
+        if len(self.transactions):
+            self._seek()
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def append(self, val):
+        """ Insert a transaction and move the cursor accordingly. """
+        self.transactions.append(val)
+        self.update(val)
+
+    def update(self, val):
+        """ Move the cursor after val has been inserted into the transactions. """
+        if self.value is None:
+            self._seek()
+            return
+
+        if val < self.value:
+            self.below += 1
+        elif val == self.value:
+            self.value_count += 1
+
+        rank = nearest_rank(self.percentile, len(self.transactions))
+        if rank < self.below:
+            # The cursor falls into the lower partition: move it to the previous distinct value.
+            self.value, self.value_count = self.transactions.lower(self.value)
+            self.below -= self.value_count
+        elif rank >= self.below + self.value_count:
+            # The cursor falls into the upper partition: move it to the next distinct value.
+            self.below += self.value_count
+            self.value, self.value_count = self.transactions.higher(self.value)
+
+    def _seek(self):
+        """ Place the cursor with a full rank descent. Only needed when the tracker starts on existing data. """
+        transactions = self.transactions
+        if not len(transactions):
+            return
+        self.value = transactions[nearest_rank(self.percentile, len(transactions))]
+        self.value_count = transactions.count(self.value)
+        # Elements below the value are found by walking the distinct values, which only happens once.
+        self.below = 0
+        for val, count in transactions.items():
+            if val >= self.value:
+                break
+            self.below += count
@@ -0,0 +1,175 @@
+"""
+This module is the pipeline module, used by the multiple threads handler.
+A run is split into stages, each of them running in its own thread:
+   read (BulkReader) -> parse (read_file) -> aggregate (HandlerThread) -> write (OutputWriter)
+Stages pass whole batches to each other, so that queues are locked once per batch instead of once per record. Queues
+are bounded, so a fast stage waits for a slow one instead of piling up batches in memory. A stage is ended by a
+sentinel, after which its thread finishes and is joined, and an error raised in a stage is raised again in the thread
+feeding it.
+
+Each stage counts the batches and records it handles and the time it is busy, which gives its throughput. Counters of
+a run are appended to the list of counters of its RunContext (see run_context), so that they can be reported at the end.
+"""
+
+import sys
+from threading import Thread
+import time
+if sys.version_info[0] == 2:
+    from Queue import Queue
+else:
+    from queue import Queue
+
+# Default number of batches which can wait in the queue of a stage.
+QUEUE_SIZE = 8
+
+# Ends the batches of a queue.
+SENTINEL = None
+
+
+class StageCounter(object):
+    """ Throughput counter of a stage.
+
+    Attributes:
+      name: Name of the stage.
+      batches: Number of batches handled.
+      records: Number of records handled.
+      busy: Seconds spent handling batches, i.e. not waiting for other stages.
+      started: Time the stage was created at.
+      stopped: Time the stage ended at, or None while it runs.
+    """
+    def __init__(self, name, counters=None):
+        """
+        Args:
+          name: Name of the stage.
+          counters: List of the counters of the run, e.g. RunContext.counters, which the counter is appended to.
+        """
+        self.name = name
+        self.batches = 0
+        self.records = 0
+        self.busy = 0.0
+        self.started = time.time()
+        self.stopped = None
+        if counters is not None:
+            counters.append(self)
+
+    def add(self, records, seconds):
+        """ Count a batch of records, handled in seconds. """
+        self.batches += 1
+        self.records += records
+        self.busy += seconds
+
+    def stop(self):
+        if self.stopped is None:
+            self.stopped = time.time()
+
+    def __str__(self):
+        rate = self.records / self.busy if self.busy else 0.0
+        return '%s: %d batches, %d records, %.1f ms busy, %.0f records/s while busy' % (self.name, self.batches, self.records,
+                                                                                        self.busy * 1000, rate)
+
+
+class Stage(Thread):
+    """ Thread calling a function on every batch of its bounded queue, until a sentinel.
+
+    Attributes:
+      queue: Bounded queue of batches.
+      function: Function called on every batch.
+      count: Function giving the number of records of a batch.
+      counter: StageCounter of the stage.
+      error: Exception raised by function, raised again by put() or close(). Batches after an error are skipped.
+    """
+    def __init__(self, name, function, queue_size=QUEUE_SIZE, count=len, counters=None):
+        Thread.__init__(self, name=name)
+        self.queue = Queue(queue_size)
+        self.function = function
+        self.count = count
+        self.counter = StageCounter(name, counters)
+        self.error = None
+        # Stages are always ended by close(). Being a daemon only lets the process exit after an error elsewhere.
+        self.daemon = True
+        self.start()
+
+    def put(self, batch):
+        """ Hand a batch to the stage. It blocks while the queue is full. """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(batch)
+
+    def close(self):
+        """ End the stage after the batches already handed to it, and wait for its thread. """
+        self.queue.put(SENTINEL)
+        self.join()
+        self.counter.stop()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is SENTINEL:
+                break
+            if self.error is not None:
+                continue
+            start_time = time.time()
+            try:
+                self.function(batch)
+            except Exception as error:
+                self.error = error
+                continue
+            self.counter.add(self.count(batch), time.time() - start_time)
+
+
+def prefetch(iterable, name, queue_size=QUEUE_SIZE, count=len, counters=None):
+    """ Iterate an iterable in a producer thread, which runs ahead of the caller by at most queue_size items.
+    Args:
+      iterable: Iterable of batches, e.g. given by BulkReader.iter_line_batches().
+      name: Name of the stage.
+      queue_size: Number of batches which can wait for the caller.
+      count: Function giving the number of records of a batch.
+      counters: List of the counters of the run, which the counter of the stage is appended to.
+    Returns:
+      Iterator of the items of iterable. An error raised by iterable is raised again by the caller.
+    """
+    queue = Queue(queue_size)
+    counter = StageCounter(name, counters)
+    errors = []
+    stopped = []
+
+    def produce():
+        try:
+            start_time = time.time()
+            for item in iterable:
+                counter.add(count(item), time.time() - start_time)
+                queue.put(item)
+                if stopped:
+                    return
+                start_time = time.time()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            queue.put(SENTINEL)
+
+    producer = Thread(target=produce, name=name)
+    producer.daemon = True
+    producer.start()
+    return _consume(queue, producer, counter, errors, stopped)
+
+
+def _consume(queue, producer, counter, errors, stopped):
+    """ Yield the items produced by prefetch(). It is apart from prefetch(), so that the producer starts right away. """
+    try:
+        while True:
+            item = queue.get()
+            if item is SENTINEL:
+                break
+            yield item
+    finally:
+        # If the caller stops early, the producer may be blocked on a full queue: make room until it ends.
+        stopped.append(True)
+        while producer.is_alive():
+            while not queue.empty():
+                queue.get()
+            producer.join(0.01)
+        counter.stop()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,77 @@
+"""
+This module is the quantile sketch module, used by the approximate mode.
+An exact percentiletracker keeps every distinct amount of a contribution, so a contribution which receives many
+different amounts grows without bound. In approximate mode, amounts are rounded onto a logarithmic grid before they
+are inserted, as DDSketch does:
+   bucket(x)         := ceil(log(|x|) / log(gamma)), in which gamma = (1 + relative_error) / (1 - relative_error)
+   representative(x) := sign(x) * 2 * gamma ** bucket(x) / (gamma + 1)
+Every amount in a bucket is within relative_error of the representative of the bucket, and rounding keeps the order of
+amounts, so the nearest-rank percentile of the rounded amounts is within relative_error of the exact one (before both
+are rounded to whole dollars in output lines).
+
+The rounded amounts are kept in the same countedlist, which now holds one entry per bucket, and the cursor of the
+tracker works unchanged. The number of buckets only grows with the logarithm of the range of amounts: with a relative
+error of 1%, amounts from 1 cent to 100 million dollars fit into less than 1200 buckets per sign, whatever the number of
+donations. Two sketches of the same relative error are merged by adding their counts bucket by bucket.
+Totals and numbers of transactions are not affected, since they are kept apart from the trackers.
+"""
+
+from math import ceil, log
+
+from percentile import percentiletracker
+
+# Number of distinct amounts whose representatives are cached by a LogQuantizer.
+CACHE_SIZE = 100000
+
+
+class LogQuantizer(object):
+    """ Rounds amounts to the representatives of their buckets.
+    Most donations share a handful of amounts, so representatives are cached.
+
+    Attributes:
+      relative_error: Bound of the relative error of a representative.
+      gamma: Ratio between the bounds of a bucket.
+      cache: Dictionary of { amount : representative }.
+    """
+    def __init__(self, relative_error):
+        if not 0 < relative_error < 1:
+            raise ValueError('The relative error should be between 0 and 1.')
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = log(self.gamma)
+        self.cache = {}
+
+    def __call__(self, value):
+        representative = self.cache.get(value)
+        if representative is None:
+            if value == 0:
+                representative = 0.0
+            else:
+                bucket = int(ceil(log(abs(value)) / self.log_gamma))
+                representative = 2 * self.gamma ** bucket / (self.gamma + 1)
+                if value < 0:
+                    representative = -representative
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            self.cache[value] = representative
+        return representative
+
+
+class approximatetracker(percentiletracker):
+    """ percentiletracker over amounts rounded by a LogQuantizer.
+
+    Attributes:
+      quantizer: LogQuantizer, shared by every tracker of a run.
+      last: The rounded amount inserted last, which other trackers sharing the countedlist are updated with.
+    """
+    def __init__(self, percentile, quantizer, transactions=None):
+        self.quantizer = quantizer
+        self.last = None
+        percentiletracker.__init__(self, percentile, transactions)
+
+    def append(self, val):
+        """ Insert a transaction, rounded to the representative of its bucket, and move the cursor accordingly. """
+        val = self.last = self.quantizer(val)
+        self.transactions.append(val)
+        self.update(val)
+
@@ -0,0 +1,25 @@
+"""
+This module is the run context module.
+A run of a handler has settings worked out from the user arguments (e.g. the query of output lines) and counters which
+the modules of the run fill while it runs (e.g. the counters of pipeline stages). They are kept in a RunContext, which
+is given to these modules, so that the object of user arguments only holds what the user gave, and no module keeps
+the state of a run in globals. Every run has its own RunContext, e.g. each handler of both mode.
+"""
+
+
+class RunContext(object):
+    """ Settings and counters of one run of a handler.
+
+    Attributes:
+      query: GroupQuery of extra percentiles and statistics, or None if output lines are the default ones.
+      append_output: Append to output file instead of truncating it, e.g. once a checkpoint is loaded.
+      pipelined: Read input blocks in a stage of their own, for handlers running a pipeline (see PIPELINED).
+      run_stats: RunStats following the run, or None if it is not instrumented.
+      counters: List of pipeline.StageCounters of the run, in order of creation.
+    """
+    def __init__(self, query=None):
+        self.query = query
+        self.append_output = False
+        self.pipelined = False
+        self.run_stats = None
+        self.counters = []
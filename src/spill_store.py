@@ -0,0 +1,228 @@
+"""
+This module is the spill store module, used when the state of a handler does not fit into memory.
+donation_date and contribution_info grow with the input, without bound. In spill mode,
+each of them only keeps its most recently used entries in memory, in an LRU cache. When a cache is full, its least
+recently used entries are evicted into an on-disk SQLite database, from which they are loaded back when they are used
+again. Hot donors and contributions stay in memory, cold ones cost a lookup in the database.
+Most records are given by first-time donors, which are in neither of them. Each cache has a Bloom filter of the keys
+it has evicted, so that a key which was never evicted is known to be new without a lookup in the database.
+"""
+
+from array import array
+from collections import OrderedDict
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+
+from countedlist import countedlist
+from percentile import percentiletracker
+
+# Estimated memory used by an entry of each cache, in bytes, including the cache itself.
+DONOR_ENTRY_SIZE = 250
+CONTRIBUTION_ENTRY_SIZE = 2500
+
+# Share of the memory budget given to each cache, and to each Bloom filter of evicted keys.
+DONOR_SHARE = 0.4
+CONTRIBUTION_SHARE = 0.4
+FILTER_SHARE = 0.1
+
+# Multiplier hashing keys into Bloom filters (Fibonacci hashing), and mask of 64-bit hashes.
+FILTER_MULTIPLIER = 0x9E3779B97F4A7C15
+HASH_MASK = (1 << 64) - 1
+
+# Fraction of a cache which is evicted at once when it is full, so that writes to the database are batched.
+EVICTION_FRACTION = 8
+
+# Header of a serialized contribution: total amount and number of distinct amounts.
+CONTRIBUTION_HEADER = struct.Struct('<dq')
+
+
+def dump_contribution(contribution):
+    """ Serialize a contribution of contribution_info into bytes.
+    The databases are scratch files of a single run, so arrays are written in the native byte order.
+    """
+    transactions = contribution["transactions"].transactions
+    values = array('d')
+    counts = array('l')
+    for block_values, block_counts in zip(transactions.values, transactions.counts):
+        values.extend(block_values)
+        counts.extend(block_counts)
+    data = CONTRIBUTION_HEADER.pack(contribution["total_amt"], len(values)) + _to_bytes(values) + _to_bytes(counts)
+    return sqlite3.Binary(data)
+
+
+def load_contribution(data, percentile):
+    """ Deserialize a contribution of contribution_info given by dump_contribution(). """
+    data = bytes(data)
+    total_amt, distinct = CONTRIBUTION_HEADER.unpack(data[:CONTRIBUTION_HEADER.size])
+    start = CONTRIBUTION_HEADER.size
+    values = _from_bytes('d', data[start:start + distinct * 8])
+    counts = _from_bytes('l', data[start + distinct * 8:])
+    transactions = countedlist.fromitems(values, counts)
+    return {"total_amt": total_amt, "transactions": percentiletracker(percentile, transactions)}
+
+
+def _to_bytes(items):
+    return items.tostring() if bytes is str else items.tobytes()
+
+
+def _from_bytes(typecode, data):
+    items = array(typecode)
+    if bytes is str:
+        items.fromstring(data)
+    else:
+        items.frombytes(data)
+    return items
+
+
+def sql_key(key):
+    """ Return a key as it is stored in the database.
+    Packed integer keys may not fit into 64-bit SQLite integers, so they are stored as hexadecimal strings.
+    """
+    return '%x' % key
+
+
+class SpilledDict(object):
+    """ Dictionary keeping its most recently used entries in memory and the others in an SQLite database.
+    It supports what handlers use: in, [], get(), assignment and items(). Values can not be None.
+    Each SpilledDict has its own database file, so that it can be used by another thread than the one which created it.
+
+    Attributes:
+      capacity: Maximum number of entries kept in memory.
+      cache: OrderedDict of entries in memory, from the least to the most recently used.
+      connection: Connection to the database.
+      dump: Function serializing a value for the database. Default: values are stored as they are.
+      load: Function deserializing a value from the database.
+      filter: bytearray of the Bloom filter of evicted keys. The database is only searched for the keys it may hold.
+      filter_bits: Number of bits of the Bloom filter.
+    """
+    def __init__(self, capacity, path, dump=None, load=None, filter_size=1024 * 1024):
+        """
+        Args:
+          capacity: Maximum number of entries kept in memory.
+          path: The path of database file.
+          dump, load: Functions serializing and deserializing values.
+          filter_size: Size of the Bloom filter of evicted keys, in bytes. 1 MB keeps false positives under 5% up to
+                       about a million evicted keys.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.cache = OrderedDict()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        # The database is a scratch file, removed at the end of the run. It does not need to survive a crash.
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('CREATE TABLE entries (key PRIMARY KEY, value)')
+        self.dump = dump
+        self.load = load
+        self.filter = bytearray(max(int(filter_size), 1))
+        self.filter_bits = len(self.filter) * 8
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self.cache.get(key)
+        if value is not None:
+            self._touch(key)
+            return value
+        # Keys which were never evicted are not in the database.
+        hashed = (key * FILTER_MULTIPLIER) & HASH_MASK
+        low = hashed % self.filter_bits
+        high = (hashed >> 32) % self.filter_bits
+        if not (self.filter[low >> 3] & (1 << (low & 7)) and self.filter[high >> 3] & (1 << (high & 7))):
+            return default
+        row = self.connection.execute('SELECT value FROM entries WHERE key = ?', (sql_key(key),)).fetchone()
+        if row is None:
+            return default
+        # The entry is loaded back into the cache. Its row is left in the database and replaced when it is evicted again.
+        value = self.load(row[0]) if self.load is not None else row[0]
+        self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.cache:
+            self.cache[key] = value
+            self._touch(key)
+            return
+        self.cache[key] = value
+        if len(self.cache) > self.capacity:
+            self._evict(max(self.capacity // EVICTION_FRACTION, 1))
+
+    def update(self, entries):
+        for key, value in entries.items():
+            self[key] = value
+
+    def items(self):
+        """ Iterate all entries, e.g. to save them into a checkpoint. Entries in memory are written into the database first. """
+        self._evict(len(self.cache))
+        for key, value in self.connection.execute('SELECT key, value FROM entries'):
+            yield int(key, 16), (self.load(value) if self.load is not None else value)
+
+    def close(self):
+        self.cache.clear()
+        self.connection.close()
+
+    def _touch(self, key):
+        """ Mark an entry in memory as the most recently used one. """
+        if hasattr(self.cache, 'move_to_end'):
+            self.cache.move_to_end(key)
+        else:
+            self.cache[key] = self.cache.pop(key)
+
+    def _evict(self, count):
+        """ Write the count least recently used entries into the database, in one statement. """
+        rows = []
+        bloom = self.filter
+        bits = self.filter_bits
+        for _ in range(min(count, len(self.cache))):
+            key, value = self.cache.popitem(last=False)
+            rows.append((sql_key(key), self.dump(value) if self.dump is not None else value))
+            hashed = (key * FILTER_MULTIPLIER) & HASH_MASK
+            for position in (hashed % bits, (hashed >> 32) % bits):
+                bloom[position >> 3] |= 1 << (position & 7)
+        if rows:
+            # The connection is in autocommit mode, so rows are written in one explicit transaction, not one each.
+            self.connection.execute('BEGIN')
+            self.connection.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?)', rows)
+            self.connection.execute('COMMIT')
+
+
+class SpillStore(object):
+    """ State of a handler which fits into a memory budget.
+    donation_date and contribution_info are given to handlers by set_state().
+
+    Attributes:
+      directory: Temporary directory of the databases, removed by close().
+      donation_date: SpilledDict of { donor key : year }.
+      contribution_info: SpilledDict of { contribution key : { "total_amt" : float, "transactions" : percentiletracker } }.
+    """
+    def __init__(self, memory_budget, percentile, spill_dir=None):
+        """
+        Args:
+          memory_budget: (Float) Memory given to the caches, in MB.
+          percentile: (Float) Given percentile, which the trackers of contributions are built for.
+          spill_dir: Directory in which the databases are created. Default: the system temporary directory.
+        """
+        budget = memory_budget * 1024 * 1024
+        self.directory = tempfile.mkdtemp(prefix='donation_analytics_', dir=spill_dir)
+        self.donation_date = SpilledDict(budget * DONOR_SHARE / DONOR_ENTRY_SIZE,
+                                         os.path.join(self.directory, 'donors.db'),
+                                         filter_size=budget * FILTER_SHARE)
+        self.contribution_info = SpilledDict(budget * CONTRIBUTION_SHARE / CONTRIBUTION_ENTRY_SIZE,
+                                             os.path.join(self.directory, 'contributions.db'),
+                                             dump=dump_contribution,
+                                             load=lambda data: load_contribution(data, percentile),
+                                             filter_size=budget * FILTER_SHARE)
+
+    def close(self):
+        for table in (self.donation_date, self.contribution_info):
+            table.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
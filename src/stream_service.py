@@ -0,0 +1,207 @@
+"""
+This module is the stream service module, which runs an Engine as a long-running service (Python 3).
+Instead of walking a finite input file, the service reads pipe-delimited records as they arrive, from standard input
+or from the clients of a local TCP or Unix socket, and streams output lines back as soon as their batch is handled:
+to standard output for standard input, and to the client itself for sockets.
+
+Records are batched to amortize parsing and handling, with two limits:
+1) Size: a batch is handled as soon as it holds batch_size lines.
+2) Latency: a batch is handled at most linger seconds after its first line has arrived, however small it is.
+Batches are parsed and handled in the event loop, one at a time, so all clients update the same state of donors and
+contributions in the order their batches are handled. Reading and writing sockets never blocks the event loop. Standard
+input is read by a thread, which feeds the event loop.
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+
+from distilled_data import DistilledBatch
+
+# Number of bytes read from a client at once.
+READ_SIZE = 64 * 1024
+
+# Default number of seconds a batch waits for more lines.
+LINGER = 0.01
+
+
+def parse_address(address):
+    """ Parse the address of --listen.
+    Returns:
+      ('stdin', None), ('tcp', (host, port)) or ('unix', path).
+    """
+    if address == '-':
+        return 'stdin', None
+    if address.startswith('tcp:'):
+        host, _, port = address[4:].rpartition(':')
+        return 'tcp', (host or 'localhost', int(port))
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    raise ValueError('Unknown address %s. Addresses are: -, tcp:HOST:PORT or unix:PATH.' % address)
+
+
+class StreamService(object):
+    """ Handles batches of records from any number of feeds, against one shared state.
+
+    Attributes:
+      engine: Engine holding the state of donors and contributions.
+      parse_lines: Parser of lines, e.g. donation_analytics.parse_lines_fast().
+      key_encoder: KeyEncoder shared by all batches.
+      batch_size: Maximum number of lines of a batch.
+      linger: Maximum number of seconds a batch waits for more lines.
+      offset: Number of bytes received so far, which gives offsets to records.
+      records: Number of valid records handled so far.
+    """
+    def __init__(self, engine, parse_lines, key_encoder, batch_size=4096, linger=LINGER):
+        self.engine = engine
+        self.parse_lines = parse_lines
+        self.key_encoder = key_encoder
+        self.batch_size = max(batch_size, 1)
+        self.linger = linger
+        self.offset = 0
+        self.records = 0
+
+    def handle_lines(self, lines):
+        """ Parse and handle a batch of lines, i.e. bytes without line terminator. Return its output lines as bytes. """
+        batch = DistilledBatch(self.key_encoder)
+        self.offset = self.parse_lines(self.offset, lines, batch)
+        if not len(batch):
+            return b''
+        self.records += len(batch)
+        return ''.join(self.engine.process(batch)).encode('utf-8')
+
+    async def serve(self, reader, writer):
+        """ Handle the lines of a feed until its end, writing output lines back after every batch.
+        Args:
+          reader: asyncio.StreamReader of the feed.
+          writer: asyncio.StreamWriter, or any object with write(), drain() and close().
+        """
+        loop = asyncio.get_event_loop()
+        pending = b''  # Partial last line.
+        lines = []
+        deadline = None
+        try:
+            while True:
+                if lines:
+                    timeout = deadline - loop.time()
+                    try:
+                        data = await asyncio.wait_for(reader.read(READ_SIZE), max(timeout, 0))
+                    except asyncio.TimeoutError:
+                        data = None
+                else:
+                    data = await reader.read(READ_SIZE)
+
+                if data:
+                    data = pending + data
+                    cut = data.rfind(b'\n')
+                    if cut >= 0:
+                        if not lines:
+                            deadline = loop.time() + self.linger
+                        lines.extend(data[:cut].split(b'\n'))
+                        pending = data[cut + 1:]
+                    else:
+                        pending = data
+                elif data is not None:
+                    # End of feed. The last line may have no line terminator.
+                    if pending:
+                        lines.append(pending)
+                    if lines:
+                        await self._flush(lines, writer)
+                    break
+
+                # Full batches are handled right away, and a smaller one once it has lingered long enough.
+                while len(lines) >= self.batch_size:
+                    await self._flush(lines[:self.batch_size], writer)
+                    lines = lines[self.batch_size:]
+                    deadline = loop.time() + self.linger
+                if lines and (data is None or loop.time() >= deadline):
+                    await self._flush(lines, writer)
+                    lines = []
+        finally:
+            writer.close()
+
+    async def _flush(self, lines, writer):
+        output = self.handle_lines(lines)
+        if output:
+            writer.write(output)
+            await writer.drain()
+
+
+class StdoutWriter(object):
+    """ Writer of output lines into standard output, with the methods of asyncio.StreamWriter used by serve(). """
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def write(self, data):
+        self.output_file.write(data)
+        self.output_file.flush()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.output_file.flush()
+
+
+def feed_stdin(loop, reader, input_file):
+    """ Read standard input in a thread and feed it to a StreamReader, so that the event loop never waits for it. """
+    def read():
+        try:
+            while True:
+                data = input_file.read1(READ_SIZE) if hasattr(input_file, 'read1') else input_file.read(READ_SIZE)
+                if not data:
+                    break
+                loop.call_soon_threadsafe(reader.feed_data, data)
+        finally:
+            loop.call_soon_threadsafe(reader.feed_eof)
+    thread = threading.Thread(target=read, name='stdin')
+    thread.daemon = True
+    thread.start()
+
+
+async def _run(service, address):
+    kind, location = parse_address(address)
+    loop = asyncio.get_event_loop()
+    if kind == 'stdin':
+        reader = asyncio.StreamReader()
+        feed_stdin(loop, reader, sys.stdin.buffer)
+        await service.serve(reader, StdoutWriter(sys.stdout.buffer))
+        return
+
+    if kind == 'tcp':
+        server = await asyncio.start_server(service.serve, location[0], location[1])
+    else:
+        server = await asyncio.start_unix_server(service.serve, location)
+    stopped = loop.create_future()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, lambda: stopped.done() or stopped.set_result(None))
+    sys.stderr.write('Listening on %s.\n' % address)
+    try:
+        await stopped
+    finally:
+        server.close()
+        await server.wait_closed()
+        if kind == 'unix' and os.path.exists(location):
+            os.remove(location)
+
+
+def run(usrargs, engine, parse_lines, key_encoder):
+    """ Run the service until the end of standard input, or until SIGINT or SIGTERM for sockets.
+    Args:
+      usrargs: (Object) object of user defined arguments, giving listen_address, batch_size and linger.
+      engine: Engine holding the state of donors and contributions.
+      parse_lines: Parser of lines, e.g. donation_analytics.parse_lines_fast().
+      key_encoder: KeyEncoder shared by all batches.
+    Returns:
+      The StreamService, e.g. to read its counters.
+    """
+    service = StreamService(engine, parse_lines, key_encoder, getattr(usrargs, 'batch_size', 4096), getattr(usrargs, 'linger', LINGER))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_run(service, usrargs.listen_address))
+    finally:
+        loop.close()
+    return service
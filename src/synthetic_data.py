@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+
+"""This is the synthetic data module.
+It writes a reproducible itcont.txt in the format of the FEC individual contributions file, e.g. for benchmark.py.
+Lines are generated one block at a time, so inputs of 10^8 lines can be written without keeping them in memory.
+
+Records are drawn as follows:
+1) Each record is given by a new donor, or with probability repeat_ratio by a donor who has already given. Once all
+   donors have given, every record is a repeated one. Name and zipcode of a donor are computed from its number, so
+   donors do not need to be kept. Donors are spread over all zipcodes, or over a given number of them, which makes
+   few but large contributions.
+2) Each donor has a year of first donation. Repeated records are in the same year or a later one, so that they make
+   the donor a repeat donor as soon as the year is later.
+3) Recipients are drawn with a power law: committee i is drawn with a probability decreasing with i, the faster the
+   larger committee_skew is. committee_skew = 1 draws them uniformly.
+4) With probability invalid_rate, one field of a record is made invalid, so that the record has to be ignored.
+"""
+
+import argparse
+import random
+
+# Years of donations.
+YEARS = (2014, 2015, 2016, 2017, 2018)
+
+# Amounts most donations share. Other ones are drawn uniformly.
+COMMON_AMOUNTS = ('5', '10', '25', '40', '50', '100', '250', '500', '1000', '2700')
+
+LAST_NAMES = ('SMITH', 'JOHNSON', 'WILLIAMS', 'BROWN', 'JONES', 'GARCIA', 'MILLER', 'DAVIS', 'RODRIGUEZ', 'MARTINEZ',
+              'HERNANDEZ', 'LOPEZ', 'GONZALEZ', 'WILSON', 'ANDERSON', 'THOMAS', 'TAYLOR', 'MOORE', 'JACKSON', 'MARTIN')
+FIRST_NAMES = ('JAMES', 'MARY', 'JOHN', 'PATRICIA', 'ROBERT', 'JENNIFER', 'MICHAEL', 'LINDA', 'WILLIAM', 'ELIZABETH',
+               'DAVID', 'BARBARA', 'RICHARD', 'SUSAN', 'JOSEPH', 'JESSICA', 'THOMAS', 'SARAH', 'CHARLES', 'KAREN')
+
+# Ways to make a record invalid, drawn uniformly.
+INVALID_FIELDS = ('other_id', 'cmte_id', 'name', 'date', 'amount', 'zipcode')
+
+# Number of lines written at once.
+BLOCK_LINES = 10000
+
+
+def get_args():
+    """ Parse user auguments from command line. """
+
+    usage_desc = """ Used for generating a synthetic input file of political contributions. """
+    parser = argparse.ArgumentParser(description=usage_desc)
+
+    parser.add_argument('-o', '--output', type = str, action = 'store', dest = 'output_path', default = 'itcont.txt', help = "Path of the input file to write.")
+    parser.add_argument('-n', '--rows', type = int, action = 'store', dest = 'rows', default = 100000, help = "Number of lines.")
+    parser.add_argument('--donors', type = int, action = 'store', dest = 'donors', default = None, help = "Number of distinct donors. Default: a tenth of the lines.")
+    parser.add_argument('--repeat-ratio', type = float, action = 'store', dest = 'repeat_ratio', default = 0.5, help = "Probability that a record is given by a donor who has already given.")
+    parser.add_argument('--committees', type = int, action = 'store', dest = 'committees', default = 100, help = "Number of recipients.")
+    parser.add_argument('--committee-skew', type = float, action = 'store', dest = 'committee_skew', default = 2.0, help = "Skew of recipients. 1 draws them uniformly, larger values favor the first ones.")
+    parser.add_argument('--invalid-rate', type = float, action = 'store', dest = 'invalid_rate', default = 0.05, help = "Probability that a record has an invalid field.")
+    parser.add_argument('--zipcodes', type = int, action = 'store', dest = 'zipcodes', default = None, help = "Number of distinct zipcodes. Default: donors are spread over all of them.")
+    parser.add_argument('--seed', type = int, action = 'store', dest = 'seed', default = 1, help = "Seed of the random generator. The same arguments and seed give the same file.")
+
+    return parser.parse_args()
+
+def donor_name(donor):
+    """ Return the name of donor number donor. """
+    return '%s, %s %d' % (LAST_NAMES[donor % len(LAST_NAMES)], FIRST_NAMES[(donor // len(LAST_NAMES)) % len(FIRST_NAMES)], donor)
+
+def donor_zipcode(donor, zipcodes=None):
+    """ Return the 9-digit zipcode of donor number donor. Donors are spread over all 5-digit zipcodes, or over the first
+    ones of a shuffled list of them.
+    """
+    zipcode = donor if zipcodes is None else donor % zipcodes
+    return '%05d%04d' % ((zipcode * 2654435761) % 100000, donor % 10000)
+
+def donor_first_year(donor):
+    """ Return the year of the first donation of donor number donor. """
+    return YEARS[(donor * 40503) % len(YEARS)]
+
+def generate(output_file, rows, donors=None, repeat_ratio=0.5, committees=100, committee_skew=2.0, invalid_rate=0.05, seed=1,
+             zipcodes=None):
+    """ Write synthetic lines of input data.
+    Args:
+      output_file: File object to write lines to.
+      rows: Number of lines.
+      donors: Number of distinct donors. Default: a tenth of the lines.
+      repeat_ratio: Probability that a record is given by a donor who has already given.
+      committees: Number of recipients.
+      committee_skew: Skew of recipients. 1 draws them uniformly, larger values favor the first ones.
+      invalid_rate: Probability that a record has an invalid field.
+      seed: Seed of the random generator.
+      zipcodes: Number of distinct zipcodes. Default: donors are spread over all of them.
+    Returns:
+      Number of records which have an invalid field.
+    """
+    if donors is None:
+        donors = max(rows // 10, 1)
+    generator = random.Random(seed)
+    draw = generator.random
+    seen = 0
+    invalid = 0
+    lines = []
+    for row in range(rows):
+        # Draw the donor.
+        if seen and (seen >= donors or draw() < repeat_ratio):
+            donor = int(draw() * seen)
+            first_year = donor_first_year(donor)
+            year = first_year + int(draw() * (YEARS[-1] - first_year + 1))
+        else:
+            donor = seen
+            seen += 1
+            year = donor_first_year(donor)
+
+        cmte_id = 'C%08d' % int(committees * draw() ** committee_skew)
+        name = donor_name(donor)
+        zipcode = donor_zipcode(donor, zipcodes)
+        date = '%02d%02d%04d' % (1 + int(draw() * 12), 1 + int(draw() * 28), year)
+        if draw() < 0.7:
+            amount = COMMON_AMOUNTS[int(draw() * len(COMMON_AMOUNTS))]
+        else:
+            amount = '%.2f' % (1 + draw() * 2699)
+        other_id = ''
+
+        if draw() < invalid_rate:
+            invalid += 1
+            field = INVALID_FIELDS[int(draw() * len(INVALID_FIELDS))]
+            if field == 'other_id':
+                other_id = 'C%08d' % int(draw() * committees)
+            elif field == 'cmte_id':
+                cmte_id = ''
+            elif field == 'name':
+                name = ''
+            elif field == 'date':
+                date = ('13%02d%04d' % (1 + int(draw() * 28), year), '0230%04d' % year, date[:6], '')[int(draw() * 4)]
+            elif field == 'amount':
+                amount = ('', 'N/A')[int(draw() * 2)]
+            else:
+                zipcode = zipcode[:int(draw() * 5)]
+
+        lines.append('%s|N|M3|P|%018d|15|IND|%s|CITY|ST|%s|EMPLOYER|OCCUPATION|%s|%s|%s|SA11AI.%d|1000000|||%019d\n' %
+                     (cmte_id, row, name, zipcode, date, amount, other_id, row, row))
+        if len(lines) >= BLOCK_LINES:
+            output_file.write(''.join(lines))
+            lines = []
+    output_file.write(''.join(lines))
+    return invalid
+
+if __name__ == '__main__':
+    usr_args = get_args()
+    with open(usr_args.output_path, 'w') as synthetic_file:
+        generate(synthetic_file, usr_args.rows, usr_args.donors, usr_args.repeat_ratio, usr_args.committees,
+                 usr_args.committee_skew, usr_args.invalid_rate, usr_args.seed, usr_args.zipcodes)